@@ -1,172 +1,222 @@
-from exchanges.grvt import get_all_grvt_data
-from exchanges.paradex import get_all_paradex_data
-from typing import Dict, List, Any
+from exchanges.base import ExchangeAdapter
+from exchanges.registry import get_adapters
+from fetcher import get_engine, account_status, data_as_of, data_event_time, fetch_plan, \
+    STATUS_FAILED, STATUS_OK, STATUS_STALE
+from utils.config_loader import get_market_data_config, get_snapshot_config, get_streaming_config, get_stress_config
+from market_data import get_market_cache
+from columnar import PositionTable, TableBuilder, compute_aggregates
+from stress import stress_view
+from utils import metrics
+from typing import Dict, List, Any, Optional
 import datetime
+import time
 
-def safe_float(value, default=0.0):
-    if value is None or value == '' or value == 'N/A':
-        return default
-    try:
-        return float(value)
-    except (ValueError, TypeError):
-        return default
+# 汇总只用到账户概要和持仓，挂单和成交不需要抓取
+SNAPSHOT_PLAN = fetch_plan("summary", "positions")
 
-def aggregate_all_data() -> Dict[str, Any]:
-    grvt_data = get_all_grvt_data()
-    paradex_data = get_all_paradex_data()
-    
-    update_time_beijing = "N/A"
-    
-    total_equity = 0.0
-    total_exposure = 0.0
-    
+def build_position_table(adapters: List[ExchangeAdapter],
+                         fetched: Dict[str, List[Dict[str, Any]]],
+                         markets: Optional[Dict[str, Dict[str, Any]]] = None) -> PositionTable:
+    """
+    把各交易所适配器返回的标准化记录装入一张列式持仓表
+    markets 为 {venue: {symbol: MarketRecord}}，有行情的持仓统一用行情 mark 重算敞口
+    """
+    markets = markets or {}
+    builder = TableBuilder([adapter.name for adapter in adapters])
+    for adapter in adapters:
+        venue_marks = markets.get(adapter.name, {})
+        for acc in fetched.get(adapter.name, []):
+            balance = acc["summary"]
+            account_id = builder.add_account(
+                adapter.name,
+                balance.equity if balance else 0.0,
+                balance.available if balance else 0.0,
+                status=account_status(acc),
+                as_of=data_as_of(acc),
+                event_time=data_event_time(acc),
+                label=f"{adapter.display_name}_Acc{acc['account_index']:02d}",
+                account_index=acc["account_index"],
+                account_key=acc.get("account_key", str(acc["account_index"])),
+            )
+            for pos in acc["positions"]:
+                market = venue_marks.get(pos.symbol)
+                if market is not None and market.mark > 0:
+                    builder.add_position(account_id, pos.instrument, pos.symbol, pos.size, market.mark,
+                                         pos.size * market.mark, pos.liq_price)
+                else:
+                    builder.add_position(account_id, pos.instrument, pos.symbol, pos.size, pos.mark, pos.notional,
+                                         pos.liq_price)
+    return builder.build()
+
+def snapshot_timing(table: PositionTable) -> Dict[str, Any]:
+    """
+    快照的时间一致性：每个账户取其最旧数据集的本地接收时间 (as_of)，
+    oldest / newest 为各账户中的最小 / 最大值，skew 为两者之差（秒），oldest_account 为数据最旧的账户
+    """
+    times = [(meta["as_of"], meta["label"]) for meta in table.account_meta if meta.get("as_of")]
+    if not times:
+        return {"oldest": None, "newest": None, "skew": 0.0, "oldest_account": None}
+    oldest, label = min(times)
+    newest = max(as_of for as_of, _ in times)
+    return {"oldest": oldest, "newest": newest, "skew": newest - oldest, "oldest_account": label}
+
+def _format_time(timestamp: Optional[float]) -> str:
+    """Unix 秒 -> 北京时间字符串"""
+    if timestamp:
+        try:
+            beijing_time = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone(datetime.timedelta(hours=8)))
+            return beijing_time.strftime("%Y-%m-%d %H:%M:%S")
+        except (ValueError, OverflowError, OSError):
+            pass
+    return "N/A"
+
+def build_view(table: PositionTable, aggs: Dict[str, Any], display_names: List[str],
+               update_time: str, timing: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """在列式汇总结果之上构造图片/Bot 使用的展示层 dict，display_names 与 table.venues 一一对应"""
+    account_equity = table.account_equity.tolist()
+    account_available = table.account_available.tolist()
+    account_net = aggs["account_net"].tolist()
+    account_gross = aggs["account_gross"].tolist()
+    net_leverage = aggs["account_net_leverage"].tolist()
+    gross_leverage = aggs["account_gross_leverage"].tolist()
+
+    accounts = []
+    for i in range(table.n_accounts):
+        accounts.append({
+            "Equity": account_equity[i],
+            "Available Balance": account_available[i],
+            "Status": table.account_meta[i]["status"],
+            "As Of": table.account_meta[i].get("as_of"),  # stale 时为 last-good 数据的时间
+            "Event Time": table.account_meta[i].get("event_time"),  # 交易所事件时间，没有则为 None
+            "positions": [],
+            "Net Exposure": account_net[i],
+            "Net Leverage": net_leverage[i],
+            "Gross Exposure": account_gross[i],
+            "Gross Leverage": gross_leverage[i],
+        })
+
+    liq = table.liq_price.round(2).tolist()
+    for account_id, code, size, exposure, liq_price in zip(
+            table.pos_account.tolist(), table.pos_instrument.tolist(),
+            table.size.tolist(), table.notional.tolist(), liq):
+        accounts[account_id]["positions"].append({
+            "Instrument": table.instruments[code],
+            "Size": size,
+            "Exposure": exposure,
+            "Liq.price": liq_price,
+        })
+
+    venue_of = table.account_venue.tolist()
     exchanges = []
-    
-    # GRVT
-    grvt_group = {
-        "exchange_name": "GRVT",
-        "Exchange Equity": 0.0,
-        "Exchange Exposure": 0.0,
-        "Exchange Gross Exposure": 0.0,
-        "accounts": []
-    }
-    
-    for acc in grvt_data:
-        summary = acc["summary"]
-        positions = acc["positions"]
-        
-        equity = 0.0
-        available_balance = 0.0
-        if summary:
-            equity = safe_float(summary.get('total_equity') or summary.get('totalEquity'))
-            available_balance = safe_float(summary.get('available_balance') or summary.get('availableBalance'))
-            total_equity += equity
-            grvt_group["Exchange Equity"] += equity
-            
-            event_time_str = summary.get('event_time')
-            if event_time_str and update_time_beijing == "N/A":
-                try:
-                    event_time_float = float(event_time_str)
-                    event_time_s = event_time_float / 1e9
-                    beijing_time = datetime.datetime.fromtimestamp(event_time_s, tz=datetime.timezone(datetime.timedelta(hours=8)))
-                    update_time_beijing = beijing_time.strftime("%Y-%m-%d %H:%M:%S")
-                except:
-                    pass
-        
-        account_data = {
-            "Equity": equity,
-            "Available Balance": available_balance,
-            "positions": []
-        }
-        
-        net_exposure = 0.0
-        gross_exposure = 0.0
-        for pos in positions:
-            size = safe_float(pos.get("size"))
-            exposure = safe_float(pos.get("notional_value"))
-            liq_price = safe_float(pos.get("est_liquidation_price"))
-            
-            net_exposure += exposure
-            gross_exposure += abs(exposure)
-            
-            instrument = pos.get("instrument", "")
-            if "_" in instrument:
-                instrument = instrument.split("_")[0] + "-PERP"
-            else:
-                instrument = "N/A"
-            
-            account_data["positions"].append({
-                "Instrument": instrument,
-                "Size": size,
-                "Exposure": exposure,
-                "Liq.price": round(liq_price, 2) if liq_price != 0 else 0.0
-            })
-        
-        account_equity = equity if equity > 0 else 1  # 避免除0
-        net_leverage = round(abs(net_exposure) / account_equity, 2)
-        gross_leverage = round(gross_exposure / account_equity, 2)
-        
-        account_data["Net Exposure"] = net_exposure
-        account_data["Net Leverage"] = net_leverage
-        account_data["Gross Exposure"] = gross_exposure
-        account_data["Gross Leverage"] = gross_leverage
-        
-        grvt_group["accounts"].append(account_data)
-        grvt_group["Exchange Exposure"] += net_exposure
-        grvt_group["Exchange Gross Exposure"] += gross_exposure
-        total_exposure += net_exposure
-    
-    exchanges.append(grvt_group)
-    
-    # Paradex
-    paradex_group = {
-        "exchange_name": "Paradex",
-        "Exchange Equity": 0.0,
-        "Exchange Exposure": 0.0,
-        "Exchange Gross Exposure": 0.0,
-        "accounts": []
-    }
-    
-    for acc in paradex_data:
-        summary = acc["summary"]
-        positions = acc["positions"]
-        
-        equity = 0.0
-        available_balance = 0.0
-        if summary:
-            equity = safe_float(summary.get('account_value'))
-            available_balance = safe_float(summary.get('free_collateral'))
-            total_equity += equity
-            paradex_group["Exchange Equity"] += equity
-        
-        account_data = {
-            "Equity": equity,
-            "Available Balance": available_balance,
-            "positions": []
-        }
-        
-        net_exposure = 0.0
-        gross_exposure = 0.0
-        for pos in positions:
-            size = safe_float(pos.get("size"))
-            mark_price = safe_float(pos.get("mark_price"))
-            exposure = size * mark_price
-            liq_price = safe_float(pos.get("liquidation_price"))
-            
-            net_exposure += exposure
-            gross_exposure += abs(exposure)
-            
-            market = pos.get("market", "")
-            instrument = market.split("-")[0] + "-PERP" if "-" in market else "N/A"
-            
-            account_data["positions"].append({
-                "Instrument": instrument,
-                "Size": size,
-                "Exposure": exposure,
-                "Liq.price": round(liq_price, 2) if liq_price != 0 else 0.0
-            })
-        
-        account_equity = equity if equity > 0 else 1
-        net_leverage = round(abs(net_exposure) / account_equity, 2)
-        gross_leverage = round(gross_exposure / account_equity, 2)
-        
-        account_data["Net Exposure"] = net_exposure
-        account_data["Net Leverage"] = net_leverage
-        account_data["Gross Exposure"] = gross_exposure
-        account_data["Gross Leverage"] = gross_leverage
-        
-        paradex_group["accounts"].append(account_data)
-        paradex_group["Exchange Exposure"] += net_exposure
-        paradex_group["Exchange Gross Exposure"] += gross_exposure
-        total_exposure += net_exposure
-    
-    exchanges.append(paradex_group)
-    
-    result = {
-        "update_time": update_time_beijing,
-        "Total Equity": total_equity,
-        "Total Exposure": total_exposure,
-        "exchanges": exchanges
+    for v, display_name in enumerate(display_names):
+        exchanges.append({
+            "exchange_name": display_name,
+            "Exchange Equity": float(aggs["venue_equity"][v]),
+            "Exchange Exposure": float(aggs["venue_net"][v]),
+            "Exchange Gross Exposure": float(aggs["venue_gross"][v]),
+            "accounts": [acc for i, acc in enumerate(accounts) if venue_of[i] == v],
+        })
+
+    statuses = [acc["Status"] for acc in accounts]
+    return {
+        "update_time": update_time,
+        "timing": timing or snapshot_timing(table),
+        "partial": any(status != STATUS_OK for status in statuses),
+        "stale_accounts": statuses.count(STATUS_STALE),
+        "failed_accounts": statuses.count(STATUS_FAILED),
+        "Total Equity": aggs["total_equity"],
+        "Total Exposure": aggs["total_net"],
+        "exchanges": exchanges,
     }
-    
-    return result
+
+class Snapshot:
+    """
+    一次快照：适配器返回的标准化数据 + 列式持仓表 + 向量化汇总结果
+    update_time 为各账户中最旧数据的接收时间（快照保证不早于该时刻），timing 见 snapshot_timing
+    symbols 为 {交易所: {交易所合约名: 统一合约名}}，供按合约查询行情 / 资金费率
+    （以交易所合约名为键：同一交易所可能有多个合约映射到同一个统一合约名，如 USDT / USDC 保证金）
+    """
+
+    __slots__ = ("adapters", "fetched", "markets", "table", "aggs", "taken_at", "timing", "update_time", "symbols")
+
+    def __init__(self, adapters: List[ExchangeAdapter], fetched: Dict[str, List[Dict[str, Any]]],
+                 markets: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.adapters = adapters
+        self.fetched = fetched
+        self.markets = markets or {}
+        self.symbols = {adapter.name: {pos.symbol: pos.instrument for acc in fetched.get(adapter.name, [])
+                                       for pos in acc.get("positions", [])} for adapter in adapters}
+        with metrics.timer("stage", stage="aggregate"):
+            self.table = build_position_table(adapters, fetched, self.markets)
+            self.aggs = compute_aggregates(self.table)
+        self._set_timing()
+        self.taken_at = time.time()
+
+    def _set_timing(self):
+        self.timing = snapshot_timing(self.table)
+        self.update_time = _format_time(self.timing["oldest"])
+        metrics.registry.observe("snapshot_skew", self.timing["skew"])
+
+    @classmethod
+    def from_parts(cls, adapters: List[ExchangeAdapter], table: PositionTable, aggs: Dict[str, Any],
+                   symbols: Optional[Dict[str, Dict[str, str]]] = None) -> "Snapshot":
+        """由已经汇总好的列式表构造快照（分片模式下协调进程合并各 worker 的结果），不保留原始数据"""
+        snapshot = cls.__new__(cls)
+        snapshot.adapters = adapters
+        snapshot.fetched = {}
+        snapshot.markets = {}
+        snapshot.symbols = symbols or {}
+        snapshot.table = table
+        snapshot.aggs = aggs
+        snapshot._set_timing()
+        snapshot.taken_at = time.time()
+        return snapshot
+
+    def view(self) -> Dict[str, Any]:
+        display_names = [adapter.display_name for adapter in self.adapters]
+        with metrics.timer("stage", stage="view"):
+            view = build_view(self.table, self.aggs, display_names, self.update_time, self.timing)
+        if get_stress_config().enabled:
+            with metrics.timer("stage", stage="stress"):
+                view["stress"] = stress_view(self.table)
+        return view
+
+def load_markets(adapters: List[ExchangeAdapter],
+                 fetched: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """每个交易所一次批量行情请求（TTL 内直接命中缓存），所有账户共用同一组 mark price"""
+    if not get_market_data_config().enabled:
+        return {}
+    cache = get_market_cache()
+    markets = {}
+    with metrics.timer("stage", stage="markets"):
+        for adapter in adapters:
+            symbols = {pos.symbol for acc in fetched.get(adapter.name, []) for pos in acc.get("positions", [])}
+            if symbols:
+                markets[adapter.name] = cache.get(adapter, symbols)
+    return markets
+
+def load_snapshot(book=None, adapters: Optional[List[ExchangeAdapter]] = None) -> Snapshot:
+    """
+    book 为 None 时按 SNAPSHOT_PLAN 通过 REST 并发抓取所有交易所；
+    否则直接读取流式模式的内存账户簿 (streaming.AccountBook)，不做网络 I/O
+    snapshot.max_staleness > 0 时只定向抓取数据超过该年龄的账户：REST 模式复用其余账户的上次结果，
+    流式模式对断线过久的账户补抓 REST
+    """
+    adapters = adapters if adapters is not None else get_adapters()
+    max_staleness = get_snapshot_config().max_staleness
+    if book is None:
+        fetched = get_engine().fetch_accounts(
+            {adapter: adapter.load_accounts() for adapter in adapters}, SNAPSHOT_PLAN, max_staleness
+        )
+    else:
+        if max_staleness > 0:
+            book.refresh_stale(adapters, max_staleness)
+        fetched = book.snapshot(get_streaming_config().stale_after)
+    return Snapshot(adapters, fetched, load_markets(adapters, fetched))
+
+def aggregate_all_data() -> Dict[str, Any]:
+    return load_snapshot().view()
+
+def aggregate_from_book(book, adapters: Optional[List[ExchangeAdapter]] = None) -> Dict[str, Any]:
+    """流式模式：直接从内存账户簿汇总"""
+    return load_snapshot(book, adapters).view()
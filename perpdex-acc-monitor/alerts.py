@@ -0,0 +1,192 @@
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+import numpy as np
+from exposure import get_exposure_index
+from utils import metrics
+from utils.config_loader import get_alerts_config, get_hedge_config
+
+# 指标函数返回 (subject keys, 展示名, 对应数值数组)，数值为 nan 表示不适用（视为正常）
+# key 唯一标识一个 subject（告警状态按 key 保存），展示名只用于消息文本和规则的 match 过滤
+MetricResult = Tuple[List[Hashable], List[str], np.ndarray]
+MetricFn = Callable[[Any], MetricResult]
+
+
+def _account_keys(table) -> List[Tuple[str, str]]:
+    return [(table.venues[v], meta["account_key"]) for v, meta in zip(table.account_venue.tolist(), table.account_meta)]
+
+
+def _liq_distance_pct(snapshot) -> MetricResult:
+    """
+    每个持仓距强平价的百分比 |mark - liq| / mark
+    key 为 (交易所, 账户, 交易所合约名)：同一账户多个交易所合约对应同一个统一合约名时各自独立告警
+    """
+    table = snapshot.table
+    accounts = _account_keys(table)
+    labels = [meta["label"] for meta in table.account_meta]
+    positions = list(zip(table.pos_account.tolist(), table.pos_instrument.tolist(), table.pos_symbol.tolist()))
+    keys = [accounts[a] + (table.symbols[s],) for a, _, s in positions]
+    names = [f"{labels[a]} {table.instruments[c]}" for a, c, _ in positions]
+    duplicated = Counter(names)
+    names = [name if duplicated[name] == 1 else f"{labels[a]} {table.symbols[s]}"
+             for name, (a, _, s) in zip(names, positions)]
+    valid = (table.mark > 0) & (table.liq_price > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.where(valid, np.abs(table.mark - table.liq_price) / table.mark * 100, np.nan)
+    return keys, names, values
+
+
+def _account_metric(name: str) -> MetricFn:
+    def metric(snapshot) -> MetricResult:
+        table, aggs = snapshot.table, snapshot.aggs
+        names = [meta["label"] for meta in table.account_meta]
+        equity = table.account_equity
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if name == "available_ratio":
+                values = table.account_available / equity * 100
+            else:
+                values = aggs[f"account_{name}"].astype(np.float64)
+        return _account_keys(table), names, np.where(equity > 0, values, np.nan)
+    return metric
+
+
+def _venue_concentration_pct(snapshot) -> MetricResult:
+    """各交易所总敞口占全部总敞口的百分比"""
+    total = snapshot.aggs["total_gross"]
+    keys = [adapter.name for adapter in snapshot.adapters]
+    names = [adapter.display_name for adapter in snapshot.adapters]
+    if total <= 0:
+        return keys, names, np.full(len(keys), np.nan)
+    return keys, names, snapshot.aggs["venue_gross"] / total * 100
+
+
+def _hedge_drift_pct(snapshot) -> MetricResult:
+    """各标的跨交易所 / 账户的对冲偏离 %，只有多空两侧都有仓位且净敞口达到 min_notional 时才有值"""
+    index = get_exposure_index()
+    index.sync_table(snapshot.table)
+    min_notional = get_hedge_config().min_notional
+    rows = index.summary()
+    keys = [row["underlying"] for row in rows]
+    values = [row["drift_pct"] if row["drift_pct"] is not None and abs(row["net"]) >= min_notional else np.nan
+              for row in rows]
+    return keys, keys, np.asarray(values, dtype=np.float64)
+
+
+# 指标名 -> (计算函数, 方向, 中文描述, 单位)；方向 below 表示数值低于 trigger 时告警
+METRICS: Dict[str, Tuple[MetricFn, str, str, str]] = {
+    "liq_distance_pct": (_liq_distance_pct, "below", "距强平", "%"),
+    "gross_leverage": (_account_metric("gross_leverage"), "above", "总杠杆", "x"),
+    "net_leverage": (_account_metric("net_leverage"), "above", "净杠杆", "x"),
+    "available_ratio": (_account_metric("available_ratio"), "below", "可用余额/权益", "%"),
+    "venue_concentration": (_venue_concentration_pct, "above", "交易所集中度", "%"),
+    "hedge_drift_pct": (_hedge_drift_pct, "above", "对冲偏离", "%"),
+}
+
+
+class AlertRule(NamedTuple):
+    metric: str
+    trigger: float          # 越过该阈值进入告警
+    clear: float            # 回到该阈值另一侧才解除（滞回）
+    match: str = ""         # 只对展示名包含该字符串的对象生效，空为全部
+
+
+class _RuleState:
+    """
+    一条规则下所有 subject 的状态，按槽位存放在预分配数组中
+    新 subject 出现时才按倍数扩容，每次评估不重新分配状态
+    """
+
+    __slots__ = ("slots", "active", "last_sent", "seen")
+
+    def __init__(self, capacity: int = 64):
+        self.slots: Dict[Hashable, int] = {}
+        self.active = np.zeros(capacity, dtype=bool)
+        self.last_sent = np.zeros(capacity, dtype=np.float64)
+        self.seen = np.zeros(capacity, dtype=bool)
+
+    def lookup(self, keys: List[Hashable]) -> np.ndarray:
+        slots = self.slots
+        for key in keys:
+            if key not in slots:
+                slots[key] = len(slots)
+        if len(slots) > len(self.active):
+            old = len(self.active)
+            capacity = max(len(slots), old * 2)
+            # 新槽位一律从零开始（np.resize 会循环复制旧值，导致新 subject 继承别人的告警状态）
+            active = np.zeros(capacity, dtype=bool)
+            last_sent = np.zeros(capacity, dtype=np.float64)
+            active[:old] = self.active
+            last_sent[:old] = self.last_sent
+            self.active, self.last_sent = active, last_sent
+            self.seen = np.zeros(capacity, dtype=bool)
+        return np.fromiter((slots[key] for key in keys), dtype=np.int64, count=len(keys))
+
+
+class AlertEngine:
+    """
+    持续评估风控规则，带滞回与去重：
+    - 进入告警时发送一次，持续告警每 repeat_after 秒重复提醒一次
+    - 回到 clear 阈值另一侧时发送恢复通知
+    - 已消失的 subject（如已平仓）静默复位
+    """
+
+    def __init__(self, rules: Optional[List[AlertRule]] = None, repeat_after: Optional[float] = None):
+        config = get_alerts_config()
+        if rules is None:
+            rules = [AlertRule(**rule) for rule in config.rules]
+        for rule in rules:
+            if rule.metric not in METRICS:
+                raise ValueError(f"未知的告警指标: {rule.metric}，可选: {list(METRICS)}")
+        self.rules = rules
+        self.repeat_after = repeat_after if repeat_after is not None else config.repeat_after
+        self._states = [_RuleState() for _ in rules]
+
+    @metrics.timed("stage", stage="alerts")
+    def evaluate(self, snapshot, now: Optional[float] = None) -> List[str]:
+        """评估一个快照 (aggregator.Snapshot)，返回需要发送的告警文本"""
+        now = now if now is not None else time.time()
+        messages = []
+        metric_cache: Dict[str, MetricResult] = {}
+
+        for rule, state in zip(self.rules, self._states):
+            fn, direction, title, unit = METRICS[rule.metric]
+            if rule.metric not in metric_cache:
+                metric_cache[rule.metric] = fn(snapshot)
+            keys, names, values = metric_cache[rule.metric]
+            if rule.match:
+                selected = [i for i, name in enumerate(names) if rule.match in name]
+                keys = [keys[i] for i in selected]
+                names = [names[i] for i in selected]
+                values = values[np.asarray(selected, dtype=np.int64)]
+
+            slots = state.lookup(keys)
+            state.seen[:] = False
+            state.seen[slots] = True
+            state.active &= state.seen  # 已消失的 subject 复位
+
+            if direction == "above":
+                breach = values > rule.trigger
+                cleared = ~(values > rule.clear)  # nan 视为已恢复
+            else:
+                breach = values < rule.trigger
+                cleared = ~(values < rule.clear)
+
+            active = state.active[slots]
+            fire = breach & (~active | (now - state.last_sent[slots] >= self.repeat_after))
+            recover = active & cleared
+            if fire.any():
+                metrics.inc("alerts_fired", int(fire.sum()), metric=rule.metric)
+
+            for i in np.flatnonzero(fire).tolist():
+                repeat = "（持续）" if active[i] else ""
+                messages.append(f"⚠️ {names[i]} {title} {values[i]:.2f}{unit}{repeat}"
+                                f"（阈值 {rule.trigger:g}{unit}）")
+            for i in np.flatnonzero(recover).tolist():
+                value = "" if np.isnan(values[i]) else f" {values[i]:.2f}{unit}"
+                messages.append(f"✅ {names[i]} {title} 已恢复{value}")
+
+            state.active[slots[fire]] = True
+            state.last_sent[slots[fire]] = now
+            state.active[slots[recover]] = False
+
+        return messages
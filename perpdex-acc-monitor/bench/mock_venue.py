@@ -0,0 +1,278 @@
+"""
+本地模拟 GRVT / Paradex 的 HTTP 服务，用于压测和离线调试（不需要真实凭证）
+响应以 bench/fixtures 下录制的 JSON 为模板，按账户生成确定性的不同数值
+"""
+import copy
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+from utils.config_loader import get_exchange_config
+from utils.http_session import POOL_MAXSIZE, get_session
+from utils.resilience import ResilientAdapter, TokenBucket
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+UNDERLYINGS = ["BTC", "ETH", "SOL", "HYPE", "DOGE", "XRP", "AVAX", "LINK"]
+BASE_MARKS = {"BTC": 61250.0, "ETH": 2450.0, "SOL": 142.8, "HYPE": 38.6,
+              "DOGE": 0.162, "XRP": 0.58, "AVAX": 27.4, "LINK": 13.9}
+
+
+def load_fixture(name: str) -> Any:
+    with open(os.path.join(FIXTURE_DIR, f"{name}.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _rng(key: str) -> random.Random:
+    """同一账户每次返回相同的数值，便于前后两次压测对比"""
+    return random.Random(int(hashlib.sha1(key.encode()).hexdigest()[:12], 16))
+
+
+class VenueProfile:
+    """模拟服务的行为参数：延迟（毫秒，正态抖动）、错误率（返回 503）、每个账户的持仓数"""
+
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 5.0, error_rate: float = 0.0,
+                 positions_per_account: int = 3):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.positions_per_account = positions_per_account
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        return max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+
+    def count(self, failed: bool):
+        with self._lock:
+            self.requests += 1
+            self.errors += failed
+
+
+class MockVenueHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive，与真实交易所一致
+    disable_nagle_algorithm = True  # 头和 body 分两次写出，否则会撞上客户端的延迟 ACK（每个请求多 40ms）
+    profile: VenueProfile = VenueProfile()
+    fixtures: Dict[str, Any] = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---- 通用 ----
+
+    def _reply(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _simulate(self) -> bool:
+        """模拟网络延迟和随机故障，返回 False 表示本次请求已按故障处理"""
+        time.sleep(self.profile.delay())
+        failed = random.random() < self.profile.error_rate
+        self.profile.count(failed)
+        if failed:
+            self._reply(503, {"error": "service unavailable (mock)"})
+        return not failed
+
+    def _positions(self, key: str, symbol_format: str) -> List[Tuple[str, float, float]]:
+        """(合约, 数量, mark) 列表，合约名按交易所格式生成"""
+        rng = _rng(key)
+        n = self.profile.positions_per_account
+        picked = rng.sample(UNDERLYINGS, min(n, len(UNDERLYINGS)))
+        result = []
+        for underlying in picked:
+            mark = BASE_MARKS[underlying]
+            size = round(rng.uniform(-1, 1) * 20000 / mark, 4) or 1.0
+            result.append((symbol_format.format(underlying), size, mark))
+        return result
+
+    # ---- GRVT ----
+
+    def _grvt(self, path: str):
+        body = self._body()
+        if path.endswith("/auth/api_key/login"):
+            api_key = body.get("api_key", "")
+            return self._reply(200, self.fixtures["grvt_login"], {
+                "Set-Cookie": f"gravity=mock-{api_key}; Path=/",
+                "X-Grvt-Account-Id": f"acct-{api_key}",
+            })
+        if not self.headers.get("Cookie", "").startswith("gravity=") and not path.endswith(("/ticker", "/funding")):
+            return self._reply(401, {"error": "unauthorized"})
+
+        endpoint = path.rsplit("/", 1)[-1]
+        sub_account_id = str(body.get("sub_account_id", ""))
+        if endpoint == "account_summary":
+            data = copy.deepcopy(self.fixtures["grvt_account_summary"])
+            rng = _rng(f"grvt:{sub_account_id}")
+            equity = rng.uniform(5_000, 200_000)
+            data["result"].update({
+                "sub_account_id": sub_account_id,
+                "total_equity": f"{equity:.2f}",
+                "available_balance": f"{equity * rng.uniform(0.3, 0.9):.2f}",
+                "event_time": str(time.time_ns()),
+            })
+            return self._reply(200, data)
+        if endpoint == "positions":
+            template = self.fixtures["grvt_positions"]["result"][0]
+            rows = []
+            for symbol, size, mark in self._positions(f"grvt:{sub_account_id}", "{}_USDT_Perp"):
+                row = dict(template, instrument=symbol, size=str(size), mark_price=str(mark),
+                           notional=str(round(size * mark, 2)), sub_account_id=sub_account_id,
+                           est_liquidation_price=str(round(mark * (0.7 if size > 0 else 1.3), 4)))
+                rows.append(row)
+            return self._reply(200, {"result": rows})
+        if endpoint == "ticker":
+            symbol = body.get("instrument", "")
+            data = copy.deepcopy(self.fixtures["grvt_ticker"])
+            data["result"].update({"instrument": symbol, "event_time": str(time.time_ns()),
+                                   "mark_price": str(BASE_MARKS.get(symbol.split("_")[0], 1.0))})
+            return self._reply(200, data)
+        if endpoint == "funding":
+            # 每 8 小时一次结算，funding_rate 为百分比
+            symbol = body.get("instrument", "")
+            start_s = int(body.get("start_time") or 0) // 1_000_000_000
+            rate = self.fixtures["grvt_ticker"]["result"]["funding_rate_8h_curr"]
+            times = range(max(start_s, int(time.time()) - 7 * 86400) // 28800 * 28800 + 28800, int(time.time()), 28800)
+            return self._reply(200, {"result": [
+                {"instrument": symbol, "funding_rate": rate, "funding_interval_hours": 8,
+                 "funding_time": str(t * 1_000_000_000)} for t in times
+            ][:int(body.get("limit") or 1000)], "next": ""})
+        return self._reply(200, {"result": []})  # open_orders / fill_history
+
+    # ---- Paradex ----
+
+    def _paradex(self, path: str):
+        endpoint = path.split("/v1/", 1)[-1]
+        if endpoint == "markets/summary":
+            data = copy.deepcopy(self.fixtures["paradex_markets_summary"])
+            now_ms = int(time.time() * 1000)
+            data["results"] = [
+                {"symbol": f"{u}-USD-PERP", "mark_price": str(BASE_MARKS[u]),
+                 "funding_rate": data["results"][0]["funding_rate"], "created_at": now_ms}
+                for u in UNDERLYINGS
+            ]
+            return self._reply(200, data)
+        if endpoint == "funding/data":
+            # 连续资金费：按小时给出样本，funding_rate 为 8 小时费率
+            query = dict(parse_qsl(urlsplit(self.path).query))
+            start_s = int(query.get("start_at") or 0) // 1000
+            rate = self.fixtures["paradex_markets_summary"]["results"][0]["funding_rate"]
+            times = range(max(start_s, int(time.time()) - 7 * 86400) // 3600 * 3600 + 3600, int(time.time()), 3600)
+            return self._reply(200, {"results": [
+                {"market": query.get("market", ""), "funding_rate": rate, "created_at": t * 1000} for t in times
+            ][:int(query.get("page_size") or 1000)], "next": None})
+
+        auth = self.headers.get("Authorization", "")
+        if not auth.startswith("Bearer "):
+            return self._reply(401, {"error": "unauthorized"})
+        key = f"paradex:{auth[7:]}"
+        if endpoint == "account/summary":
+            data = copy.deepcopy(self.fixtures["paradex_account_summary"])
+            rng = _rng(key)
+            equity = rng.uniform(5_000, 200_000)
+            data[0].update({"account_value": f"{equity:.2f}",
+                            "free_collateral": f"{equity * rng.uniform(0.3, 0.9):.2f}",
+                            "updated_at": int(time.time() * 1000)})
+            return self._reply(200, data)
+        if endpoint == "positions":
+            template = self.fixtures["paradex_positions"]["results"][0]
+            rows = []
+            for symbol, size, mark in self._positions(key, "{}-USD-PERP"):
+                entry = mark * 0.99
+                rows.append(dict(template, market=symbol, size=str(size), average_entry_price=str(entry),
+                                 unrealized_pnl=str(round((mark - entry) * size, 4)),
+                                 side="LONG" if size > 0 else "SHORT",
+                                 liquidation_price=str(round(mark * (0.7 if size > 0 else 1.3), 4))))
+            return self._reply(200, {"results": rows})
+        return self._reply(200, {"results": []} if endpoint == "fills" else [])
+
+    # ---- 路由 ----
+
+    def _dispatch(self):
+        parts = urlsplit(self.path)
+        if not self._simulate():
+            return
+        if parts.path.startswith("/full/") or parts.path.startswith("/auth/"):
+            return self._grvt(parts.path)
+        return self._paradex(parts.path)
+
+    do_GET = _dispatch
+    do_POST = _dispatch
+
+
+class MockVenueServer:
+    """在后台线程中运行的模拟交易所；start() 后 url 为 http://127.0.0.1:<port>"""
+
+    def __init__(self, profile: Optional[VenueProfile] = None, port: int = 0):
+        handler = type("Handler", (MockVenueHandler,), {
+            "profile": profile or VenueProfile(),
+            "fixtures": {name[:-5]: load_fixture(name[:-5]) for name in os.listdir(FIXTURE_DIR)
+                         if name.endswith(".json")},
+        })
+        self.profile = handler.profile
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "MockVenueServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-venue", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _RedirectAdapter(ResilientAdapter):
+    """把发往真实交易所 host 的请求改写到模拟服务，其余处理（限频、熔断、重试）与线上一致"""
+
+    def __init__(self, host: str, target: str, rate_limit: bool):
+        super().__init__(host, pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+        self.target = target
+        if not rate_limit:
+            self.bucket = TokenBucket(1e9, 1e9)
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        if parts.netloc == self.host:
+            request.url = self.target + request.url[len(f"{parts.scheme}://{parts.netloc}"):]
+        return super().send(request, **kwargs)
+
+
+def route_exchanges_to(target: str, exchanges=("grvt", "paradex"), rate_limit: bool = True):
+    """让共享 Session 中各交易所 host 的请求都发往 target（模拟服务）"""
+    for exchange in exchanges:
+        for value in get_exchange_config(exchange).values():
+            if isinstance(value, str) and value.startswith("http"):
+                host = urlsplit(value).netloc
+                get_session(value).mount("https://", _RedirectAdapter(host, target, rate_limit))
+
+
+if __name__ == "__main__":
+    server = MockVenueServer().start()
+    print(f"模拟交易所已启动: {server.url}（Ctrl+C 退出）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
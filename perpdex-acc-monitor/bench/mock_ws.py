@@ -0,0 +1,132 @@
+"""
+本地模拟 GRVT / Paradex 的私有 WebSocket 推送，与 bench/mock_venue.py 配合用于流式模式的离线调试和测试
+连接按账户登记（Paradex 取 auth 消息中的 JWT，GRVT 取订阅的 sub_account_id），
+由调用方通过 push() 主动推送、drop() 模拟断线
+"""
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+from websockets.asyncio.server import ServerConnection, serve
+from websockets.exceptions import ConnectionClosed
+
+
+def paradex_message(channel: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Paradex 订阅推送的外层格式，channel 为 positions / account"""
+    return {"jsonrpc": "2.0", "method": "subscription", "params": {"channel": channel, "data": data}}
+
+
+def grvt_message(stream: str, sub_account_id: str, feed: Dict[str, Any]) -> Dict[str, Any]:
+    """GRVT 订阅推送的外层格式，stream 如 v1.position"""
+    return {"stream": stream, "selector": sub_account_id, "sequence_number": str(time.time_ns()), "feed": feed}
+
+
+class MockStreamServer:
+    """在后台线程的事件循环中运行的模拟推送服务；start() 后 url 为 ws://127.0.0.1:<port>"""
+
+    def __init__(self, port: int = 0):
+        self.port = port
+        self._connections: Dict[str, Set[ServerConnection]] = {}  # 账户标识 -> 已订阅的连接
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+    def start(self) -> "MockStreamServer":
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), name="mock-ws", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=5)
+        return self
+
+    def stop(self):
+        """可重复调用；已停止时直接返回"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join(timeout=5)
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        async with serve(self._handle, "127.0.0.1", self.port) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self._ready.set()
+            await self._stop.wait()
+
+    async def _handle(self, ws: ServerConnection):
+        account = ""
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                params = message.get("params", {})
+                if message.get("method") == "auth":
+                    account = f"paradex:{params.get('bearer', '')}"
+                elif message.get("method") == "subscribe" and params.get("selectors"):
+                    account = f"grvt:{params['selectors'][0]}"
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": message.get("id"), "result": {}}))
+                if account:
+                    with self._lock:
+                        self._connections.setdefault(account, set()).add(ws)
+        except ConnectionClosed:
+            pass
+        finally:
+            with self._lock:
+                self._connections.get(account, set()).discard(ws)
+
+    # ---- 以下方法在调用方线程中使用 ----
+
+    def connected(self, account: str) -> int:
+        """account 当前已订阅的连接数；account 形如 paradex:<jwt> / grvt:<sub_account_id>"""
+        with self._lock:
+            return len(self._connections.get(account, ()))
+
+    def wait_connected(self, account: str, timeout: float = 10.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.connected(account):
+                return True
+            time.sleep(0.02)
+        return False
+
+    def _targets(self, account: Optional[str]) -> List[ServerConnection]:
+        with self._lock:
+            if account is not None:
+                return list(self._connections.get(account, ()))
+            return [ws for connections in self._connections.values() for ws in connections]
+
+    def push(self, account: str, message: Dict[str, Any]) -> int:
+        """向该账户的所有连接推送一条消息，返回推送的连接数"""
+        payload = json.dumps(message)
+        targets = self._targets(account)
+        for ws in targets:
+            asyncio.run_coroutine_threadsafe(ws.send(payload), self._loop).result(timeout=5)
+        return len(targets)
+
+    def drop(self, account: Optional[str] = None) -> int:
+        """断开该账户（None 为全部账户）的连接，模拟服务端断线，返回断开的连接数"""
+        targets = self._targets(account)
+        for ws in targets:
+            asyncio.run_coroutine_threadsafe(ws.close(1012, "mock restart"), self._loop).result(timeout=5)
+        return len(targets)
+
+
+def route_streams_to(adapters, url: str):
+    """把适配器的 WebSocket 地址改为 url（模拟推送服务），不修改全局配置"""
+    for adapter in adapters:
+        adapter.config = dict(adapter.config, ws=dict(adapter.config.get("ws", {}), url=url))
+
+
+if __name__ == "__main__":
+    server = MockStreamServer().start()
+    print(f"模拟推送服务已启动: {server.url}（Ctrl+C 退出）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,223 @@
+"""
+快照全流程压测：fetch -> markets -> aggregate -> render，全部请求发往本地模拟交易所
+
+在 perpdex-acc-monitor 目录下运行：
+    python -m bench.run_bench                          # 默认 1 / 50 / 500 个账户
+    python -m bench.run_bench --accounts 50 --iterations 20 --error-rate 0.05
+    python -m bench.run_bench --json bench_result.json # 保存结果，便于与上一次对比
+    python -m bench.run_bench --workers 4              # 分片模式：4 个 worker 进程抓取汇总，主进程合并
+
+每个规模先跑一轮冷启动（含 GRVT 登录），再跑 --iterations 轮热路径，
+报告每个阶段的 p50 / p99 延迟、吞吐（账户数 / 秒），以及单独一轮 tracemalloc 测得的 Python 堆峰值
+"""
+import argparse
+import base64
+import json
+import os
+import resource
+import time
+import tracemalloc
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from bench.mock_venue import MockVenueServer, VenueProfile, route_exchanges_to
+from utils.http_session import close_all_sessions
+
+STAGES = ("fetch", "markets", "aggregate", "render")
+SHARDED_STAGES = ("sharded", "render")  # sharded = worker 内的 fetch/markets/aggregate + 主进程合并
+
+
+def _fake_jwt(subject: str) -> str:
+    """只需要 payload 中的 sub（账户标识），签名部分随意"""
+    def encode(obj: Dict[str, Any]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+    return f"{encode({'alg': 'none'})}.{encode({'sub': subject})}.bench"
+
+
+def set_bench_accounts(n_accounts: int):
+    """用环境变量构造 n 个模拟账户（GRVT 与 Paradex 各一半，只有 1 个时为 GRVT）"""
+    for key in [key for key in os.environ if key.startswith(("GRVT_", "PARADEX_"))]:
+        del os.environ[key]
+    n_grvt = (n_accounts + 1) // 2
+    for i in range(1, n_grvt + 1):
+        os.environ[f"GRVT_API_KEY_{i}"] = f"bench-key-{i}"
+        os.environ[f"GRVT_SUB_ACCOUNT_ID_{i}"] = str(10_000 + i)
+    for i in range(1, n_accounts - n_grvt + 1):
+        os.environ[f"PARADEX_JWT_{i}"] = _fake_jwt(f"0xbench{i:06d}")
+    from utils.config_loader import reload_config
+    reload_config()  # 账户只在配置加载时扫描一次
+
+
+def run_pipeline(adapters, engine, plan, render: bool = True) -> Dict[str, float]:
+    """跑一遍完整流程，返回各阶段耗时（秒）"""
+    from aggregator import Snapshot, load_markets
+    from image_generator import render_summary_image
+
+    timings = {}
+    started = time.perf_counter()
+    fetched = engine.fetch_accounts({adapter: adapter.load_accounts() for adapter in adapters}, plan)
+    timings["fetch"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    markets = load_markets(adapters, fetched)
+    timings["markets"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    snapshot = Snapshot(adapters, fetched, markets)
+    view = snapshot.view()
+    timings["aggregate"] = time.perf_counter() - started
+
+    if render:
+        started = time.perf_counter()
+        render_summary_image(view)
+        timings["render"] = time.perf_counter() - started
+    return timings
+
+
+def _peak_memory(adapters, engine, plan, stages) -> Dict[str, float]:
+    """单独跑一轮，用 tracemalloc 记录每个阶段的 Python 堆峰值（MB）；PIL 像素缓冲不在统计范围内"""
+    from aggregator import Snapshot, load_markets
+    from image_generator import render_summary_image
+
+    steps: List[Callable[[Dict[str, Any]], Any]] = [
+        lambda s: s.update(fetched=engine.fetch_accounts(
+            {adapter: adapter.load_accounts() for adapter in adapters}, plan)),
+        lambda s: s.update(markets=load_markets(adapters, s["fetched"])),
+        lambda s: s.update(view=Snapshot(adapters, s["fetched"], s["markets"]).view()),
+        lambda s: render_summary_image(s["view"]),
+    ]
+    state: Dict[str, Any] = {}
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for stage, step in zip(stages, steps):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            step(state)
+            peaks[stage] = (tracemalloc.get_traced_memory()[1] - base) / 2**20
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def run_sharded(source, render: bool = True) -> Dict[str, float]:
+    from image_generator import render_summary_image
+
+    timings = {}
+    started = time.perf_counter()
+    snapshot = source.load_snapshot()
+    timings["sharded"] = time.perf_counter() - started
+    if render:
+        started = time.perf_counter()
+        render_summary_image(snapshot.view())
+        timings["render"] = time.perf_counter() - started
+    return timings
+
+
+def bench_scale(n_accounts: int, iterations: int, render: bool, workers: int = 0,
+                initializer: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+    from aggregator import SNAPSHOT_PLAN
+    from exchanges.registry import get_adapters
+    from fetcher import FetchEngine
+    from market_data import get_market_cache
+    from sharding import ShardedSnapshotSource
+
+    set_bench_accounts(n_accounts)
+    if workers > 1:
+        # worker 进程在启动时继承当前的账户环境变量，每个规模单独起一组
+        source = ShardedSnapshotSource(workers, initializer=initializer).start()
+        stages = SHARDED_STAGES if render else SHARDED_STAGES[:-1]
+        step = partial(run_sharded, source, render)
+    else:
+        adapters = get_adapters()
+        engine = FetchEngine()
+        get_market_cache().ttl = 0  # 每轮都真实请求行情，测量 markets 阶段
+        stages = STAGES if render else STAGES[:-1]
+        step = partial(run_pipeline, adapters, engine, SNAPSHOT_PLAN, render)
+
+    try:
+        cold = step()
+        samples = {stage: [] for stage in stages}
+        for _ in range(iterations):
+            timings = step()
+            for stage in stages:
+                samples[stage].append(timings[stage])
+    finally:
+        if workers > 1:
+            source.close()
+
+    # 分片模式的堆内存分散在各 worker 进程中，tracemalloc 只能看到主进程，不统计
+    memory = _peak_memory(adapters, engine, SNAPSHOT_PLAN, stages) if workers <= 1 \
+        else {stage: float("nan") for stage in stages}
+    result = {"accounts": n_accounts, "workers": workers, "cold_total": sum(cold.values()), "stages": {}}
+    totals = np.sum([samples[stage] for stage in stages], axis=0)
+    for stage in stages:
+        values = np.asarray(samples[stage])
+        result["stages"][stage] = {
+            "p50_ms": float(np.percentile(values, 50) * 1000),
+            "p99_ms": float(np.percentile(values, 99) * 1000),
+            "accounts_per_s": float(n_accounts / np.median(values)) if np.median(values) > 0 else float("inf"),
+            "py_peak_mb": memory[stage],
+        }
+    result["total"] = {
+        "p50_ms": float(np.percentile(totals, 50) * 1000),
+        "p99_ms": float(np.percentile(totals, 99) * 1000),
+        "accounts_per_s": float(n_accounts / np.median(totals)),
+    }
+    result["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux 为 KB
+    return result
+
+
+def print_report(result: Dict[str, Any]):
+    workers = f"，{result['workers']} 个分片进程" if result.get("workers", 0) > 1 else ""
+    print(f"\n=== {result['accounts']} 个账户{workers} ===")
+    print(f"冷启动总耗时（含登录）: {result['cold_total'] * 1000:.1f} ms")
+    print(f"{'stage':<10}{'p50 ms':>10}{'p99 ms':>10}{'acct/s':>12}{'py peak MB':>12}")
+    for stage, row in result["stages"].items():
+        print(f"{stage:<10}{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+              f"{row['accounts_per_s']:>12.1f}{row['py_peak_mb']:>12.2f}")
+    total = result["total"]
+    print(f"{'total':<10}{total['p50_ms']:>10.1f}{total['p99_ms']:>10.1f}{total['accounts_per_s']:>12.1f}")
+    print(f"进程 RSS 峰值: {result['max_rss_mb']:.0f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="快照全流程压测（本地模拟交易所）")
+    parser.add_argument("--accounts", default="1,50,500", help="账户规模，逗号分隔")
+    parser.add_argument("--iterations", type=int, default=10, help="每个规模的热路径轮数")
+    parser.add_argument("--positions", type=int, default=3, help="每个账户的持仓数")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="模拟交易所的平均延迟")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="延迟的标准差")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟交易所返回 503 的概率")
+    parser.add_argument("--rate-limit", action="store_true", help="保留线上的令牌桶限频（默认关闭，只测流程本身）")
+    parser.add_argument("--no-render", action="store_true", help="跳过图片渲染阶段")
+    parser.add_argument("--workers", type=int, default=0, help=">1 时使用多进程分片模式")
+    parser.add_argument("--json", help="把结果写入该 JSON 文件")
+    args = parser.parse_args(argv)
+
+    profile = VenueProfile(args.latency_ms, args.jitter_ms, args.error_rate, args.positions)
+    server = MockVenueServer(profile).start()
+    route_exchanges_to(server.url, rate_limit=args.rate_limit)
+    print(f"模拟交易所: {server.url}  延迟 {args.latency_ms}±{args.jitter_ms} ms, 错误率 {args.error_rate:.1%}")
+
+    results = []
+    try:
+        for n in (int(x) for x in args.accounts.split(",")):
+            result = bench_scale(n, args.iterations, not args.no_render, args.workers,
+                                 partial(route_exchanges_to, server.url, rate_limit=args.rate_limit))
+            print_report(result)
+            results.append(result)
+    finally:
+        close_all_sessions()
+        server.stop()
+    print(f"\n模拟交易所共处理 {profile.requests} 个请求，其中 {profile.errors} 个按故障返回")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存: {os.path.abspath(args.json)}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
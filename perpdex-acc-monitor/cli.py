@@ -0,0 +1,111 @@
+"""
+无界面的命令行 / 守护进程入口：抓取 + 汇总后直接导出结构化数据，不渲染图片、不经过 Telegram
+
+在 perpdex-acc-monitor 目录下运行：
+    python cli.py once                                          # 账户明细 NDJSON 输出到 stdout
+    python cli.py once --format csv --kind positions -o positions.csv
+    python cli.py watch --interval 5 --kind all -o unix:/tmp/perpdex.sock   # 守护进程，广播给 socket 客户端
+    python cli.py watch --interval 60 --format parquet --kind accounts -o accounts.parquet
+    python cli.py watch --workers 4 -o accounts.ndjson                     # 本机 4 个分片 worker 进程
+    python cli.py watch --shard 0/4 -o shard0.ndjson                       # 多主机部署，本机只负责第 0 个分片
+
+运行日志统一写到 stderr，stdout 只输出数据
+"""
+import argparse
+import contextlib
+import os
+import signal
+import sys
+import threading
+import time
+from functools import partial
+from export import FORMATS, KINDS, open_exporter
+from sharding import ShardedSnapshotSource, load_shard_snapshot, parse_shard
+from snapshot_service import SnapshotService
+from streaming import AccountBook, StreamRunner
+from utils.config_loader import check_config, get_sharding_config, get_streaming_config
+from utils.http_session import close_all_sessions
+from utils.metrics import start_metrics_server
+
+
+def _parse_kinds(value: str):
+    return KINDS if value == "all" else tuple(k.strip() for k in value.split(","))
+
+
+def build_service(args, closing: contextlib.ExitStack) -> SnapshotService:
+    """
+    与 Bot 相同：流式模式下快照读取 WebSocket 内存账户簿，否则每次走 REST 抓取
+    --shard 只抓取一个分片（多主机部署）；workers > 1 时由本机的分片 worker 进程抓取后合并
+    后台资源（流式连接线程 / 分片 worker 进程）登记到 closing，退出时统一关闭
+    """
+    if args.shard:
+        return SnapshotService(max_age=0, loader=partial(load_shard_snapshot, *parse_shard(args.shard)))
+    if args.streaming or get_streaming_config().enabled:
+        book = AccountBook()
+        runner = StreamRunner(book)
+        runner.start()
+        closing.callback(runner.stop)
+        print("流式模式已开启，快照基于 WebSocket 内存账户簿")
+        return SnapshotService(max_age=0, book=book)
+    workers = args.workers if args.workers is not None else get_sharding_config().workers
+    if workers > 1:
+        source = ShardedSnapshotSource(workers).start()
+        closing.callback(source.close)
+        return SnapshotService(max_age=0, loader=source.load_snapshot)
+    return SnapshotService(max_age=0)
+
+
+def run(args, stdout) -> int:
+    check_config()
+    exporter = open_exporter(args.format, args.output, _parse_kinds(args.kind), stdout=stdout)
+    with contextlib.ExitStack() as closing:
+        closing.callback(close_all_sessions)  # 最后执行：后台资源都已停止，不会再有请求
+        closing.callback(exporter.close)
+        service = build_service(args, closing)
+        if args.command == "once":
+            exporter.write(service.get_snapshot(0))
+            return 0
+
+        start_metrics_server()
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+        next_run = time.monotonic()
+        while not stop.is_set():
+            try:
+                exporter.write(service.get_snapshot(0))
+            except Exception as e:  # 单轮失败（抓取 / 汇总 / 导出）不能结束守护进程
+                print(f"本轮快照导出失败: {type(e).__name__}: {e}")
+            # 固定频率调度；一轮超过 interval 时跳过错过的周期，不连续补跑
+            next_run += args.interval
+            now = time.monotonic()
+            if next_run < now:
+                next_run = now + args.interval - (now - next_run) % args.interval
+            stop.wait(next_run - now)
+        return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="PerpDEX 账户风险快照导出（无图片）")
+    parser.add_argument("command", choices=("once", "watch"), help="once: 导出一次后退出；watch: 按 --interval 持续导出")
+    parser.add_argument("--format", "-f", choices=FORMATS, default="ndjson")
+    parser.add_argument("--kind", "-k", default="accounts",
+                        help=f"记录类型 {'/'.join(KINDS)}，NDJSON 可用逗号组合或 all")
+    parser.add_argument("--output", "-o", default="-", help="- 为 stdout，unix:<路径> 为 Unix socket，其余为文件（NDJSON/CSV 追加；"
+                             "Parquet 每次运行一个文件，已存在的旧文件按时间改名保留）")
+    parser.add_argument("--interval", type=float, default=10.0, help="watch 模式的导出间隔（秒）")
+    parser.add_argument("--streaming", action="store_true", help="使用 WebSocket 流式账户簿（也可在 yaml 中开启）")
+    parser.add_argument("--workers", type=int, help="分片 worker 进程数，默认取 yaml 的 sharding.workers")
+    parser.add_argument("--shard", help="只处理一个分片，格式 <序号>/<总数>（如 0/4），用于多主机部署")
+    args = parser.parse_args(argv)
+    if args.interval <= 0:
+        parser.error("--interval 必须大于 0")
+
+    # 抓取过程中的 print 日志改写到 stderr，数据通过原 stdout 的二进制流输出
+    stdout = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    with contextlib.redirect_stdout(sys.stderr):
+        return run(args, stdout)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
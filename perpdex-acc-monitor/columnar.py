@@ -0,0 +1,153 @@
+from typing import Any, Dict, List
+import re
+import numpy as np
+
+
+class PositionTable:
+    """
+    列式持仓表 (struct-of-arrays)
+    账户维度: account_venue / account_equity / account_available，下标即 account_id
+    持仓维度: pos_account / pos_instrument / pos_symbol / size / mark / notional / liq_price，每行一个持仓
+    venues / instruments / symbols 为编码表，数组中只存整数编码
+    instruments 为统一展示名（汇总、展示用），symbols 为交易所合约名（同一账户内唯一，用于逐持仓的身份识别）
+    """
+
+    __slots__ = (
+        "venues", "instruments", "symbols", "account_meta",
+        "account_venue", "account_equity", "account_available",
+        "pos_account", "pos_instrument", "pos_symbol", "size", "mark", "notional", "liq_price",
+    )
+
+    def __init__(self, venues, instruments, symbols, account_meta, account_venue, account_equity, account_available,
+                 pos_account, pos_instrument, pos_symbol, size, mark, notional, liq_price):
+        self.venues = venues
+        self.instruments = instruments
+        self.symbols = symbols
+        self.account_meta = account_meta
+        self.account_venue = account_venue
+        self.account_equity = account_equity
+        self.account_available = account_available
+        self.pos_account = pos_account
+        self.pos_instrument = pos_instrument
+        self.pos_symbol = pos_symbol
+        self.size = size
+        self.mark = mark
+        self.notional = notional
+        self.liq_price = liq_price
+
+    @property
+    def n_accounts(self) -> int:
+        return len(self.account_venue)
+
+    @property
+    def n_positions(self) -> int:
+        return len(self.pos_account)
+
+
+class TableBuilder:
+    """逐行追加账户和持仓，最后一次性转成 NumPy 数组"""
+
+    def __init__(self, venues: List[str]):
+        self.venues = list(venues)
+        self._venue_codes = {v: i for i, v in enumerate(self.venues)}
+        self.instruments: List[str] = []
+        self._instrument_codes: Dict[str, int] = {}
+        self.symbols: List[str] = []
+        self._symbol_codes: Dict[str, int] = {}
+        self.account_meta: List[Dict[str, Any]] = []
+        self._account_venue: List[int] = []
+        self._account_equity: List[float] = []
+        self._account_available: List[float] = []
+        self._pos_account: List[int] = []
+        self._pos_instrument: List[int] = []
+        self._pos_symbol: List[int] = []
+        self._size: List[float] = []
+        self._mark: List[float] = []
+        self._notional: List[float] = []
+        self._liq_price: List[float] = []
+
+    def add_account(self, venue: str, equity: float, available: float, **meta) -> int:
+        """登记一个账户，返回 account_id；meta 原样保存在 account_meta 中供展示层使用"""
+        self._account_venue.append(self._venue_codes[venue])
+        self._account_equity.append(equity)
+        self._account_available.append(available)
+        self.account_meta.append(meta)
+        return len(self._account_venue) - 1
+
+    def add_position(self, account_id: int, instrument: str, symbol: str, size: float, mark: float,
+                     notional: float, liq_price: float):
+        code = self._instrument_codes.get(instrument)
+        if code is None:
+            code = len(self.instruments)
+            self._instrument_codes[instrument] = code
+            self.instruments.append(instrument)
+        symbol_code = self._symbol_codes.get(symbol)
+        if symbol_code is None:
+            symbol_code = len(self.symbols)
+            self._symbol_codes[symbol] = symbol_code
+            self.symbols.append(symbol)
+        self._pos_account.append(account_id)
+        self._pos_instrument.append(code)
+        self._pos_symbol.append(symbol_code)
+        self._size.append(size)
+        self._mark.append(mark)
+        self._notional.append(notional)
+        self._liq_price.append(liq_price)
+
+    def build(self) -> PositionTable:
+        return PositionTable(
+            venues=self.venues,
+            instruments=self.instruments,
+            symbols=self.symbols,
+            account_meta=self.account_meta,
+            account_venue=np.asarray(self._account_venue, dtype=np.int16),
+            account_equity=np.asarray(self._account_equity, dtype=np.float64),
+            account_available=np.asarray(self._account_available, dtype=np.float64),
+            pos_account=np.asarray(self._pos_account, dtype=np.int32),
+            pos_instrument=np.asarray(self._pos_instrument, dtype=np.int32),
+            pos_symbol=np.asarray(self._pos_symbol, dtype=np.int32),
+            size=np.asarray(self._size, dtype=np.float64),
+            mark=np.asarray(self._mark, dtype=np.float64),
+            notional=np.asarray(self._notional, dtype=np.float64),
+            liq_price=np.asarray(self._liq_price, dtype=np.float64),
+        )
+
+
+def compute_aggregates(table: PositionTable) -> Dict[str, Any]:
+    """
+    分组向量化汇总：账户 / 交易所 / 总计的 equity、净敞口、总敞口和杠杆
+    返回的都是 NumPy 数组（或标量），由展示层决定如何格式化
+    """
+    n_accounts = table.n_accounts
+    n_venues = len(table.venues)
+
+    account_net = np.bincount(table.pos_account, weights=table.notional, minlength=n_accounts)
+    account_gross = np.bincount(table.pos_account, weights=np.abs(table.notional), minlength=n_accounts)
+
+    equity = table.account_equity
+    safe_equity = np.where(equity > 0, equity, 1.0)  # 避免除0
+    net_leverage = np.round(np.abs(account_net) / safe_equity, 2)
+    gross_leverage = np.round(account_gross / safe_equity, 2)
+
+    venue = table.account_venue
+    venue_equity = np.bincount(venue, weights=equity, minlength=n_venues)
+    venue_net = np.bincount(venue, weights=account_net, minlength=n_venues)
+    venue_gross = np.bincount(venue, weights=account_gross, minlength=n_venues)
+
+    return {
+        "account_net": account_net,
+        "account_gross": account_gross,
+        "account_net_leverage": net_leverage,
+        "account_gross_leverage": gross_leverage,
+        "venue_equity": venue_equity,
+        "venue_net": venue_net,
+        "venue_gross": venue_gross,
+        "total_equity": float(equity.sum()),
+        "total_net": float(account_net.sum()),
+        "total_gross": float(account_gross.sum()),
+    }
+
+
+def underlying(instrument: str) -> str:
+    """合约名中的标的：GRVT 的 BTC_USDT_Perp 与 Paradex 的 BTC-USD-PERP 都归为 BTC"""
+    return re.split(r"[_\-/]", instrument, maxsplit=1)[0].upper()
@@ -0,0 +1,97 @@
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class BalanceRecord(NamedTuple):
+    """标准化的账户余额"""
+    equity: float
+    available: float
+    event_time: Optional[float] = None  # 交易所事件时间（Unix 秒），没有则为 None
+
+
+class PositionRecord(NamedTuple):
+    """标准化的持仓，notional 带方向（空头为负）"""
+    symbol: str        # 交易所原始合约名，如 BTC_USDT_Perp / BTC-USD-PERP
+    instrument: str    # 统一展示名，如 BTC-PERP
+    size: float
+    mark: float
+    notional: float
+    liq_price: float
+    event_time: Optional[float] = None  # 交易所更新时间（Unix 秒），没有则为 None；流式模式据此丢弃过期推送
+
+
+class MarketRecord(NamedTuple):
+    """标准化的合约行情（公共接口，与账户无关）"""
+    symbol: str
+    mark: float
+    funding_rate: float = 0.0           # 每个资金费周期（funding_period_hours）的费率（小数，正数表示多头付费）
+    event_time: Optional[float] = None  # Unix 秒
+
+
+class ExchangeAdapter:
+    """
+    交易所适配器接口。新增交易所时：
+    1. 在 exchanges/<name>.py 中实现子类并用 @register_adapter("<name>") 注册
+    2. 在 config/exchanges.yaml 的 exchanges 段中加入 <name> 配置
+    抓取引擎按 fetch_<dataset>(account) 统一调度，汇总层只接触标准化记录
+    账户对象的 get_positions() 在解析响应时直接投影为 PositionRecord，不保留原始 JSON
+    """
+
+    name = ""
+    display_name = ""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or {}
+        if self.config.get("display_name"):
+            self.display_name = self.config["display_name"]
+
+    def load_accounts(self) -> List[Any]:
+        """根据环境变量构造该交易所的所有账户对象（不发起网络请求）"""
+        raise NotImplementedError
+
+    def normalize_summary(self, summary: Dict[str, Any]) -> BalanceRecord:
+        raise NotImplementedError
+
+    def normalize_position(self, position: Dict[str, Any]) -> PositionRecord:
+        """单条原始持仓（REST 或 WebSocket 推送）-> 标准化记录"""
+        raise NotImplementedError
+
+    @property
+    def funding_period_hours(self) -> float:
+        """MarketRecord.funding_rate 对应的周期（小时）"""
+        return float(self.config.get("funding_period_hours", 8))
+
+    def fetch_summary(self, account: Any) -> Optional[BalanceRecord]:
+        summary = account.get_summary()
+        return self.normalize_summary(summary) if summary else None
+
+    def fetch_positions(self, account: Any) -> List[PositionRecord]:
+        return account.get_positions()
+
+    def fetch_open_orders(self, account: Any) -> List[Dict[str, Any]]:
+        return account.get_open_orders()
+
+    def fetch_fills(self, account: Any) -> List[Dict[str, Any]]:
+        return account.get_fills()
+
+    # ---- 流式模式（可选实现） ----
+
+    def ws_connect_args(self, account: Any) -> Tuple[str, Dict[str, str], List[Dict[str, Any]]]:
+        """返回 (WebSocket 地址, 连接请求头, 连接后依次发送的鉴权/订阅消息)"""
+        raise NotImplementedError(f"{self.display_name} 不支持流式模式")
+
+    def parse_ws_message(self, message: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        """把一条推送解析为 [("balance", BalanceRecord) | ("position", PositionRecord), ...]"""
+        raise NotImplementedError(f"{self.display_name} 不支持流式模式")
+
+    # ---- 公共行情（可选实现） ----
+
+    def fetch_market_data(self, symbols: List[str]) -> Dict[str, MarketRecord]:
+        """批量获取合约行情；symbols 为当前持有的合约，支持全市场批量接口的交易所可以忽略"""
+        raise NotImplementedError(f"{self.display_name} 不支持公共行情")
+
+    def iter_funding(self, symbol: str, since_ms: int, page_size: int = 1000) -> Iterator[List[Tuple[int, float]]]:
+        """
+        从 since_ms（含）开始按 cursor 翻页拉取单个合约的资金费率历史
+        每页为 [(毫秒时间戳, 费率), ...]，费率与 MarketRecord.funding_rate 同口径（每 funding_period_hours 的小数）
+        """
+        raise NotImplementedError(f"{self.display_name} 不支持资金费率历史")
@@ -1,6 +1,29 @@
 import requests
-from typing import List, Dict, Any
-from utils.config_loader import get_all_accounts, get_exchange_config
+import threading
+import time
+from typing import List, Dict, Any, Iterator, Tuple
+from utils.config_loader import get_all_accounts, get_exchange_config, get_fetch_config
+from utils import metrics
+from utils.json_codec import response_json
+from utils.http_session import get_session
+from exchanges.base import BalanceRecord, ExchangeAdapter, MarketRecord, PositionRecord
+from exchanges.registry import register_adapter
+from fetcher import get_engine, FULL_PLAN
+
+# api_key -> (登录请求头, 过期时间)，跨快照复用 gravity cookie，避免每次快照都重新登录
+_login_cache: Dict[str, Tuple[Dict[str, str], float]] = {}
+_login_locks: Dict[str, threading.Lock] = {}
+_login_cache_lock = threading.Lock()
+
+DEFAULT_SESSION_TTL = 3600   # cookie 未声明过期时间时的默认有效期（秒）
+LOGIN_EXPIRY_MARGIN = 60     # 提前这么多秒视为过期
+
+def _invalidate_login(api_key: str, stale_headers: Dict[str, str]):
+    """收到 401 时作废缓存；只有缓存仍是这份旧凭证时才删除，避免并发请求重复登录"""
+    with _login_cache_lock:
+        cached = _login_cache.get(api_key)
+        if cached and cached[0] is stale_headers:
+            del _login_cache[api_key]
 
 def safe_float(value, default=0.0):
     """安全转 float，处理空字符串、None 等"""
@@ -19,98 +42,274 @@ class GRVTAccount:
         self.config = get_exchange_config("grvt")
         self.auth_url = self.config["auth_url"]
         self.base_url = self.config["base_url"]
-        self.headers = self._login()
+        self.account_key = sub_account_id or str(account_index)
+        self.session = get_session(self.base_url)
+        self._login_failed = False
+        self.keep_raw = get_fetch_config().keep_raw
+        self.raw_payloads: Dict[str, Any] = {}  # 仅 keep_raw 时保存：数据集 -> 最近一次原始响应
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """优先使用缓存的登录凭证，过期或被作废后才重新登录（同一 api_key 同时只登录一次）"""
+        if self._login_failed:
+            return {}
+        with _login_cache_lock:
+            lock = _login_locks.setdefault(self.api_key, threading.Lock())
+        with lock:
+            cached = _login_cache.get(self.api_key)
+            if cached and cached[1] > time.time():
+                metrics.inc("cache_lookups", cache="grvt_login", result="hit")
+                return cached[0]
+            metrics.inc("cache_lookups", cache="grvt_login", result="miss")
+            with metrics.timer("exchange_login", exchange="grvt", account=self.account_index):
+                headers, expires_at = self._login()
+            with _login_cache_lock:
+                if headers:
+                    _login_cache[self.api_key] = (headers, expires_at)
+                else:
+                    _login_cache.pop(self.api_key, None)
+                    self._login_failed = True  # 本轮不再重复尝试
+            return headers
+
+    def account_info(self) -> Dict[str, Any]:
+        return {"account_index": self.account_index, "account_key": self.account_key,
+                "sub_account_id": self.sub_account_id}
 
-    def _login(self) -> Dict[str, str]:
+    def _login(self) -> Tuple[Dict[str, str], float]:
         payload = {"api_key": self.api_key}
         try:
-            response = requests.post(self.auth_url, json=payload, timeout=30)
+            response = get_session(self.auth_url).post(self.auth_url, json=payload, timeout=30)
             if response.status_code == 200:
-                session_cookie = response.cookies.get("gravity")
+                cookie = next((c for c in response.cookies if c.name == "gravity"), None)
                 account_id = response.headers.get("X-Grvt-Account-Id")
-                if session_cookie and account_id:
-                    return {
-                        "Cookie": f"gravity={session_cookie}",
+                if cookie and cookie.value and account_id:
+                    ttl = self.config.get("session_ttl", DEFAULT_SESSION_TTL)
+                    expires_at = float(cookie.expires) if cookie.expires else time.time() + ttl
+                    headers = {
+                        "Cookie": f"gravity={cookie.value}",
                         "X-Grvt-Account-Id": account_id,
                         "Content-Type": "application/json"
                     }
+                    return headers, expires_at - LOGIN_EXPIRY_MARGIN
             print(f"GRVT 账户{self.account_index} 登录失败: {response.status_code} {response.text}")
         except Exception as e:
             print(f"GRVT 账户{self.account_index} 登录异常: {e}")
-        return {}
+        return {}, 0.0
+
+    def _json(self, dataset: str, response: requests.Response) -> Any:
+        """解析响应；开启 fetch.keep_raw 时按数据集保留原始 JSON 供调试"""
+        data = response_json(response)
+        if self.keep_raw:
+            self.raw_payloads[dataset] = data
+        return data
+
+    def _post(self, endpoint: str, payload: Dict[str, Any]) -> requests.Response:
+        """带登录凭证的 POST；遇到 401 说明会话失效，重新登录一次后重试"""
+        url = f"{self.base_url}/{self.config['endpoints'][endpoint]}"
+        headers = self.headers
+        if not headers:
+            raise RuntimeError(f"GRVT 账户{self.account_index} 登录失败")
+        response = self.session.post(url, headers=headers, json=payload, timeout=30)
+        if response.status_code == 401:
+            _invalidate_login(self.api_key, headers)
+            headers = self.headers
+            if headers:
+                response = self.session.post(url, headers=headers, json=payload, timeout=30)
+        return response
 
     def get_summary(self) -> Dict[str, Any]:
-        if not self.headers:
-            return {}
-        url = f"{self.base_url}/{self.config['endpoints']['summary']}"
         payload = {"sub_account_id": self.sub_account_id}
-        response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+        response = self._post("summary", payload)
         if response.status_code == 200:
-            data = response.json()
+            data = self._json("summary", response)
             # GRVT account_summary 返回 {"result": { ... }}
             if "result" in data:
                 return data["result"]
             return data  # 兼容直接 dict
-        print(f"GRVT 账户{self.account_index} summary 查询失败: {response.status_code} {response.text}")
-        return {}
+        raise RuntimeError(f"GRVT 账户{self.account_index} summary 查询失败: {response.status_code} {response.text[:200]}")
 
-    def get_positions(self) -> List[Dict[str, Any]]:
-        if not self.headers:
-            return []
-        url = f"{self.base_url}/{self.config['endpoints']['positions']}"
+    def get_positions(self) -> List[PositionRecord]:
+        """持仓直接投影为标准化记录，原始 JSON 解析后即丢弃"""
         payload = {"sub_account_id": self.sub_account_id}
-        response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+        response = self._post("positions", payload)
         if response.status_code == 200:
-            data = response.json()
+            data = self._json("positions", response)
             positions = data.get("result", []) if "result" in data else data
-            # GRVT 原生有 notional 字段，直接使用
-            for pos in positions:
-                notional = safe_float(pos.get("notional", 0))
-                pos["notional_value"] = round(notional, 2)
-            return positions
-        print(f"GRVT 账户{self.account_index} positions 查询失败: {response.status_code}")
-        return []
+            return [parse_position(pos) for pos in positions]
+        raise RuntimeError(f"GRVT 账户{self.account_index} positions 查询失败: {response.status_code}")
 
     def get_open_orders(self) -> List[Dict[str, Any]]:
-        if not self.headers:
-            return []
-        url = f"{self.base_url}/{self.config['endpoints']['open_orders']}"
         payload = {"sub_account_id": self.sub_account_id}
-        response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+        response = self._post("open_orders", payload)
         if response.status_code == 200:
-            data = response.json()
+            data = self._json("open_orders", response)
             return data.get("result", []) if "result" in data else data
         elif response.status_code == 404:
             return []
-        print(f"GRVT 账户{self.account_index} open_orders 查询失败: {response.status_code}")
-        return []
+        raise RuntimeError(f"GRVT 账户{self.account_index} open_orders 查询失败: {response.status_code}")
 
     def get_fills(self, limit: int = 500) -> List[Dict[str, Any]]:
-        if not self.headers:
-            return []
-        url = f"{self.base_url}/{self.config['endpoints']['fills']}"
+        """最近的成交，返回标准化后的成交（与 iter_fills 相同格式）"""
         payload = {"sub_account_id": self.sub_account_id, "limit": limit}
-        response = requests.post(url, headers=self.headers, json=payload, timeout=30)
+        response = self._post("fills", payload)
         if response.status_code == 200:
-            data = response.json()
-            return data.get("result", []) if "result" in data else data
-        print(f"GRVT 账户{self.account_index} fills 查询失败: {response.status_code}")
-        return []
+            data = self._json("fills", response)
+            fills = data.get("result", []) if "result" in data else data
+            return [normalize_fill(f) for f in fills]
+        raise RuntimeError(f"GRVT 账户{self.account_index} fills 查询失败: {response.status_code}")
 
-def get_all_grvt_data() -> List[Dict[str, Any]]:
+    def iter_fills(self, since_ms: int = 0, page_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """
+        从 since_ms（含）开始按 cursor 向后翻页拉取成交，每页返回标准化后的成交列表
+        GRVT 时间戳为纳秒字符串
+        """
+        cursor = ""
+        while True:
+            payload = {
+                "sub_account_id": self.sub_account_id,
+                "start_time": str(int(since_ms) * 1_000_000),
+                "limit": page_size,
+            }
+            if cursor:
+                payload["cursor"] = cursor
+            response = self._post("fills", payload)
+            if response.status_code != 200:
+                raise RuntimeError(f"GRVT 账户{self.account_index} fills 翻页失败: {response.status_code}")
+            data = response_json(response)
+            page = data.get("result", []) if isinstance(data, dict) else data
+            if page:
+                yield [normalize_fill(f) for f in page]
+            cursor = data.get("next", "") if isinstance(data, dict) else ""
+            if not page or not cursor:
+                break
+
+def parse_position(position: Dict[str, Any]) -> PositionRecord:
+    """GRVT 原始持仓（REST / WebSocket 相同格式）-> 标准化记录；原生 notional 字段直接使用"""
+    symbol = position.get("instrument", "")
+    event_time = safe_float(position.get("event_time"), default=None)
+    return PositionRecord(
+        symbol=symbol,
+        instrument=symbol.split("_")[0] + "-PERP" if "_" in symbol else "N/A",
+        size=safe_float(position.get("size")),
+        mark=safe_float(position.get("mark_price")),
+        notional=round(safe_float(position.get("notional")), 2),
+        liq_price=safe_float(position.get("est_liquidation_price")),
+        event_time=event_time / 1e9 if event_time else None,  # 纳秒 -> 秒
+    )
+
+def normalize_fill(fill: Dict[str, Any]) -> Dict[str, Any]:
+    """GRVT 原始成交 -> 本地存储格式"""
+    return {
+        "fill_id": str(fill.get("trade_id") or fill.get("order_id", "")) + ("-B" if fill.get("is_buyer") else "-S"),
+        "ts_ms": int(safe_float(fill.get("event_time")) // 1_000_000),
+        "instrument": fill.get("instrument", ""),
+        "side": "BUY" if fill.get("is_buyer") else "SELL",
+        "size": safe_float(fill.get("size")),
+        "price": safe_float(fill.get("price")),
+        "fee": safe_float(fill.get("fee")),
+        "realized_pnl": safe_float(fill.get("realized_pnl")),
+    }
+
+def load_grvt_accounts() -> List[GRVTAccount]:
+    """根据环境变量构造所有 GRVT 账户（不发起网络请求）"""
     accounts = get_all_accounts("grvt")
-    all_data = []
-    for i, acc in enumerate(accounts, 1):
-        api_key = acc["api_key"]
-        sub_account_id = acc["sub_account_id"]
-        account = GRVTAccount(api_key, sub_account_id, i)
-        data = {
-            "account_index": i,
-            "sub_account_id": sub_account_id,
-            "summary": account.get_summary(),
-            "positions": account.get_positions(),
-            "open_orders": account.get_open_orders(),
-            "fills": account.get_fills()
-        }
-        all_data.append(data)
-    return all_data
+    return [GRVTAccount(acc.api_key, acc.sub_account_id, i) for i, acc in enumerate(accounts, 1)]
+
+@register_adapter("grvt")
+class GRVTAdapter(ExchangeAdapter):
+    display_name = "GRVT"
+
+    def load_accounts(self) -> List[GRVTAccount]:
+        return load_grvt_accounts()
+
+    def normalize_summary(self, summary: Dict[str, Any]) -> BalanceRecord:
+        event_time = safe_float(summary.get("event_time"), default=None)
+        return BalanceRecord(
+            equity=safe_float(summary.get("total_equity") or summary.get("totalEquity")),
+            available=safe_float(summary.get("available_balance") or summary.get("availableBalance")),
+            event_time=event_time / 1e9 if event_time else None,  # 纳秒 -> 秒
+        )
+
+    def normalize_position(self, position: Dict[str, Any]) -> PositionRecord:
+        return parse_position(position)
+
+    def ws_connect_args(self, account: GRVTAccount) -> Tuple[str, Dict[str, str], List[Dict[str, Any]]]:
+        """GRVT 私有流使用登录 cookie 鉴权，按子账户订阅持仓流"""
+        ws = self.config.get("ws", {})
+        headers = account.headers
+        if not headers:
+            raise RuntimeError(f"GRVT 账户{account.account_index} 登录失败，无法订阅")
+        auth_headers = {"Cookie": headers["Cookie"], "X-Grvt-Account-Id": headers["X-Grvt-Account-Id"]}
+        messages = [
+            {"jsonrpc": "2.0", "method": "subscribe",
+             "params": {"stream": stream, "selectors": [account.sub_account_id]}, "id": i}
+            for i, stream in enumerate(ws.get("streams", ["v1.position"]), 1)
+        ]
+        return ws["url"], auth_headers, messages
+
+    def parse_ws_message(self, message: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        stream, feed = message.get("stream", ""), message.get("feed")
+        if not feed:
+            return []  # subscribe 应答
+        if "position" in stream:
+            return [("position", parse_position(feed))]
+        if "summary" in stream:
+            return [("balance", self.normalize_summary(feed))]
+        return []
+
+    def fetch_market_data(self, symbols: List[str]) -> Dict[str, MarketRecord]:
+        """
+        GRVT 的 ticker / mini ticker 都只接受单个合约，没有全市场批量接口：
+        按合约去重后每个合约请求一次（与账户数量无关），经抓取引擎并发执行，受 max_concurrency 约束
+        """
+        url = f"{self.config['market_data_url']}/{self.config['endpoints']['ticker']}"
+        session = get_session(url)
+
+        def fetch_ticker(symbol: str) -> MarketRecord:
+            response = session.post(url, json={"instrument": symbol}, timeout=10)
+            if response.status_code != 200:
+                raise RuntimeError(f"GRVT ticker {symbol} 查询失败: {response.status_code}")
+            ticker = response_json(response).get("result", {})
+            event_time = safe_float(ticker.get("event_time"), default=None)
+            return MarketRecord(
+                symbol=symbol,
+                mark=safe_float(ticker.get("mark_price")),
+                # funding_rate_8h_curr 以百分比表示，转成小数
+                funding_rate=safe_float(ticker.get("funding_rate_8h_curr")) / 100,
+                event_time=event_time / 1e9 if event_time else None,
+            )
+
+        unique = sorted(set(symbols))
+        return dict(zip(unique, get_engine().map_venue(self.name, fetch_ticker, unique)))
+
+    def iter_funding(self, symbol: str, since_ms: int, page_size: int = 1000) -> Iterator[List[Tuple[int, float]]]:
+        """
+        公共资金费率历史：时间戳为纳秒字符串，funding_rate 以百分比表示且对应各自的 funding_interval_hours，
+        统一换算成每 funding_period_hours 的小数费率
+        """
+        url = f"{self.config['market_data_url']}/{self.config['endpoints']['funding']}"
+        session = get_session(url)
+        period = self.funding_period_hours
+        cursor = ""
+        while True:
+            payload = {"instrument": symbol, "start_time": str(int(since_ms) * 1_000_000), "limit": page_size}
+            if cursor:
+                payload["cursor"] = cursor
+            response = session.post(url, json=payload, timeout=10)
+            if response.status_code != 200:
+                raise RuntimeError(f"GRVT funding {symbol} 查询失败: {response.status_code}")
+            data = response_json(response)
+            page = data.get("result", []) if isinstance(data, dict) else data
+            if page:
+                yield [(int(safe_float(item.get("funding_time")) // 1_000_000),
+                        safe_float(item.get("funding_rate")) / 100 * period
+                        / (safe_float(item.get("funding_interval_hours")) or period))
+                       for item in page]
+            cursor = data.get("next", "") if isinstance(data, dict) else ""
+            if not page or not cursor:
+                break
+
+def get_all_grvt_data(plan=FULL_PLAN) -> List[Dict[str, Any]]:
+    """返回所有 GRVT 账户中 plan 指定的数据集（summary/positions 为标准化记录）"""
+    adapter = GRVTAdapter(get_exchange_config("grvt"))
+    return get_engine().fetch_accounts({adapter: adapter.load_accounts()}, plan)["grvt"]
@@ -1,7 +1,53 @@
-import requests
+import base64
 import json
-from typing import List, Dict, Any
-from utils.config_loader import get_all_accounts, get_exchange_config
+from typing import List, Dict, Any, Iterator, Tuple
+from utils.config_loader import get_all_accounts, get_exchange_config, get_fetch_config
+from utils.http_session import get_session
+from utils.json_codec import response_json
+from exchanges.base import BalanceRecord, ExchangeAdapter, MarketRecord, PositionRecord
+from exchanges.registry import register_adapter
+from fetcher import get_engine, FULL_PLAN
+
+def _jwt_subject(jwt: str) -> str:
+    """从 JWT payload 中取出 sub（账户地址），作为跨进程稳定的账户标识；不做签名校验"""
+    try:
+        payload = jwt.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return str(json.loads(base64.urlsafe_b64decode(payload)).get("sub", ""))
+    except Exception:
+        return ""
+
+def _float(value, default=0.0):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+def parse_position(pos: Dict[str, Any]) -> PositionRecord:
+    """
+    Paradex 原始持仓（REST 与 WebSocket 共用）-> 标准化记录
+    mark_price 从 unrealized_pnl 反推，不修改原始 dict
+    """
+    symbol = pos.get("market", "")
+    size = _float(pos.get("size", 0))
+    mark_price = _float(pos.get("mark_price"))
+    if size != 0:
+        entry_price = _float(pos.get("average_entry_price", 0))
+        unrealized_pnl = _float(pos.get("unrealized_pnl", 0))
+        if size > 0:  # LONG
+            mark_price = round(entry_price + unrealized_pnl / size, 6)
+        else:  # SHORT
+            mark_price = round(entry_price - unrealized_pnl / abs(size), 6)
+    updated_at = _float(pos.get("last_updated_at"), default=None)
+    return PositionRecord(
+        symbol=symbol,
+        instrument=symbol.split("-")[0] + "-PERP" if "-" in symbol else "N/A",
+        size=size,
+        mark=mark_price,
+        notional=size * mark_price,
+        liq_price=_float(pos.get("liquidation_price")),
+        event_time=updated_at / 1000 if updated_at else None,  # 毫秒 -> 秒
+    )
 
 class ParadexAccount:
     def __init__(self, jwt: str, account_index: int):
@@ -9,89 +55,185 @@ class ParadexAccount:
         self.account_index = account_index
         self.config = get_exchange_config("paradex")
         self.base_url = self.config["base_url"]
+        self.account_key = _jwt_subject(jwt) or str(account_index)
+        self.session = get_session(self.base_url)
+        self.keep_raw = get_fetch_config().keep_raw
+        self.raw_payloads: Dict[str, Any] = {}  # 仅 keep_raw 时保存：数据集 -> 最近一次原始响应
         self.headers = {
             "Authorization": f"Bearer {self.jwt}",
             "Content-Type": "application/json",
             "Accept": "application/json"
         }
 
+    def account_info(self) -> Dict[str, Any]:
+        return {"account_index": self.account_index, "account_key": self.account_key}
+
+    def _json(self, dataset: str, response) -> Any:
+        """解析响应；开启 fetch.keep_raw 时按数据集保留原始 JSON 供调试"""
+        data = response_json(response)
+        if self.keep_raw:
+            self.raw_payloads[dataset] = data
+        return data
+
     def get_summary(self) -> Dict[str, Any]:
         """获取账户资产总结"""
         url = f"{self.base_url}/{self.config['endpoints']['summary']}"
-        response = requests.get(url, headers=self.headers, timeout=30)
+        response = self.session.get(url, headers=self.headers, timeout=30)
         if response.status_code == 200:
-            data = response.json()
+            data = self._json("summary", response)
             if isinstance(data, list) and data:
                 return data[0]
-        print(f"Paradex 账户{self.account_index} summary 查询失败: {response.status_code} {response.text}")
-        return {}
+            return {}
+        raise RuntimeError(f"Paradex 账户{self.account_index} summary 查询失败: {response.status_code} {response.text[:200]}")
 
-    def get_positions(self) -> List[Dict[str, Any]]:
-        """获取持仓，并从 unrealized_pnl 精确反推 mark_price 和 notional_value，只返回真实持仓 (size != 0)"""
+    def get_positions(self) -> List[PositionRecord]:
+        """
+        获取持仓，只返回真实持仓 (size != 0)，直接投影为标准化记录
+        mark_price 以公共行情 (market_data) 为准，这里从 unrealized_pnl 反推的值只在行情不可用时兜底
+        """
         url = f"{self.base_url}/{self.config['endpoints']['positions']}"
-        response = requests.get(url, headers=self.headers, timeout=30)
+        response = self.session.get(url, headers=self.headers, timeout=30)
         if response.status_code == 200:
-            data = response.json()
+            data = self._json("positions", response)
             positions = data.get("results", []) if isinstance(data, dict) else data
-            
-            filtered_positions = []
-            for pos in positions:
-                size = float(pos.get("size", 0))
-                if size == 0:
-                    continue  # 跳过已平仓的历史记录
-                
-                entry_price = float(pos.get("average_entry_price", 0))
-                unrealized_pnl = float(pos.get("unrealized_pnl", 0))
-                
-                if size > 0:  # LONG
-                    mark_price = entry_price + unrealized_pnl / size
-                else:  # SHORT
-                    mark_price = entry_price - unrealized_pnl / abs(size)
-                
-                pos["mark_price"] = round(mark_price, 6)
-                pos["notional_value"] = round(abs(size) * mark_price, 2)
-                
-                filtered_positions.append(pos)
-            
-            return filtered_positions
+            # 跳过已平仓的历史记录
+            return [parse_position(pos) for pos in positions if _float(pos.get("size", 0)) != 0]
         
-        print(f"Paradex 账户{self.account_index} positions 查询失败: {response.status_code} {response.text}")
-        return []
+        raise RuntimeError(f"Paradex 账户{self.account_index} positions 查询失败: {response.status_code} {response.text[:200]}")
 
     def get_open_orders(self) -> List[Dict[str, Any]]:
         url = f"{self.base_url}/{self.config['endpoints']['open_orders']}"
-        response = requests.get(url, headers=self.headers, timeout=30)
+        response = self.session.get(url, headers=self.headers, timeout=30)
         if response.status_code == 200:
-            data = response.json()
+            data = self._json("open_orders", response)
             return data if isinstance(data, list) else []
         elif response.status_code == 404:
             return []  # 无挂单正常
-        print(f"Paradex 账户{self.account_index} open_orders 查询失败: {response.status_code}")
-        return []
+        raise RuntimeError(f"Paradex 账户{self.account_index} open_orders 查询失败: {response.status_code}")
 
     def get_fills(self, limit: int = 500) -> List[Dict[str, Any]]:
+        """最近的成交，返回标准化后的成交（与 iter_fills 相同格式）"""
         url = f"{self.base_url}/{self.config['endpoints']['fills']}"
         params = {"limit": limit}
-        response = requests.get(url, headers=self.headers, params=params, timeout=30)
+        response = self.session.get(url, headers=self.headers, params=params, timeout=30)
         if response.status_code == 200:
-            data = response.json()
-            return data if isinstance(data, list) else []
-        print(f"Paradex 账户{self.account_index} fills 查询失败: {response.status_code}")
-        return []
+            data = self._json("fills", response)
+            fills = data.get("results", []) if isinstance(data, dict) else data
+            return [normalize_fill(f) for f in fills]
+        raise RuntimeError(f"Paradex 账户{self.account_index} fills 查询失败: {response.status_code}")
+
+    def iter_fills(self, since_ms: int = 0, page_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """从 since_ms（含）开始按 cursor 向后翻页拉取成交，每页返回标准化后的成交列表"""
+        url = f"{self.base_url}/{self.config['endpoints']['fills']}"
+        params = {"start_at": int(since_ms), "page_size": page_size}
+        while True:
+            response = self.session.get(url, headers=self.headers, params=params, timeout=30)
+            if response.status_code != 200:
+                raise RuntimeError(f"Paradex 账户{self.account_index} fills 翻页失败: {response.status_code}")
+            data = response_json(response)
+            page = data.get("results", []) if isinstance(data, dict) else data
+            if page:
+                yield [normalize_fill(f) for f in page]
+            cursor = data.get("next") if isinstance(data, dict) else None
+            if not page or not cursor:
+                break
+            params = {"start_at": int(since_ms), "page_size": page_size, "cursor": cursor}
+
+def normalize_fill(fill: Dict[str, Any]) -> Dict[str, Any]:
+    """Paradex 原始成交 -> 本地存储格式（created_at 为毫秒）"""
+    return {
+        "fill_id": str(fill.get("id", "")),
+        "ts_ms": int(_float(fill.get("created_at"))),
+        "instrument": fill.get("market", ""),
+        "side": str(fill.get("side", "")).upper(),
+        "size": _float(fill.get("size")),
+        "price": _float(fill.get("price")),
+        "fee": _float(fill.get("fee")),
+        "realized_pnl": _float(fill.get("realized_pnl")),
+    }
 
-def get_all_paradex_data() -> List[Dict[str, Any]]:
-    """返回所有 Paradex 账户的完整数据"""
+def load_paradex_accounts() -> List[ParadexAccount]:
+    """根据环境变量构造所有 Paradex 账户（不发起网络请求）"""
     accounts = get_all_accounts("paradex")
-    all_data = []
-    for i, acc in enumerate(accounts, 1):
-        jwt = acc["jwt"]
-        account = ParadexAccount(jwt, i)
-        data = {
-            "account_index": i,
-            "summary": account.get_summary(),
-            "positions": account.get_positions(),
-            "open_orders": account.get_open_orders(),
-            "fills": account.get_fills()
-        }
-        all_data.append(data)
-    return all_data
+    return [ParadexAccount(acc.jwt, i) for i, acc in enumerate(accounts, 1)]
+
+@register_adapter("paradex")
+class ParadexAdapter(ExchangeAdapter):
+    display_name = "Paradex"
+
+    def load_accounts(self) -> List[ParadexAccount]:
+        return load_paradex_accounts()
+
+    def normalize_summary(self, summary: Dict[str, Any]) -> BalanceRecord:
+        updated_at = _float(summary.get("updated_at"), default=None)
+        return BalanceRecord(
+            equity=_float(summary.get("account_value")),
+            available=_float(summary.get("free_collateral")),
+            event_time=updated_at / 1000 if updated_at else None,  # 毫秒 -> 秒
+        )
+
+    def normalize_position(self, position: Dict[str, Any]) -> PositionRecord:
+        return parse_position(position)
+
+    def ws_connect_args(self, account: ParadexAccount) -> Tuple[str, Dict[str, str], List[Dict[str, Any]]]:
+        """Paradex 私有频道：先 auth 再订阅 positions / account"""
+        ws = self.config.get("ws", {})
+        messages = [{"jsonrpc": "2.0", "method": "auth", "params": {"bearer": account.jwt}, "id": 0}]
+        for i, channel in enumerate(ws.get("channels", ["positions", "account"]), 1):
+            messages.append({"jsonrpc": "2.0", "method": "subscribe", "params": {"channel": channel}, "id": i})
+        return ws["url"], {}, messages
+
+    def parse_ws_message(self, message: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        if message.get("method") != "subscription":
+            return []  # auth / subscribe 的应答
+        params = message.get("params", {})
+        channel, data = params.get("channel"), params.get("data")
+        if not data:
+            return []
+        if channel == "positions":
+            return [("position", parse_position(data))]
+        if channel == "account":
+            return [("balance", self.normalize_summary(data))]
+        return []
+
+    def fetch_market_data(self, symbols: List[str]) -> Dict[str, MarketRecord]:
+        """一次请求取回全市场 mark price（markets/summary?market=ALL）"""
+        url = f"{self.config['base_url']}/{self.config['public_markets_summary']}"
+        response = get_session(url).get(url, params={"market": "ALL"}, timeout=10)
+        if response.status_code != 200:
+            raise RuntimeError(f"Paradex markets/summary 查询失败: {response.status_code}")
+        data = response_json(response)
+        records = {}
+        for market in data.get("results", []) if isinstance(data, dict) else data:
+            symbol = market.get("symbol", "")
+            created_at = _float(market.get("created_at"), default=None)
+            records[symbol] = MarketRecord(
+                symbol=symbol,
+                mark=_float(market.get("mark_price")),
+                funding_rate=_float(market.get("funding_rate")),
+                event_time=created_at / 1000 if created_at else None,
+            )
+        return records
+
+    def iter_funding(self, symbol: str, since_ms: int, page_size: int = 1000) -> Iterator[List[Tuple[int, float]]]:
+        """公共资金费率历史（funding/data），created_at 为毫秒，funding_rate 为每 funding_period_hours 的费率"""
+        url = f"{self.config['base_url']}/{self.config['public_funding_data']}"
+        session = get_session(url)
+        params = {"market": symbol, "start_at": int(since_ms), "page_size": page_size}
+        while True:
+            response = session.get(url, params=params, timeout=10)
+            if response.status_code != 200:
+                raise RuntimeError(f"Paradex funding {symbol} 查询失败: {response.status_code}")
+            data = response_json(response)
+            page = data.get("results", []) if isinstance(data, dict) else data
+            if page:
+                yield [(int(_float(item.get("created_at"))), _float(item.get("funding_rate"))) for item in page]
+            cursor = data.get("next") if isinstance(data, dict) else None
+            if not page or not cursor:
+                break
+            params = {"market": symbol, "start_at": int(since_ms), "page_size": page_size, "cursor": cursor}
+
+def get_all_paradex_data(plan=FULL_PLAN) -> List[Dict[str, Any]]:
+    """返回所有 Paradex 账户中 plan 指定的数据集（summary/positions 为标准化记录）"""
+    adapter = ParadexAdapter(get_exchange_config("paradex"))
+    return get_engine().fetch_accounts({adapter: adapter.load_accounts()}, plan)["paradex"]
@@ -0,0 +1,32 @@
+import importlib
+from typing import Dict, List, Type
+from exchanges.base import ExchangeAdapter
+from utils.config_loader import get_exchange_config, list_all_exchanges
+
+_ADAPTERS: Dict[str, Type[ExchangeAdapter]] = {}
+
+
+def register_adapter(name: str):
+    """类装饰器：把适配器登记到注册表"""
+    def decorator(cls: Type[ExchangeAdapter]) -> Type[ExchangeAdapter]:
+        cls.name = name
+        if not cls.display_name:
+            cls.display_name = name
+        _ADAPTERS[name] = cls
+        return cls
+    return decorator
+
+
+def get_adapter(name: str) -> ExchangeAdapter:
+    """按名称实例化适配器；模块默认为 exchanges.<name>，可在 yaml 中用 adapter 字段指定"""
+    config = get_exchange_config(name)
+    if name not in _ADAPTERS:
+        importlib.import_module(config.get("adapter", f"exchanges.{name}"))
+    if name not in _ADAPTERS:
+        raise ValueError(f"交易所 {name} 没有注册适配器")
+    return _ADAPTERS[name](config)
+
+
+def get_adapters() -> List[ExchangeAdapter]:
+    """exchanges.yaml 中列出的所有交易所的适配器，顺序与配置一致"""
+    return [get_adapter(name) for name in list_all_exchanges()]
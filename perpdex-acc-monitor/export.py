@@ -0,0 +1,295 @@
+import csv
+import io
+import json
+import os
+import socket
+import threading
+import time
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from fetcher import STATUS_FAILED, STATUS_STALE
+
+try:  # Parquet 输出为可选功能
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# 每类记录的固定列（CSV 表头 / Parquet schema 与之一致）
+COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "total": ("ts", "equity", "net", "gross", "gross_leverage", "accounts", "stale_accounts", "failed_accounts",
+              "oldest_as_of", "skew"),
+    "venues": ("ts", "venue", "equity", "net", "gross", "gross_leverage"),
+    "accounts": ("ts", "venue", "account", "label", "status", "as_of", "event_time", "equity", "available",
+                 "net", "gross", "net_leverage", "gross_leverage"),
+    "positions": ("ts", "venue", "account", "instrument", "size", "mark", "notional", "liq_price"),
+}
+KINDS = tuple(COLUMNS)
+# 非浮点列的类型（Parquet schema 用），其余列均为 float64；时间列可能为空 (null)
+COLUMN_TYPES: Dict[str, str] = {
+    "venue": "string", "account": "string", "label": "string", "status": "string", "instrument": "string",
+    "accounts": "int64", "stale_accounts": "int64", "failed_accounts": "int64",
+}
+FORMATS = ("ndjson", "csv", "parquet")
+
+
+def _leverage(gross: float, equity: float) -> float:
+    return round(gross / equity, 4) if equity > 0 else 0.0
+
+
+def snapshot_records(snapshot, kind: str) -> List[Dict[str, Any]]:
+    """
+    把快照 (aggregator.Snapshot) 的列式汇总展开为扁平记录，不经过展示层和图片
+    ts 为快照时间（Unix 秒）；account 为 account_key（GRVT 子账户 ID / Paradex 地址）
+    as_of 为本地接收时间，event_time 为交易所事件时间；oldest_as_of / skew 为各账户接收时间的最小值和跨度
+    """
+    table, aggs, ts = snapshot.table, snapshot.aggs, snapshot.taken_at
+    if kind == "total":
+        statuses = [meta["status"] for meta in table.account_meta]
+        return [{
+            "ts": ts, "equity": aggs["total_equity"], "net": aggs["total_net"], "gross": aggs["total_gross"],
+            "gross_leverage": _leverage(aggs["total_gross"], aggs["total_equity"]),
+            "accounts": table.n_accounts,
+            "stale_accounts": statuses.count(STATUS_STALE),
+            "failed_accounts": statuses.count(STATUS_FAILED),
+            "oldest_as_of": snapshot.timing["oldest"], "skew": round(snapshot.timing["skew"], 3),
+        }]
+    if kind == "venues":
+        equity, net, gross = (aggs[f"venue_{k}"].tolist() for k in ("equity", "net", "gross"))
+        return [{"ts": ts, "venue": venue, "equity": equity[v], "net": net[v], "gross": gross[v],
+                 "gross_leverage": _leverage(gross[v], equity[v])}
+                for v, venue in enumerate(table.venues)]
+
+    venue_of = [table.venues[v] for v in table.account_venue.tolist()]
+    if kind == "accounts":
+        columns = zip(table.account_equity.tolist(), table.account_available.tolist(),
+                      aggs["account_net"].tolist(), aggs["account_gross"].tolist(),
+                      aggs["account_net_leverage"].tolist(), aggs["account_gross_leverage"].tolist())
+        return [{"ts": ts, "venue": venue_of[i], "account": meta["account_key"], "label": meta["label"],
+                 "status": meta["status"], "as_of": meta.get("as_of"), "event_time": meta.get("event_time"),
+                 "equity": equity, "available": available,
+                 "net": net, "gross": gross, "net_leverage": net_lev, "gross_leverage": gross_lev}
+                for i, (meta, (equity, available, net, gross, net_lev, gross_lev))
+                in enumerate(zip(table.account_meta, columns))]
+    if kind == "positions":
+        keys = [meta["account_key"] for meta in table.account_meta]
+        return [{"ts": ts, "venue": venue_of[a], "account": keys[a], "instrument": table.instruments[code],
+                 "size": size, "mark": mark, "notional": notional, "liq_price": liq}
+                for a, code, size, mark, notional, liq in zip(
+                    table.pos_account.tolist(), table.pos_instrument.tolist(), table.size.tolist(),
+                    table.mark.tolist(), table.notional.tolist(), table.liq_price.tolist())]
+    raise ValueError(f"未知的记录类型: {kind}，可选: {list(KINDS)}")
+
+
+# ---- 编码 ----
+
+class NdjsonEncoder:
+    """每条记录一行 JSON；导出多类记录时附带 kind 字段区分"""
+
+    header = b""
+
+    def __init__(self, kinds: Tuple[str, ...]):
+        self.kinds = kinds
+
+    def encode(self, snapshot) -> bytes:
+        lines = []
+        for kind in self.kinds:
+            for record in snapshot_records(snapshot, kind):
+                if len(self.kinds) > 1:
+                    record = {"kind": kind, **record}
+                lines.append(json.dumps(record, separators=(",", ":"), ensure_ascii=False))
+        return ("\n".join(lines) + "\n").encode() if lines else b""
+
+
+class CsvEncoder:
+    """单一记录类型的 CSV；表头由输出端在新文件 / 新连接开头写一次"""
+
+    def __init__(self, kinds: Tuple[str, ...]):
+        if len(kinds) != 1:
+            raise ValueError("CSV 每个输出只能包含一类记录，请用 --kind 指定其中一类")
+        self.kind = kinds[0]
+        self.header = self._rows([dict(zip(COLUMNS[self.kind], COLUMNS[self.kind]))])
+
+    def _rows(self, records: List[Dict[str, Any]]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, COLUMNS[self.kind], lineterminator="\n")
+        writer.writerows(records)
+        return buffer.getvalue().encode()
+
+    def encode(self, snapshot) -> bytes:
+        return self._rows(snapshot_records(snapshot, self.kind))
+
+
+# ---- 输出端 ----
+
+class StreamSink:
+    """stdout 或已打开的二进制流"""
+
+    def __init__(self, stream: BinaryIO, header: bytes):
+        self.stream = stream
+        self.stream.write(header)
+
+    def write(self, payload: bytes):
+        self.stream.write(payload)
+        self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+
+
+class FileSink(StreamSink):
+    """追加写入文件；文件不存在或为空时先写表头"""
+
+    def __init__(self, path: str, header: bytes):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        super().__init__(open(path, "ab"), header if new else b"")
+
+    def close(self):
+        self.stream.close()
+
+
+class UnixSocketSink:
+    """
+    监听一个 Unix socket，把每个快照广播给所有已连接的客户端（新连接先收到表头）
+    写入超时或断开的客户端直接丢弃，不拖慢抓取循环
+    """
+
+    def __init__(self, path: str, header: bytes, send_timeout: float = 1.0):
+        self.path = path
+        self.header = header
+        self.send_timeout = send_timeout
+        self._clients: List[socket.socket] = []
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            os.unlink(path)  # 上次异常退出留下的 socket 文件
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen()
+        threading.Thread(target=self._accept_loop, name="export-accept", daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return  # 已关闭
+            client.settimeout(self.send_timeout)
+            try:
+                client.sendall(self.header)
+            except OSError:
+                client.close()
+                continue
+            with self._lock:
+                self._clients.append(client)
+
+    def write(self, payload: bytes):
+        with self._lock:
+            clients = list(self._clients)
+        dead = []
+        for client in clients:
+            try:
+                client.sendall(payload)
+            except OSError:
+                dead.append(client)
+        if dead:
+            with self._lock:
+                self._clients = [c for c in self._clients if c not in dead]
+            for client in dead:
+                client.close()
+
+    def close(self):
+        self._server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients = []
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class Exporter:
+    """编码器 + 输出端：write(snapshot) 把一个快照写出"""
+
+    def __init__(self, encoder, sink):
+        self.encoder = encoder
+        self.sink = sink
+
+    def write(self, snapshot):
+        payload = self.encoder.encode(snapshot)
+        if payload:
+            self.sink.write(payload)
+
+    def close(self):
+        self.sink.close()
+
+
+def parquet_schema(kind: str):
+    """按 COLUMNS 固定的 schema，不从第一批数据推断（整列为 None 时会被推断成 null 类型）"""
+    return pa.schema([(name, getattr(pa, COLUMN_TYPES.get(name, "float64"))()) for name in COLUMNS[kind]])
+
+
+class ParquetExporter:
+    """
+    Parquet 只能写文件：每次运行一个文件，每个快照一个 row group，close() 时写入文件尾
+    Parquet 文件无法追加，路径已存在时先把旧文件改名为 <文件名>.<时间>.parquet 保留，而不是覆盖
+    """
+
+    def __init__(self, path: str, kinds: Tuple[str, ...]):
+        if pq is None:
+            raise RuntimeError("Parquet 输出需要安装 pyarrow（pip install pyarrow）")
+        if len(kinds) != 1:
+            raise ValueError("Parquet 每个文件只能包含一类记录，请用 --kind 指定其中一类")
+        self.kind = kinds[0]
+        self.path = path
+        self.schema = parquet_schema(self.kind)
+        self._writer = None
+
+    def _rotate(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        stem, ext = os.path.splitext(self.path)
+        rotated = f"{stem}.{time.strftime('%Y%m%d-%H%M%S')}{ext or '.parquet'}"
+        os.replace(self.path, rotated)
+        print(f"{self.path} 已存在，旧文件改名为 {rotated}")
+
+    def write(self, snapshot):
+        records = snapshot_records(snapshot, self.kind)
+        if not records:
+            return
+        table = pa.Table.from_pylist(records, schema=self.schema)
+        if self._writer is None:
+            self._rotate()
+            self._writer = pq.ParquetWriter(self.path, self.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_exporter(fmt: str, output: str, kinds: Tuple[str, ...],
+                  stdout: Optional[BinaryIO] = None):
+    """
+    output: "-" 为标准输出，"unix:<路径>" 为 Unix socket（本进程监听），其余为文件路径
+    stdout 为写 "-" 时使用的二进制流（CLI 会把日志重定向到 stderr，数据走原来的 stdout）
+    """
+    unknown = [kind for kind in kinds if kind not in COLUMNS]
+    if unknown:
+        raise ValueError(f"未知的记录类型: {unknown}，可选: {list(KINDS)}")
+    if fmt == "parquet":
+        if output == "-" or output.startswith("unix:"):
+            raise ValueError("Parquet 只支持输出到文件")
+        return ParquetExporter(output, kinds)
+    if fmt == "ndjson":
+        encoder = NdjsonEncoder(kinds)
+    elif fmt == "csv":
+        encoder = CsvEncoder(kinds)
+    else:
+        raise ValueError(f"未知的输出格式: {fmt}，可选: {list(FORMATS)}")
+
+    if output == "-":
+        sink = StreamSink(stdout or os.fdopen(os.dup(1), "wb"), encoder.header)
+    elif output.startswith("unix:"):
+        sink = UnixSocketSink(output[len("unix:"):], encoder.header)
+    else:
+        sink = FileSink(output, encoder.header)
+    return Exporter(encoder, sink)
@@ -0,0 +1,197 @@
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+from columnar import PositionTable, underlying
+from fetcher import STATUS_FAILED
+from utils.config_loader import get_hedge_config
+
+AccountKey = Tuple[str, str]          # (venue, account_key)
+LegKey = Tuple[str, str, str]         # (venue, account_key, instrument)
+
+
+class UnderlyingExposure:
+    """一个标的在所有交易所 / 账户上的持仓腿，以及随腿增量维护的多空合计"""
+
+    __slots__ = ("underlying", "legs", "long", "short")
+
+    def __init__(self, name: str):
+        self.underlying = name
+        self.legs: Dict[LegKey, float] = {}   # -> 名义价值（带方向）
+        self.long = 0.0
+        self.short = 0.0
+
+    @property
+    def net(self) -> float:
+        return self.long - self.short
+
+    @property
+    def gross(self) -> float:
+        return self.long + self.short
+
+    def drift_pct(self) -> Optional[float]:
+        """对冲偏离：|净敞口| / 较大一侧，只有同时存在多空两侧时才有意义"""
+        if self.long <= 0 or self.short <= 0:
+            return None
+        return abs(self.net) / max(self.long, self.short) * 100
+
+    def _set(self, key: LegKey, notional: float):
+        old = self.legs.pop(key, 0.0)
+        if old > 0:
+            self.long -= old
+        else:
+            self.short += old
+        if notional != 0:
+            self.legs[key] = notional
+            if notional > 0:
+                self.long += notional
+            else:
+                self.short -= notional
+        if not self.legs:
+            self.long = self.short = 0.0  # 清掉累计的浮点误差
+
+
+class ExposureIndex:
+    """
+    标的 -> 各持仓腿的哈希索引，跨交易所、跨账户按标的净额
+    - update / replace_account 只改动变化的腿，按标的的合计随之增量更新
+    - get(标的) 为 O(1)，不需要重新扫描所有账户
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._underlyings: Dict[str, UnderlyingExposure] = {}
+        self._accounts: Dict[AccountKey, Set[str]] = {}  # 账户 -> 持有的合约，用于找出已平仓的腿
+        self.labels: Dict[AccountKey, str] = {}
+
+    def _update(self, venue: str, account_key: str, instrument: str, notional: float):
+        name = underlying(instrument)
+        bucket = self._underlyings.get(name)
+        if bucket is None:
+            if notional == 0:
+                return
+            bucket = self._underlyings[name] = UnderlyingExposure(name)
+        bucket._set((venue, account_key, instrument), notional)
+        held = self._accounts.setdefault((venue, account_key), set())
+        if notional != 0:
+            held.add(instrument)
+        else:
+            held.discard(instrument)
+        if not bucket.legs:
+            del self._underlyings[name]
+
+    def update(self, venue: str, account_key: str, instrument: str, notional: float):
+        """单条持仓变化；notional 为 0 表示平仓"""
+        with self._lock:
+            self._update(venue, account_key, instrument, notional)
+
+    def replace_account(self, venue: str, account_key: str, legs: Dict[str, float]):
+        """用账户的完整持仓替换旧状态，只有新增、变化和消失的腿会被改动"""
+        with self._lock:
+            self._replace_account(venue, account_key, legs)
+
+    def _replace_account(self, venue: str, account_key: str, legs: Dict[str, float]):
+        for instrument in self._accounts.get((venue, account_key), set()) - legs.keys():
+            self._update(venue, account_key, instrument, 0.0)
+        for instrument, notional in legs.items():
+            bucket = self._underlyings.get(underlying(instrument))
+            current = bucket.legs.get((venue, account_key, instrument)) if bucket else None
+            if current != notional:
+                self._update(venue, account_key, instrument, notional)
+
+    def sync_table(self, table: PositionTable):
+        """
+        按一张快照持仓表同步：逐账户替换，快照中已不存在的账户整体移除
+        抓取失败（没有数据）的账户保留上一次的腿
+        """
+        legs: List[Dict[str, float]] = [{} for _ in range(table.n_accounts)]
+        for account_id, code, notional in zip(table.pos_account.tolist(), table.pos_instrument.tolist(),
+                                              table.notional.tolist()):
+            instrument = table.instruments[code]
+            legs[account_id][instrument] = legs[account_id].get(instrument, 0.0) + notional
+
+        with self._lock:
+            present = set()
+            for account_id, meta in enumerate(table.account_meta):
+                key = (table.venues[table.account_venue[account_id]], meta["account_key"])
+                present.add(key)
+                self.labels[key] = meta["label"]
+                if meta.get("status") != STATUS_FAILED:
+                    self._replace_account(key[0], key[1], legs[account_id])
+            for key in [key for key in self._accounts if key not in present]:
+                self._replace_account(key[0], key[1], {})
+                del self._accounts[key]
+                self.labels.pop(key, None)
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """O(1) 查询一个标的（BTC / BTC_USDT_Perp / BTC-USD-PERP 都可以）"""
+        with self._lock:
+            bucket = self._underlyings.get(underlying(name))
+            return self._describe(bucket) if bucket else None
+
+    def _describe(self, bucket: UnderlyingExposure) -> Dict[str, Any]:
+        return {
+            "underlying": bucket.underlying,
+            "net": bucket.net,
+            "gross": bucket.gross,
+            "long": bucket.long,
+            "short": bucket.short,
+            "drift_pct": bucket.drift_pct(),
+            "legs": [
+                {"account": self.labels.get((venue, account_key), f"{venue}:{account_key}"),
+                 "instrument": instrument, "notional": notional}
+                for (venue, account_key, instrument), notional in bucket.legs.items()
+            ],
+        }
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """所有标的，按总敞口从大到小"""
+        with self._lock:
+            rows = [self._describe(bucket) for bucket in self._underlyings.values()]
+        return sorted(rows, key=lambda row: row["gross"], reverse=True)
+
+    def mismatches(self, tolerance_pct: Optional[float] = None,
+                   min_notional: Optional[float] = None) -> List[Dict[str, Any]]:
+        """两侧都有仓位、但净敞口超过较大一侧 tolerance_pct% 且不小于 min_notional 的标的"""
+        config = get_hedge_config()
+        tolerance_pct = config.tolerance_pct if tolerance_pct is None else tolerance_pct
+        min_notional = config.min_notional if min_notional is None else min_notional
+        return [
+            row for row in self.summary()
+            if row["drift_pct"] is not None and row["drift_pct"] > tolerance_pct
+            and abs(row["net"]) >= min_notional
+        ]
+
+
+def format_exposure(index: ExposureIndex, name: Optional[str] = None) -> str:
+    """/exposure 的文字回复：全部标的概览，或单个标的的各条腿"""
+    tolerance = get_hedge_config().tolerance_pct
+    if name:
+        row = index.get(name)
+        if row is None:
+            return f"没有 {name.upper()} 的持仓"
+        lines = [f"{row['underlying']}: 净 ${row['net']:,.0f} / 总 ${row['gross']:,.0f}"]
+        for leg in sorted(row["legs"], key=lambda leg: leg["notional"]):
+            lines.append(f"  {leg['account']} {leg['instrument']}: ${leg['notional']:,.0f}")
+        return "\n".join(lines)
+
+    flagged = {row["underlying"] for row in index.mismatches()}
+    lines = []
+    for row in index.summary():
+        line = f"{row['underlying']}: 净 ${row['net']:,.0f} / 总 ${row['gross']:,.0f}"
+        if row["drift_pct"] is not None:
+            line += f"（对冲偏离 {row['drift_pct']:.1f}%）"
+        if row["underlying"] in flagged:
+            line += f" ⚠️超过 {tolerance:g}%"
+        lines.append(line)
+    return "\n".join(lines) or "当前没有持仓"
+
+
+_index: Optional[ExposureIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_exposure_index() -> ExposureIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ExposureIndex()
+        return _index
@@ -0,0 +1,229 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import chain, zip_longest
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from utils import metrics
+from utils.config_loader import get_exchange_config, get_fetch_config
+
+# 每个数据集对应适配器上的 fetch_<dataset>(account) 方法，以及失败时的空值
+ENDPOINT_DEFAULTS = {
+    "summary": lambda: None,
+    "positions": list,
+    "open_orders": list,
+    "fills": list,
+}
+
+
+def fetch_plan(*datasets: str) -> Tuple[str, ...]:
+    """
+    声明式抓取计划：调用方列出自己需要的数据集，引擎只请求这些 endpoint
+    例: fetch_plan("summary", "positions")
+    """
+    unknown = [d for d in datasets if d not in ENDPOINT_DEFAULTS]
+    if unknown:
+        raise ValueError(f"未知的数据集: {unknown}，可选: {list(ENDPOINT_DEFAULTS)}")
+    return tuple(dict.fromkeys(datasets))  # 去重并保持顺序
+
+
+def merge_plans(*plans: Tuple[str, ...]) -> Tuple[str, ...]:
+    """合并多个调用方的抓取计划（例如同一轮既要出图又要算 PnL）"""
+    return fetch_plan(*(d for plan in plans for d in plan))
+
+
+FULL_PLAN = fetch_plan("summary", "positions", "open_orders", "fills")
+
+STATUS_OK = "ok"
+STATUS_STALE = "stale"    # 本次失败/超时，使用上一次成功的值
+STATUS_FAILED = "failed"  # 本次失败且没有可用的旧值
+
+
+class FetchEngine:
+    """
+    并发抓取引擎：把每个 (交易所, 账户, 数据集) 请求放入线程池并行执行，所有交易所通过适配器统一调度
+    - 每个交易所有独立的并发上限 (exchanges.yaml 中的 max_concurrency)，分片模式下每个进程占 share 比例
+    - 整次抓取有总 deadline，超时未返回的请求不再等待
+    - 失败或超时的数据用上一次成功的值代替并标记为 stale（as_of 为旧值的抓取时间），没有旧值则标记为 failed
+    - 每个数据集记录本地接收时间 (as_of) 和交易所事件时间 (event_time，数据不带时则为 None)
+    - max_staleness > 0 时只请求超过该年龄的数据集，其余直接复用上次成功的值（状态仍为 ok）
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, deadline: Optional[float] = None, share: float = 1.0):
+        config = get_fetch_config()
+        self.max_workers = max_workers or config.max_workers
+        self.deadline = deadline if deadline is not None else config.deadline
+        self.share = share
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        # (交易所, 账户, 数据集) -> (值, 本地接收时间, 交易所事件时间)
+        self._last_good: Dict[Tuple[str, str, str], Tuple[Any, float, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, exchange: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._semaphores.get(exchange)
+            if sem is None:
+                # 分片时向上取整：各进程合计可能略高于 max_concurrency，请求速率仍由令牌桶按比例限制
+                limit = math.ceil(int(get_exchange_config(exchange).get("max_concurrency", self.max_workers)) * self.share)
+                sem = threading.BoundedSemaphore(max(1, limit))
+                self._semaphores[exchange] = sem
+            return sem
+
+    @staticmethod
+    def _call(sem: threading.BoundedSemaphore, adapter: Any, account: Any, endpoint: str) -> Tuple[Any, float]:
+        """返回 (值, 本地接收时间)：接收时间取请求完成的时刻，而不是整轮抓取结束的时刻"""
+        with sem, metrics.timer("exchange_call", exchange=adapter.name, endpoint=endpoint,
+                                account=account.account_index):
+            value = getattr(adapter, f"fetch_{endpoint}")(account)
+        return value, time.time()
+
+    def map_venue(self, exchange: str, fn: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        """
+        对 items 逐项并发调用 fn，按原顺序返回结果，与账户请求共用该交易所的并发上限
+        用于交易所没有批量接口、只能逐项请求的数据（如 GRVT 单合约 ticker）；任一项失败时抛出该异常
+        """
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        sem = self._semaphore(exchange)
+
+        def call(item: Any) -> Any:
+            with sem:
+                return fn(item)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items)), thread_name_prefix="fetch") as executor:
+            return list(executor.map(call, items))
+
+    @staticmethod
+    def _fill(record: Dict[str, Any], endpoint: str, entry: Tuple[Any, float, Optional[float]], status: str):
+        record[endpoint], record["as_of"][endpoint], record["event_time"][endpoint] = entry
+        record["status"][endpoint] = status
+
+    def fetch_accounts(self, accounts_by_adapter: Dict[Any, List[Any]],
+                       plan: Tuple[str, ...] = FULL_PLAN,
+                       max_staleness: float = 0.0) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        按抓取计划并发抓取所有账户，accounts_by_adapter 为 {适配器: [账户, ...]}
+        返回 {adapter.name: [账户数据, ...]}，账户数据只包含 plan 中的数据集，另附 status / errors /
+        as_of / event_time 字段（均按数据集）
+        max_staleness > 0 时，上次成功结果不超过该秒数的数据集不再请求，只定向补抓过期的账户
+        """
+        started = time.monotonic()
+        now = time.time()
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        jobs = {}
+        reused = 0
+
+        pending = []
+        for adapter, accounts in accounts_by_adapter.items():
+            venue_jobs = []
+            records = []
+            for account in accounts:
+                record = account.account_info()
+                record["status"] = {}
+                record["errors"] = {}
+                record["as_of"] = {}
+                record["event_time"] = {}
+                records.append(record)
+                for endpoint in plan:
+                    cached = self._last_good.get((adapter.name, account.account_key, endpoint)) \
+                        if max_staleness > 0 else None
+                    if cached is not None and now - cached[1] <= max_staleness:
+                        self._fill(record, endpoint, cached, STATUS_OK)
+                        reused += 1
+                    else:
+                        venue_jobs.append((adapter, account, record, endpoint))
+            results[adapter.name] = records
+            pending.append(venue_jobs)
+        if max_staleness > 0:
+            metrics.inc("cache_lookups", reused, cache="fetch", result="hit")
+            metrics.inc("cache_lookups", sum(map(len, pending)), cache="fetch", result="miss")
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fetch")
+        try:
+            # 各交易所的请求交替提交：按交易所顺序提交时，线程池会被第一个交易所占满（多数线程阻塞在它的
+            # 并发信号量上），后面的交易所要等它全部完成才开始
+            for job in chain.from_iterable(zip_longest(*pending)):
+                if job is None:
+                    continue
+                adapter, account, record, endpoint = job
+                future = executor.submit(self._call, self._semaphore(adapter.name), adapter, account, endpoint)
+                jobs[future] = (adapter.name, account, record, endpoint)
+
+            done, _ = wait(jobs, timeout=self.deadline)
+        finally:
+            # 不等待超时的线程，未开始的请求直接取消
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        for future, (exchange, account, record, endpoint) in jobs.items():
+            cache_key = (exchange, account.account_key, endpoint)
+            error = None
+            if future in done:
+                try:
+                    value, received = future.result()
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+            else:
+                error = f"超时 (>{self.deadline:.0f}s)"
+
+            if error is None:
+                entry = (value, received, _event_time(value))
+                self._last_good[cache_key] = entry
+                self._fill(record, endpoint, entry, STATUS_OK)
+            elif cache_key in self._last_good:
+                self._fill(record, endpoint, self._last_good[cache_key], STATUS_STALE)
+                record["errors"][endpoint] = error
+            else:
+                record[endpoint] = ENDPOINT_DEFAULTS[endpoint]()
+                record["status"][endpoint] = STATUS_FAILED
+                record["errors"][endpoint] = error
+
+            metrics.inc("fetch_results", exchange=exchange, endpoint=endpoint, status=record["status"][endpoint])
+            if error is not None:
+                print(f"{exchange.upper()} 账户{account.account_index} {endpoint} 抓取失败: {error}")
+
+        elapsed = time.monotonic() - started
+        metrics.registry.observe("stage", elapsed, stage="fetch")
+        reused_note = f", 复用 {reused} 项未过期数据" if reused else ""
+        print(f"并发抓取完成: {len(jobs)} 个请求{reused_note}, 用时 {elapsed:.2f}s")
+        return results
+
+
+def _event_time(value: Any) -> Optional[float]:
+    """数据自带的交易所事件时间（目前只有 summary 的 BalanceRecord 提供），列表类数据集为 None"""
+    return getattr(value, "event_time", None)
+
+
+def data_as_of(record: Dict[str, Any]) -> Optional[float]:
+    """账户数据中最旧的一项的抓取时间（stale 时为 last-good 值的时间），没有数据时为 None"""
+    as_of = record.get("as_of", {}).values()
+    return min(as_of) if as_of else None
+
+
+def data_event_time(record: Dict[str, Any]) -> Optional[float]:
+    """账户数据中最旧的交易所事件时间（只统计带事件时间的数据集），没有时为 None"""
+    times = [t for t in record.get("event_time", {}).values() if t]
+    return min(times) if times else None
+
+
+def account_status(record: Dict[str, Any]) -> str:
+    """汇总一个账户所有 endpoint 的状态：任一 failed 则 failed，任一 stale 则 stale"""
+    statuses = record.get("status", {}).values()
+    if STATUS_FAILED in statuses:
+        return STATUS_FAILED
+    if STATUS_STALE in statuses:
+        return STATUS_STALE
+    return STATUS_OK
+
+
+_engine: Optional[FetchEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> FetchEngine:
+    """进程内共享的抓取引擎（保留 last-good 缓存）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = FetchEngine()
+        return _engine
@@ -0,0 +1,192 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from exchanges.registry import get_adapters
+from utils.config_loader import get_fetch_config, get_storage_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fills (
+    exchange      TEXT    NOT NULL,
+    account_key   TEXT    NOT NULL,
+    fill_id       TEXT    NOT NULL,
+    ts_ms         INTEGER NOT NULL,
+    instrument    TEXT    NOT NULL,
+    side          TEXT    NOT NULL,
+    size          REAL    NOT NULL,
+    price         REAL    NOT NULL,
+    fee           REAL    NOT NULL,
+    realized_pnl  REAL    NOT NULL,
+    PRIMARY KEY (exchange, account_key, fill_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_fills_account_ts ON fills (exchange, account_key, ts_ms);
+CREATE INDEX IF NOT EXISTS idx_fills_ts ON fills (ts_ms);
+CREATE TABLE IF NOT EXISTS fill_cursors (
+    exchange      TEXT    NOT NULL,
+    account_key   TEXT    NOT NULL,
+    last_ts_ms    INTEGER NOT NULL,
+    last_fill_id  TEXT    NOT NULL,
+    updated_at    INTEGER NOT NULL,
+    PRIMARY KEY (exchange, account_key)
+) WITHOUT ROWID;
+"""
+
+GROUP_COLUMNS = {
+    "exchange": "exchange",
+    "account": "account_key",
+    "instrument": "instrument",
+    "day": "date(ts_ms / 1000, 'unixepoch')",
+}
+
+
+class FillStore:
+    """
+    成交历史的本地只追加存储（SQLite WAL）
+    - fills 表以 (exchange, account_key, fill_id) 为主键，重复写入自动忽略
+    - fill_cursors 表记录每个账户已同步到的最新成交 (high-water mark)
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or get_storage_path("fills_db", "data/fills.db")
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_cursor(self, exchange: str, account_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_ts_ms, last_fill_id FROM fill_cursors WHERE exchange = ? AND account_key = ?",
+                (exchange, account_key),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"last_ts_ms": row[0], "last_fill_id": row[1]}
+
+    def append(self, exchange: str, account_key: str, fills: List[Dict[str, Any]]) -> int:
+        """写入一页成交，返回新增条数"""
+        rows = [
+            (exchange, account_key, f["fill_id"], f["ts_ms"], f["instrument"], f["side"],
+             f["size"], f["price"], f["fee"], f["realized_pnl"])
+            for f in fills
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO fills VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            return self._conn.total_changes - before
+
+    def advance_cursor(self, exchange: str, account_key: str):
+        """把 high-water mark 推进到该账户已落库的最新成交"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT ts_ms, fill_id FROM fills WHERE exchange = ? AND account_key = ? "
+                "ORDER BY ts_ms DESC, fill_id DESC LIMIT 1",
+                (exchange, account_key),
+            ).fetchone()
+            if row is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fill_cursors VALUES (?, ?, ?, ?, ?)",
+                (exchange, account_key, row[0], row[1], int(time.time() * 1000)),
+            )
+
+    def stats(self, exchange: Optional[str] = None, account_key: Optional[str] = None,
+              since_ms: Optional[int] = None, until_ms: Optional[int] = None,
+              group_by: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        本地汇总成交量 / 手续费 / 已实现 PnL
+        group_by 可选 exchange / account / instrument / day，为 None 时返回一行总计
+        """
+        where, args = [], []
+        if exchange:
+            where.append("exchange = ?")
+            args.append(exchange)
+        if account_key:
+            where.append("account_key = ?")
+            args.append(account_key)
+        if since_ms is not None:
+            where.append("ts_ms >= ?")
+            args.append(int(since_ms))
+        if until_ms is not None:
+            where.append("ts_ms < ?")
+            args.append(int(until_ms))
+
+        group_expr = None
+        if group_by:
+            if group_by not in GROUP_COLUMNS:
+                raise ValueError(f"不支持的 group_by: {group_by}，可选: {list(GROUP_COLUMNS)}")
+            group_expr = GROUP_COLUMNS[group_by]
+
+        sql = (
+            f"SELECT {group_expr + ' AS grp, ' if group_expr else ''}"
+            "COUNT(*), SUM(size * price), SUM(fee), SUM(realized_pnl) FROM fills"
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if group_expr:
+            sql += " GROUP BY grp ORDER BY grp"
+
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+
+        results = []
+        for row in rows:
+            values = row[1:] if group_expr else row
+            item = {
+                "count": values[0],
+                "volume": values[1] or 0.0,
+                "fees": values[2] or 0.0,
+                "realized_pnl": values[3] or 0.0,
+            }
+            if group_expr:
+                item[group_by] = row[0]
+            results.append(item)
+        return results
+
+
+def sync_account_fills(store: FillStore, exchange: str, account: Any) -> int:
+    """从该账户的 high-water mark 开始增量拉取成交并落库，返回新增条数"""
+    cursor = store.get_cursor(exchange, account.account_key)
+    # 从上次最新成交的时间戳（含）开始，同一毫秒内的重复成交由主键去重
+    since_ms = cursor["last_ts_ms"] if cursor else 0
+    added = 0
+    for page in account.iter_fills(since_ms):
+        added += store.append(exchange, account.account_key, page)
+    store.advance_cursor(exchange, account.account_key)
+    return added
+
+
+def sync_all_fills(store: Optional[FillStore] = None) -> Dict[str, int]:
+    """并发同步所有账户的成交，返回 {exchange:account_key: 新增条数}"""
+    store = store or FillStore()
+    accounts = [(adapter.name, acc) for adapter in get_adapters() for acc in adapter.load_accounts()]
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=get_fetch_config().max_workers) as executor:
+        futures = {
+            executor.submit(sync_account_fills, store, exchange, acc): (exchange, acc)
+            for exchange, acc in accounts
+        }
+        for future, (exchange, acc) in futures.items():
+            key = f"{exchange}:{acc.account_key}"
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                print(f"{exchange.upper()} 账户{acc.account_index} 成交同步失败: {e}")
+                results[key] = 0
+    return results
+
+
+if __name__ == "__main__":
+    store = FillStore()
+    added = sync_all_fills(store)
+    print(f"成交同步完成，新增 {sum(added.values())} 条")
+    for row in store.stats(group_by="account"):
+        print(f"  {row['account']}: {row['count']} 笔, 成交额 ${row['volume']:,.0f}, "
+              f"手续费 ${row['fees']:,.2f}, 已实现 PnL ${row['realized_pnl']:,.2f}")
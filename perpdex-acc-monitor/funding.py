@@ -0,0 +1,303 @@
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from columnar import PositionTable
+from exchanges.base import ExchangeAdapter
+from exchanges.registry import get_adapters
+from market_data import get_market_cache
+from utils import metrics
+from utils.config_loader import FundingConfig, get_funding_config, get_storage_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS funding_rates (
+    exchange   TEXT    NOT NULL,
+    symbol     TEXT    NOT NULL,   -- 交易所合约名
+    bucket     INTEGER NOT NULL,   -- 桶起点（Unix 秒）
+    n          INTEGER NOT NULL,   -- 桶内样本数
+    rate       REAL    NOT NULL,   -- 桶内平均费率（每 funding_period_hours 的小数）
+    PRIMARY KEY (exchange, symbol, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS funding_current (
+    exchange   TEXT    NOT NULL,
+    symbol     TEXT    NOT NULL,
+    ts_ms      INTEGER NOT NULL,   -- 行情中的事件时间
+    rate       REAL    NOT NULL,   -- 当前（未结算）费率，每 funding_period_hours 的小数
+    PRIMARY KEY (exchange, symbol)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS funding_cursors (
+    exchange    TEXT    NOT NULL,
+    symbol      TEXT    NOT NULL,
+    last_ts_ms  INTEGER NOT NULL,
+    updated_at  INTEGER NOT NULL,
+    PRIMARY KEY (exchange, symbol)
+) WITHOUT ROWID;
+"""
+
+# 新样本并入桶内的滑动平均（与 history_store 相同），Paradex 这类秒级连续费率按桶压缩后存储
+UPSERT = """
+INSERT INTO funding_rates VALUES (?, ?, ?, 1, ?)
+ON CONFLICT (exchange, symbol, bucket) DO UPDATE SET
+    rate = (rate * n + excluded.rate) / (n + 1),
+    n    = n + 1
+"""
+
+
+class FundingStore:
+    """
+    各合约资金费率历史的本地存储（SQLite WAL）
+    - funding_rates 只存交易所历史接口返回的样本，按 resolution 秒分桶，桶内取平均；累计资金费只用这张表
+    - funding_current 存批量行情中的当前费率（每个合约只保留最新一条），只在行情不可用时兜底当前费率
+    - funding_cursors 记录每个合约已写入的最新样本时间 (high-water mark)，增量同步从这里继续
+    """
+
+    def __init__(self, path: Optional[str] = None, resolution: Optional[int] = None):
+        self.path = path or get_storage_path("funding_db", "data/funding.db")
+        self.resolution = resolution or get_funding_config().resolution
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_cursor(self, exchange: str, symbol: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_ts_ms FROM funding_cursors WHERE exchange = ? AND symbol = ?", (exchange, symbol)
+            ).fetchone()
+        return row[0] if row else None
+
+    def append(self, exchange: str, symbol: str, points: List[Tuple[int, float]]) -> int:
+        """
+        写入 [(毫秒时间戳, 费率), ...]，只保留比 cursor 新的样本并推进 cursor，返回写入条数
+        重复拉取同一段历史（含 cursor 本身）不会重复计入桶内平均
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT last_ts_ms FROM funding_cursors WHERE exchange = ? AND symbol = ?", (exchange, symbol)
+            ).fetchone()
+            last = row[0] if row else -1
+            fresh = [(ts, rate) for ts, rate in points if ts > last]
+            if not fresh:
+                return 0
+            self._conn.executemany(UPSERT, [
+                (exchange, symbol, ts // 1000 // self.resolution * self.resolution, rate) for ts, rate in fresh
+            ])
+            self._conn.execute(
+                "INSERT OR REPLACE INTO funding_cursors VALUES (?, ?, ?, ?)",
+                (exchange, symbol, max(ts for ts, _ in fresh), int(time.time() * 1000)),
+            )
+            return len(fresh)
+
+    def set_current(self, exchange: str, rates: Dict[str, Tuple[int, float]]):
+        """记录当前费率 {合约: (毫秒时间戳, 费率)}；不影响历史和 cursor，较旧的样本不会覆盖较新的"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO funding_current VALUES (?, ?, ?, ?) ON CONFLICT (exchange, symbol) DO UPDATE SET "
+                "ts_ms = excluded.ts_ms, rate = excluded.rate WHERE excluded.ts_ms >= ts_ms",
+                [(exchange, symbol, ts_ms, rate) for symbol, (ts_ms, rate) in rates.items()],
+            )
+
+    def current_rates(self, exchange: str) -> Dict[str, float]:
+        """最近一次记录的当前费率"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT symbol, rate FROM funding_current WHERE exchange = ?", (exchange,)
+            ).fetchall()
+        return dict(rows)
+
+    def latest_rates(self, exchange: str) -> Dict[str, float]:
+        """每个合约历史中最新一个桶的费率"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT symbol, rate FROM funding_rates AS f WHERE exchange = ? AND bucket = "
+                "(SELECT MAX(bucket) FROM funding_rates WHERE exchange = f.exchange AND symbol = f.symbol)",
+                (exchange,),
+            ).fetchall()
+        return dict(rows)
+
+    def rate_seconds(self, exchange: str, since: float, until: float) -> Dict[str, float]:
+        """
+        [since, until) 内各合约 费率 × 秒 的积分，除以 funding_period_hours 对应的秒数即为窗口内的累计费率
+        费率按阶梯函数处理：每个桶的费率一直保持到下一个有样本的桶（GRVT 每 8 小时才有一个结算样本），
+        窗口开始前的最后一个桶也计入
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT symbol, bucket, rate FROM funding_rates AS f WHERE exchange = ? AND bucket < ? AND bucket >= "
+                "COALESCE((SELECT MAX(bucket) FROM funding_rates WHERE exchange = f.exchange AND symbol = f.symbol "
+                "AND bucket <= ?), ?) ORDER BY symbol, bucket",
+                (exchange, until, since, since),
+            ).fetchall()
+        series: Dict[str, Tuple[List[int], List[float]]] = {}
+        for symbol, bucket, rate in rows:
+            buckets, rates = series.setdefault(symbol, ([], []))
+            buckets.append(bucket)
+            rates.append(rate)
+        result = {}
+        for symbol, (buckets, rates) in series.items():
+            starts = np.maximum(np.asarray(buckets, dtype=np.float64), since)
+            ends = np.append(np.asarray(buckets[1:], dtype=np.float64), until)
+            result[symbol] = float(np.dot(rates, np.clip(ends - starts, 0, None)))
+        return result
+
+
+def funding_carry(table: PositionTable, hourly_rates: np.ndarray, accrued_rates: np.ndarray) -> Dict[str, Any]:
+    """
+    对全部持仓向量化计算资金费，hourly_rates / accrued_rates 为 交易所×交易所合约（table.symbols 编码）
+    的每小时费率与窗口内累计费率
+    资金费 = -名义价值 × 费率：费率为正时多头付费、空头收取，结果为正表示收入
+    累计资金费假设窗口内一直持有当前仓位
+    """
+    venue = table.account_venue[table.pos_account].astype(np.int64)
+    hourly = hourly_rates[venue, table.pos_symbol]
+    position_hourly = -table.notional * hourly
+    position_accrued = -table.notional * accrued_rates[venue, table.pos_symbol]
+    account_hourly = np.bincount(table.pos_account, weights=position_hourly, minlength=table.n_accounts)
+    account_accrued = np.bincount(table.pos_account, weights=position_accrued, minlength=table.n_accounts)
+    return {
+        "position_rate": hourly,                 # 每小时费率
+        "position_hourly": position_hourly,
+        "position_daily": position_hourly * 24,
+        "position_accrued": position_accrued,
+        "account_hourly": account_hourly,
+        "account_daily": account_hourly * 24,
+        "account_accrued": account_accrued,
+        "total_hourly": float(position_hourly.sum()),
+        "total_daily": float(position_hourly.sum() * 24),
+        "total_accrued": float(position_accrued.sum()),
+    }
+
+
+class FundingMonitor:
+    """
+    资金费率同步与 carry 统计
+    - sync(snapshot) 每个 sync_interval 最多执行一次：从 cursor 增量拉取当前持有合约的费率历史，
+      再用批量行情（与快照共用 MarketDataCache）记录当前费率；请求数只与合约数有关，与账户数无关
+    - report(snapshot) 用当前费率和本地历史计算每个持仓 / 账户的预期每小时、每日资金费和窗口内累计资金费
+    """
+
+    def __init__(self, store: Optional[FundingStore] = None, config: Optional[FundingConfig] = None,
+                 adapters: Optional[List[ExchangeAdapter]] = None):
+        self.config = config or get_funding_config()
+        self.store = store or FundingStore(resolution=self.config.resolution)
+        self.adapters = adapters if adapters is not None else get_adapters()
+        self._synced_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def sync(self, snapshot, force: bool = False) -> int:
+        """同步费率历史，返回新写入的样本数；距上次同步不足 sync_interval 时直接返回 0"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._synced_at is not None and now - self._synced_at < self.config.sync_interval:
+                return 0
+            self._synced_at = now
+
+        backfill_ms = int((time.time() - self.config.backfill_hours * 3600) * 1000)
+        added = 0
+        with metrics.timer("stage", stage="funding"):
+            for adapter in self.adapters:
+                held = sorted(snapshot.symbols.get(adapter.name, {}))
+                for symbol in held:
+                    cursor = self.store.get_cursor(adapter.name, symbol)
+                    try:
+                        for page in adapter.iter_funding(symbol, backfill_ms if cursor is None else cursor + 1):
+                            added += self.store.append(adapter.name, symbol, page)
+                    except NotImplementedError:
+                        break  # 该交易所没有历史接口，只记录当前费率（不计入累计资金费）
+                    except Exception as e:
+                        print(f"{adapter.display_name} {symbol} 资金费率历史同步失败: {e}")
+                # 当前费率是尚未结算的预估值，单独存放，不混入历史，也不推进 cursor
+                current = {symbol: (int((record.event_time or time.time()) * 1000), record.funding_rate)
+                           for symbol, record in get_market_cache().get(adapter, held).items()}
+                if current:
+                    self.store.set_current(adapter.name, current)
+        metrics.inc("funding_samples", added)
+        return added
+
+    def report(self, snapshot, window_hours: Optional[float] = None) -> Dict[str, Any]:
+        """
+        当前费率优先取行情缓存（TTL 内不重复请求），缺失时依次用本地记录的当前费率、历史中最新一个桶；
+        累计资金费取最近 window_hours 小时的历史费率；费率按持仓的交易所合约名取，不按统一合约名
+        返回 funding_carry 的结果，另附 window_hours
+        """
+        table = snapshot.table
+        window_hours = window_hours or self.config.accrual_hours
+        until = time.time()
+        since = until - window_hours * 3600
+        codes = {symbol: i for i, symbol in enumerate(table.symbols)}
+        hourly = np.zeros((len(table.venues), len(table.symbols)))
+        accrued = np.zeros_like(hourly)
+        for adapter in self.adapters:
+            held = snapshot.symbols.get(adapter.name)
+            if not held or adapter.name not in table.venues:
+                continue
+            v = table.venues.index(adapter.name)
+            period = adapter.funding_period_hours * 3600
+            markets = get_market_cache().get(adapter, held)
+            current = self.store.current_rates(adapter.name)
+            latest = self.store.latest_rates(adapter.name)
+            integrals = self.store.rate_seconds(adapter.name, since, until)
+            for symbol in held:
+                i = codes.get(symbol)
+                if i is None:
+                    continue
+                market = markets.get(symbol)
+                rate = market.funding_rate if market is not None else current.get(symbol, latest.get(symbol, 0.0))
+                hourly[v, i] = rate * 3600 / period
+                accrued[v, i] = integrals.get(symbol, 0.0) / period
+        result = funding_carry(table, hourly, accrued)
+        result["window_hours"] = window_hours
+        return result
+
+
+def format_funding(table: PositionTable, result: Dict[str, Any], max_positions: int = 10) -> str:
+    """/funding 的文字回复：总计、各账户，以及资金费支出最多的持仓"""
+    if not table.n_positions:
+        return "当前没有持仓"
+    gross = float(np.abs(table.notional).sum())
+    apr = f"，按总敞口年化 {result['total_daily'] * 365 / gross:+.2%}" if gross > 0 else ""
+    lines = [f"预期资金费 ${result['total_hourly']:+,.2f}/小时，${result['total_daily']:+,.0f}/天{apr}",
+             f"近 {result['window_hours']:g} 小时累计 ${result['total_accrued']:+,.0f}（按当前仓位估算）"]
+
+    held = np.bincount(table.pos_account, minlength=table.n_accounts) > 0
+    for a in np.argsort(result["account_daily"], kind="stable").tolist():
+        if held[a]:
+            lines.append(f"  {table.account_meta[a]['label']}: ${result['account_daily'][a]:+,.0f}/天，"
+                         f"累计 ${result['account_accrued'][a]:+,.0f}")
+
+    paying = [p for p in np.argsort(result["position_daily"], kind="stable").tolist()
+              if result["position_daily"][p] < 0][:max_positions]
+    if paying:
+        lines.append("支出最多的持仓：")
+        for p in paying:
+            label = table.account_meta[table.pos_account[p]]["label"]
+            lines.append(f"  {label} {table.instruments[table.pos_instrument[p]]} ${table.notional[p]:+,.0f} "
+                         f"费率 {result['position_rate'][p] * 1e4:+.3f}bp/h → ${result['position_daily'][p]:+,.0f}/天")
+    return "\n".join(lines)
+
+
+_monitor: Optional[FundingMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def get_funding_monitor() -> FundingMonitor:
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = FundingMonitor()
+        return _monitor
+
+
+if __name__ == "__main__":
+    from aggregator import load_snapshot
+
+    snapshot = load_snapshot()
+    monitor = get_funding_monitor()
+    print(f"资金费率同步完成，新增 {monitor.sync(snapshot, force=True)} 个样本")
+    print(format_funding(snapshot.table, monitor.report(snapshot)))
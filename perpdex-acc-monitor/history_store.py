@@ -0,0 +1,254 @@
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from fetcher import STATUS_FAILED
+from utils import metrics
+from utils.config_loader import get_history_config, get_storage_path
+
+# 精度名 -> 桶宽（秒），从细到粗
+TIERS = {"1m": 60, "1h": 3600, "1d": 86400}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id    INTEGER PRIMARY KEY,
+    kind  TEXT NOT NULL,     -- total / venue / account / instrument
+    key   TEXT NOT NULL,
+    UNIQUE (kind, key)
+);
+""" + "".join(f"""
+CREATE TABLE IF NOT EXISTS samples_{tier} (
+    series_id  INTEGER NOT NULL,
+    bucket     INTEGER NOT NULL,   -- 桶起点（Unix 秒）
+    n          INTEGER NOT NULL,   -- 桶内样本数
+    equity     REAL    NOT NULL,   -- 以下均为桶内平均值
+    net        REAL    NOT NULL,
+    gross      REAL    NOT NULL,
+    leverage   REAL    NOT NULL,
+    PRIMARY KEY (series_id, bucket)
+) WITHOUT ROWID;
+""" for tier in TIERS)
+
+# 新样本并入桶内的滑动平均；三个精度的上卷在写入时同步完成，不需要离线任务
+UPSERT = """
+INSERT INTO samples_{tier} VALUES (?, ?, 1, ?, ?, ?, ?)
+ON CONFLICT (series_id, bucket) DO UPDATE SET
+    equity   = (equity   * n + excluded.equity)   / (n + 1),
+    net      = (net      * n + excluded.net)      / (n + 1),
+    gross    = (gross    * n + excluded.gross)    / (n + 1),
+    leverage = (leverage * n + excluded.leverage) / (n + 1),
+    n        = n + 1
+"""
+
+Row = Tuple[str, str, float, float, float, float]  # (kind, key, equity, net, gross, leverage)
+
+
+def snapshot_rows(snapshot) -> List[Row]:
+    """
+    从快照的列式汇总中取出 total / venue / account / instrument 四类序列的当前值
+    抓取失败的账户没有真实数据（equity 记为 0），不写入账户序列，也不计入 total / venue / instrument，
+    否则一次失败会在历史曲线上留下一个假的回撤
+    """
+    table, aggs = snapshot.table, snapshot.aggs
+    ok = np.fromiter((meta.get("status") != STATUS_FAILED for meta in table.account_meta),
+                     dtype=bool, count=table.n_accounts)
+    if not ok.any():
+        return []  # 全部失败：本次不写样本
+
+    def leverage(gross, equity):
+        return float(gross / equity) if equity > 0 else 0.0
+
+    equity = np.where(ok, table.account_equity, 0.0)
+    net = np.where(ok, aggs["account_net"], 0.0)
+    gross = np.where(ok, aggs["account_gross"], 0.0)
+    total_equity, total_gross = float(equity.sum()), float(gross.sum())
+    rows: List[Row] = [(
+        "total", "total", total_equity, float(net.sum()), total_gross, leverage(total_gross, total_equity),
+    )]
+    n_venues = len(table.venues)
+    venue_equity = np.bincount(table.account_venue, weights=equity, minlength=n_venues)
+    venue_net = np.bincount(table.account_venue, weights=net, minlength=n_venues)
+    venue_gross = np.bincount(table.account_venue, weights=gross, minlength=n_venues)
+    venue_ok = np.bincount(table.account_venue, weights=ok, minlength=n_venues) > 0
+    for v in np.flatnonzero(venue_ok):
+        venue = table.venues[v]
+        rows.append(("venue", venue, float(venue_equity[v]), float(venue_net[v]), float(venue_gross[v]),
+                     leverage(venue_gross[v], venue_equity[v])))
+
+    for i in np.flatnonzero(ok):
+        venue = table.venues[table.account_venue[i]]
+        rows.append((
+            "account", f"{venue}:{table.account_meta[i]['account_key']}", float(table.account_equity[i]),
+            float(aggs["account_net"][i]), float(aggs["account_gross"][i]),
+            float(aggs["account_gross_leverage"][i]),
+        ))
+
+    n_instruments = len(table.instruments)
+    notional = np.where(ok[table.pos_account], table.notional, 0.0)
+    inst_net = np.bincount(table.pos_instrument, weights=notional, minlength=n_instruments)
+    inst_gross = np.bincount(table.pos_instrument, weights=np.abs(notional), minlength=n_instruments)
+    for code, instrument in enumerate(table.instruments):
+        rows.append(("instrument", instrument, 0.0, float(inst_net[code]), float(inst_gross[code]), 0.0))
+    return rows
+
+
+class HistoryStore:
+    """
+    权益 / 敞口 / 杠杆的本地时间序列（SQLite WAL）
+    - 每个样本同时写入 1m / 1h / 1d 三个精度，各精度按 retention_days 清理
+    - record() 只把数据放进队列，由后台线程批量写入，不阻塞快照流程
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        config = get_history_config()
+        self.retention_days = config.retention_days
+        self.max_points = config.max_points
+        self.path = path or get_storage_path("history_db", "data/history.db")
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._series_ids: Dict[Tuple[str, str], int] = {
+            (kind, key): sid for sid, kind, key in self._conn.execute("SELECT id, kind, key FROM series")
+        }
+        self._queue: "queue.Queue[Optional[Tuple[float, List[Row]]]]" = queue.Queue(maxsize=1000)
+        self._last_prune = 0.0
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    # ---- 写入 ----
+
+    def record(self, snapshot):
+        """把快照放入写入队列；队列满时丢弃本次样本而不是阻塞"""
+        try:
+            self._queue.put_nowait((snapshot.taken_at, snapshot_rows(snapshot)))
+        except queue.Full:
+            metrics.inc("history_dropped_samples")
+            print("历史写入队列已满，丢弃一个样本")
+
+    def flush(self, timeout: float = 5.0):
+        """等待队列中的样本全部落库（测试 / 退出时使用）"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+        with self._lock:
+            self._conn.close()
+
+    def _series_id(self, kind: str, key: str) -> int:
+        sid = self._series_ids.get((kind, key))
+        if sid is None:
+            self._conn.execute("INSERT OR IGNORE INTO series (kind, key) VALUES (?, ?)", (kind, key))
+            sid = self._conn.execute("SELECT id FROM series WHERE kind = ? AND key = ?", (kind, key)).fetchone()[0]
+            self._series_ids[(kind, key)] = sid
+        return sid
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            # 顺便取走已经排队的样本，合并成一个事务
+            while len(batch) < 100:
+                try:
+                    extra = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is None:
+                    self._queue.put(None)
+                    self._queue.task_done()
+                    break
+                batch.append(extra)
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"历史数据写入失败: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[Tuple[float, List[Row]]]):
+        with self._lock, self._conn:
+            params = {tier: [] for tier in TIERS}
+            for ts, rows in batch:
+                for kind, key, equity, net, gross, leverage in rows:
+                    sid = self._series_id(kind, key)
+                    for tier, width in TIERS.items():
+                        bucket = int(ts // width * width)
+                        params[tier].append((sid, bucket, equity, net, gross, leverage))
+            for tier, values in params.items():
+                self._conn.executemany(UPSERT.format(tier=tier), values)
+        if time.time() - self._last_prune > 3600:
+            self.prune()
+
+    def prune(self):
+        """按各精度的保留天数删除过期数据"""
+        now = time.time()
+        with self._lock, self._conn:
+            for tier, days in self.retention_days.items():
+                if days > 0 and tier in TIERS:
+                    self._conn.execute(f"DELETE FROM samples_{tier} WHERE bucket < ?", (int(now - days * 86400),))
+        self._last_prune = now
+
+    # ---- 查询 ----
+
+    def choose_tier(self, start: float, end: float) -> str:
+        """保留期覆盖 start 且点数不超过 max_points 的最细精度"""
+        now = time.time()
+        for tier, width in TIERS.items():
+            days = self.retention_days.get(tier, 0)
+            covered = days <= 0 or start >= now - days * 86400
+            if covered and (end - start) / width <= self.max_points:
+                return tier
+        return list(TIERS)[-1]
+
+    def query(self, kind: str, key: str, start: float, end: Optional[float] = None,
+              resolution: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        区间查询某条序列，start / end 为 Unix 秒
+        resolution 为 1m / 1h / 1d，不指定时自动选择（大区间自动走粗精度，保证毫秒级返回）
+        """
+        end = end if end is not None else time.time()
+        tier = resolution or self.choose_tier(start, end)
+        if tier not in TIERS:
+            raise ValueError(f"不支持的精度: {tier}，可选: {list(TIERS)}")
+        with self._lock:
+            sid = self._series_ids.get((kind, key))
+            if sid is None:
+                return []
+            rows = self._conn.execute(
+                f"SELECT bucket, equity, net, gross, leverage FROM samples_{tier} "
+                "WHERE series_id = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                (sid, int(start // TIERS[tier] * TIERS[tier]), int(end)),
+            ).fetchall()
+        return [
+            {"time": bucket, "equity": equity, "net": net, "gross": gross, "leverage": leverage}
+            for bucket, equity, net, gross, leverage in rows
+        ]
+
+    def list_series(self, kind: Optional[str] = None) -> List[Tuple[str, str]]:
+        with self._lock:
+            return sorted(k for k in self._series_ids if kind is None or k[0] == kind)
+
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_history_store() -> Optional[HistoryStore]:
+    """进程内共享的历史存储；配置中关闭时返回 None"""
+    global _store
+    if not get_history_config().enabled:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
@@ -1,159 +1,241 @@
 from PIL import Image, ImageDraw, ImageFont
 from aggregator import aggregate_all_data
+from functools import lru_cache
+from io import BytesIO
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Tuple
+import math
 import os
+import time
 
-def generate_summary_image(output_path="perp_summary.png"):
-    data = aggregate_all_data()
-    
-    width = 1500  # 更宽，防止挤出
-    height = 2700  # 更长
-    bg_color = (18, 18, 18)
-    text_color = (255, 255, 255)
-    green = (0, 255, 128)
-    red = (255, 82, 82)
-    
-    img = Image.new('RGB', (width, height), bg_color)
-    draw = ImageDraw.Draw(img)
-    
+WIDTH = 1500
+MARGIN_X = 60
+BG_COLOR = (18, 18, 18)
+TEXT_COLOR = (255, 255, 255)
+GREEN = (0, 255, 128)
+RED = (255, 82, 82)
+YELLOW = (255, 193, 7)
+
+ROW_HEIGHT = 60
+POSITION_ROW_HEIGHT = 50
+SECTION_GAP = 100
+BOTTOM_MARGIN = 60
+
+# 各表格的表头与列宽，列起点在模块加载时一次算好
+VENUE_HEADERS = ["Venue", "Equity", "Net Exposure", "Gross Exposure"]
+VENUE_COL_WIDTHS = [300, 400, 400, 400]
+ACC_HEADERS = ["Account", "Equity", "N_Exposure", "G_Exposure"]
+ACC_COL_WIDTHS = [350, 350, 450, 450]  # 加宽
+POS_HEADERS = ["Account", "Instrument", "Size", "Exposure", "Liq.price"]
+POS_COL_WIDTHS = [350, 300, 150, 300, 300]
+STRESS_HEADERS = ["Shock", "Equity", "PnL", "G_Leverage", "Liquidated"]
+STRESS_COL_WIDTHS = [200, 350, 350, 250, 250]
+
+
+def _column_x(widths: List[int]) -> List[int]:
+    return [MARGIN_X + offset for offset in accumulate([0] + widths[:-1])]
+
+
+VENUE_COL_X = _column_x(VENUE_COL_WIDTHS)
+ACC_COL_X = _column_x(ACC_COL_WIDTHS)
+POS_COL_X = _column_x(POS_COL_WIDTHS)
+STRESS_COL_X = _column_x(STRESS_COL_WIDTHS)
+
+
+@lru_cache(maxsize=1)
+def load_fonts() -> Dict[str, Any]:
+    """字体只从磁盘加载一次，之后所有渲染共用"""
+    specs = {
+        "time": ("arial.ttf", 40),
+        "total_label": ("arial.ttf", 48),
+        "total_value": ("arialbd.ttf", 72),
+        "italic_title": ("ariali.ttf", 40),
+        "header": ("arialbd.ttf", 34),
+        "normal": ("arial.ttf", 30),
+        "small": ("arial.ttf", 28),
+    }
     try:
-        time_font = ImageFont.truetype("arial.ttf", 40)
-        total_label_font = ImageFont.truetype("arial.ttf", 48)
-        total_value_font = ImageFont.truetype("arialbd.ttf", 72)
-        italic_title_font = ImageFont.truetype("ariali.ttf", 40)
-        header_font = ImageFont.truetype("arialbd.ttf", 34)
-        normal_font = ImageFont.truetype("arial.ttf", 30)
-        small_font = ImageFont.truetype("arial.ttf", 28)
-    except:
-        time_font = ImageFont.load_default()
-        total_label_font = ImageFont.load_default()
-        total_value_font = ImageFont.load_default()
-        italic_title_font = ImageFont.load_default()
-        header_font = ImageFont.load_default()
-        normal_font = ImageFont.load_default()
-        small_font = ImageFont.load_default()
-    
+        return {name: ImageFont.truetype(path, size) for name, (path, size) in specs.items()}
+    except OSError:
+        default = ImageFont.load_default()
+        return {name: default for name in specs}
+
+
+@lru_cache(maxsize=None)
+def _header_strip(headers: tuple, col_x: tuple) -> Image.Image:
+    """预先渲染好的表头行，渲染时直接贴到画布上"""
+    fonts = load_fonts()
+    strip = Image.new('RGB', (WIDTH, ROW_HEIGHT), BG_COLOR)
+    draw = ImageDraw.Draw(strip)
+    for x, header in zip(col_x, headers):
+        draw.text((x, 0), header, font=fonts["header"], fill=TEXT_COLOR)
+    return strip
+
+
+def _paste_header(img: Image.Image, y: int, headers: List[str], col_x: List[int]):
+    img.paste(_header_strip(tuple(headers), tuple(col_x)), (0, y))
+
+
+def _status_marker(acc: Dict[str, Any], now: float) -> Tuple[str, Tuple[int, int, int]]:
+    """账户名后的数据状态标记：stale 显示 last-good 数据的年龄，failed 表示没有任何数据（按 0 计入）"""
+    status = acc.get("Status", "ok")
+    if status == "stale":
+        age = f" {int((now - acc['As Of']) // 60)}m" if acc.get("As Of") else ""
+        return f" (stale{age})", YELLOW
+    if status == "failed":
+        return " (failed)", RED
+    return "", TEXT_COLOR
+
+
+def _canvas_height(data: Dict[str, Any]) -> int:
+    """按行数计算画布高度，替代固定的 2700 像素"""
+    n_venues = len(data["exchanges"])
+    n_accounts = sum(len(ex["accounts"]) for ex in data["exchanges"])
+    n_positions = sum(len(acc["positions"]) for ex in data["exchanges"] for acc in ex["accounts"])
+    header = 40 + 100 + 70 + 100 + 70 + 150
+    if data.get("partial"):
+        header += 50
+    venue = 60 + ROW_HEIGHT + ROW_HEIGHT * n_venues + SECTION_GAP
+    accounts = 60 + ROW_HEIGHT + ROW_HEIGHT * n_accounts + SECTION_GAP
+    positions = 60 + ROW_HEIGHT + POSITION_ROW_HEIGHT * n_positions
+    stress = 0
+    if data.get("stress"):
+        stress = SECTION_GAP + 60 + ROW_HEIGHT + POSITION_ROW_HEIGHT * len(data["stress"])
+    return header + venue + accounts + positions + stress + BOTTOM_MARGIN
+
+
+def render_summary_image(data: Dict[str, Any]) -> BytesIO:
+    """把汇总数据渲染成 PNG，返回内存中的 BytesIO（已 seek 到开头，可直接交给 send_photo）"""
+    fonts = load_fonts()
+    width = WIDTH
+    img = Image.new('RGB', (width, _canvas_height(data)), BG_COLOR)
+    draw = ImageDraw.Draw(img)
+
     y = 40
-    
-    # 顶部时间
-    draw.text((width // 2, y), data["update_time"], font=time_font, fill=text_color, anchor="mt")
+
+    # 顶部时间：各账户中最旧数据的时间，账户之间的抓取时间差超过 1 秒时附上 skew
+    skew = data.get("timing", {}).get("skew", 0.0)
+    update_time = data["update_time"] + (f"  (skew {skew:.0f}s)" if skew >= 1 else "")
+    draw.text((width // 2, y), update_time, font=fonts["time"], fill=TEXT_COLOR, anchor="mt")
     y += 100
-    
+
+    # 部分数据不可用时在顶部提示，避免把 0 或旧值误读为实时数据
+    if data.get("partial"):
+        notice = (f"Partial data: {data.get('stale_accounts', 0)} stale (last-good values), "
+                  f"{data.get('failed_accounts', 0)} failed (counted as 0)")
+        draw.text((width // 2, y), notice, font=fonts["small"], fill=YELLOW, anchor="mt")
+        y += 50
+
     # Total Equity
-    draw.text((width // 2, y), "Total Equity:", font=total_label_font, fill=text_color, anchor="mt")
+    draw.text((width // 2, y), "Total Equity:", font=fonts["total_label"], fill=TEXT_COLOR, anchor="mt")
     y += 70
-    draw.text((width // 2, y), f"${int(round(data['Total Equity'])):,}", font=total_value_font, fill=text_color, anchor="mt")
+    draw.text((width // 2, y), f"${int(round(data['Total Equity'])):,}", font=fonts["total_value"], fill=TEXT_COLOR, anchor="mt")
     y += 100
-    
+
     # Total Exposure
-    draw.text((width // 2, y), "Total Exposure:", font=total_label_font, fill=text_color, anchor="mt")
+    draw.text((width // 2, y), "Total Exposure:", font=fonts["total_label"], fill=TEXT_COLOR, anchor="mt")
     y += 70
-    draw.text((width // 2, y), f"${int(round(data['Total Exposure'])):,}", font=total_value_font, fill=text_color, anchor="mt")
+    draw.text((width // 2, y), f"${int(round(data['Total Exposure'])):,}", font=fonts["total_value"], fill=TEXT_COLOR, anchor="mt")
     y += 150
-    
+
     # Summary by Venue
-    draw.text((60, y), "***Summary by Venue***", font=italic_title_font, fill=text_color)
+    draw.text((MARGIN_X, y), "***Summary by Venue***", font=fonts["italic_title"], fill=TEXT_COLOR)
     y += 60
-    
-    venue_headers = ["Venue", "Equity", "Net Exposure", "Gross Exposure"]
-    venue_col_widths = [300, 400, 400, 400]
-    x = 60
-    for header in venue_headers:
-        draw.text((x, y), header, font=header_font, fill=text_color)
-        x += venue_col_widths[venue_headers.index(header)]
-    y += 60
-    
+    _paste_header(img, y, VENUE_HEADERS, VENUE_COL_X)
+    y += ROW_HEIGHT
+
     for ex in data["exchanges"]:
-        venue = ex["exchange_name"]
-        equity = int(round(ex["Exchange Equity"]))
-        net_exposure = int(round(ex["Exchange Exposure"]))
-        gross_exposure = int(round(ex["Exchange Gross Exposure"]))
-        
-        x = 60
-        draw.text((x, y), venue, font=normal_font, fill=text_color)
-        x += venue_col_widths[0]
-        draw.text((x, y), f"${equity:,}", font=normal_font, fill=text_color)
-        x += venue_col_widths[1]
-        draw.text((x, y), f"${net_exposure:,}", font=normal_font, fill=text_color)  # 无颜色
-        x += venue_col_widths[2]
-        draw.text((x, y), f"${gross_exposure:,}", font=normal_font, fill=text_color)
-        y += 60
-    
-    y += 100
-    
+        cells = [
+            ex["exchange_name"],
+            f"${int(round(ex['Exchange Equity'])):,}",
+            f"${int(round(ex['Exchange Exposure'])):,}",  # 无颜色
+            f"${int(round(ex['Exchange Gross Exposure'])):,}",
+        ]
+        for x, text in zip(VENUE_COL_X, cells):
+            draw.text((x, y), text, font=fonts["normal"], fill=TEXT_COLOR)
+        y += ROW_HEIGHT
+
+    y += SECTION_GAP
+
     # Summary by Account
-    draw.text((60, y), "***Summary by Account***", font=italic_title_font, fill=text_color)
+    draw.text((MARGIN_X, y), "***Summary by Account***", font=fonts["italic_title"], fill=TEXT_COLOR)
     y += 60
-    
-    acc_headers = ["Account", "Equity", "N_Exposure", "G_Exposure"]
-    acc_col_widths = [350, 350, 450, 450]  # 加宽
-    x = 60
-    for header in acc_headers:
-        draw.text((x, y), header, font=header_font, fill=text_color)
-        x += acc_col_widths[acc_headers.index(header)]
-    y += 60
-    
+    _paste_header(img, y, ACC_HEADERS, ACC_COL_X)
+    y += ROW_HEIGHT
+
+    now = time.time()
     for ex in data["exchanges"]:
         for i, acc in enumerate(ex["accounts"], 1):
-            account_name = f"{ex['exchange_name']}_Acc{i:02d}"
-            equity = int(round(acc["Equity"]))
-            net_exposure = int(round(acc["Net Exposure"]))
-            net_leverage = acc["Net Leverage"]
-            gross_exposure = int(round(acc["Gross Exposure"]))
-            gross_leverage = acc["Gross Leverage"]
-            
-            n_str = f"${net_exposure:,} ({net_leverage:.2f}x)"
-            g_str = f"${gross_exposure:,} ({gross_leverage:.2f}x)"
-            
-            x = 60
-            draw.text((x, y), account_name, font=normal_font, fill=text_color)
-            x += acc_col_widths[0]
-            draw.text((x, y), f"${equity:,}", font=normal_font, fill=text_color)
-            x += acc_col_widths[1]
-            draw.text((x, y), n_str, font=normal_font, fill=text_color)
-            x += acc_col_widths[2]
-            draw.text((x, y), g_str, font=normal_font, fill=text_color)
-            
-            y += 60
-    
-    y += 100
-    
+            marker, marker_color = _status_marker(acc, now)
+            cells = [
+                (f"{ex['exchange_name']}_Acc{i:02d}{marker}", marker_color),
+                (f"${int(round(acc['Equity'])):,}", TEXT_COLOR),
+                (f"${int(round(acc['Net Exposure'])):,} ({acc['Net Leverage']:.2f}x)", TEXT_COLOR),
+                (f"${int(round(acc['Gross Exposure'])):,} ({acc['Gross Leverage']:.2f}x)", TEXT_COLOR),
+            ]
+            for x, (text, color) in zip(ACC_COL_X, cells):
+                draw.text((x, y), text, font=fonts["normal"], fill=color)
+            y += ROW_HEIGHT
+
+    y += SECTION_GAP
+
     # Positions
-    draw.text((60, y), "***Positions***", font=italic_title_font, fill=text_color)
+    draw.text((MARGIN_X, y), "***Positions***", font=fonts["italic_title"], fill=TEXT_COLOR)
     y += 60
-    
-    pos_headers = ["Account", "Instrument", "Size", "Exposure", "Liq.price"]
-    pos_col_widths = [350, 300, 150, 300, 300]
-    x = 60
-    for header in pos_headers:
-        draw.text((x, y), header, font=header_font, fill=text_color)
-        x += pos_col_widths[pos_headers.index(header)]
-    y += 60
-    
+    _paste_header(img, y, POS_HEADERS, POS_COL_X)
+    y += ROW_HEIGHT
+
     for ex in data["exchanges"]:
         for i, acc in enumerate(ex["accounts"], 1):
             account_name = f"{ex['exchange_name']}_Acc{i:02d}"
             for pos in acc["positions"]:
-                instrument = pos["Instrument"]
                 size = pos["Size"]
-                size_color = green if size > 0 else red
-                exposure = int(round(pos["Exposure"]))
-                liq = pos["Liq.price"]
-                
-                x = 60
-                draw.text((x, y), account_name, font=normal_font, fill=text_color)
-                x += pos_col_widths[0]
-                draw.text((x, y), instrument, font=normal_font, fill=text_color)
-                x += pos_col_widths[1]
-                draw.text((x, y), str(size), font=normal_font, fill=size_color)
-                x += pos_col_widths[2]
-                draw.text((x, y), f"${exposure:,}", font=normal_font, fill=text_color)
-                x += pos_col_widths[3]
-                draw.text((x, y), f"{liq:.2f}", font=normal_font, fill=text_color)
-                
-                y += 50
-    
-    img.save(output_path)
-    print(f"图片生成完成: {os.path.abspath(output_path)}")
+                cells = [
+                    (account_name, TEXT_COLOR),
+                    (pos["Instrument"], TEXT_COLOR),
+                    (str(size), GREEN if size > 0 else RED),
+                    (f"${int(round(pos['Exposure'])):,}", TEXT_COLOR),
+                    (f"{pos['Liq.price']:.2f}", TEXT_COLOR),
+                ]
+                for x, (text, color) in zip(POS_COL_X, cells):
+                    draw.text((x, y), text, font=fonts["normal"], fill=color)
+                y += POSITION_ROW_HEIGHT
+
+    # Stress Test（全品种同向冲击）
+    if data.get("stress"):
+        y += SECTION_GAP
+        draw.text((MARGIN_X, y), "***Stress Test (all instruments)***", font=fonts["italic_title"], fill=TEXT_COLOR)
+        y += 60
+        _paste_header(img, y, STRESS_HEADERS, STRESS_COL_X)
+        y += ROW_HEIGHT
+
+        for row in data["stress"]:
+            n_liquidated = len(row["Liquidated"])
+            cells = [
+                (f"{row['Shock'] * 100:+.0f}%", GREEN if row["Shock"] > 0 else RED),
+                (f"${int(round(row['Equity'])):,}", TEXT_COLOR),
+                (f"${int(round(row['PnL'])):,}", GREEN if row["PnL"] >= 0 else RED),
+                (f"{row['Gross Leverage']:.2f}x" if math.isfinite(row["Gross Leverage"]) else "n/a", TEXT_COLOR),
+                (f"{n_liquidated} acc" if n_liquidated else "-", RED if n_liquidated else TEXT_COLOR),
+            ]
+            for x, (text, color) in zip(STRESS_COL_X, cells):
+                draw.text((x, y), text, font=fonts["normal"], fill=color)
+            y += POSITION_ROW_HEIGHT
+
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    buffer.seek(0)
+    return buffer
+
+
+def generate_summary_image(output_path: Optional[str] = None) -> BytesIO:
+    """抓取并汇总最新数据后渲染；指定 output_path 时额外写一份文件（调试用）"""
+    buffer = render_summary_image(aggregate_all_data())
+    if output_path:
+        with open(output_path, "wb") as f:
+            f.write(buffer.getvalue())
+        print(f"图片生成完成: {os.path.abspath(output_path)}")
+    return buffer
 
 if __name__ == "__main__":
     generate_summary_image("perp_summary.png")
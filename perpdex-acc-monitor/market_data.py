@@ -0,0 +1,63 @@
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+from exchanges.base import ExchangeAdapter, MarketRecord
+from utils import metrics
+from utils.config_loader import get_market_data_config
+
+
+class MarketDataCache:
+    """
+    全部交易所合约行情的内存表，按交易所整体带 TTL
+    - 同一 TTL 周期内所有账户共用一次批量请求，保证各账户使用同一组 mark price
+    - 并发调用方在同一把锁上等待，只有一个线程真正发请求
+    - 刷新失败时继续使用旧表（不会比原来的反推更差）
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else get_market_data_config().ttl
+        self._tables: Dict[str, Tuple[float, Dict[str, MarketRecord]]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock(self, venue: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(venue, threading.Lock())
+
+    def get(self, adapter: ExchangeAdapter, symbols: Iterable[str] = ()) -> Dict[str, MarketRecord]:
+        """返回该交易所的行情表，过期或缺少 symbols 中的合约时刷新"""
+        symbols = set(symbols)
+        with self._lock(adapter.name):
+            fetched_at, table = self._tables.get(adapter.name, (0.0, {}))
+            fresh = time.monotonic() - fetched_at < self.ttl
+            if fresh and symbols.issubset(table):
+                metrics.inc("cache_lookups", cache="market_data", result="hit")
+                return table
+            metrics.inc("cache_lookups", cache="market_data", result="miss")
+            try:
+                # 按需请求的交易所（GRVT）把已缓存的合约一起刷新
+                with metrics.timer("market_data_call", exchange=adapter.name):
+                    table = adapter.fetch_market_data(sorted(symbols | set(table)))
+                self._tables[adapter.name] = (time.monotonic(), table)
+            except NotImplementedError:
+                self._tables[adapter.name] = (time.monotonic(), table)
+            except Exception as e:
+                print(f"{adapter.display_name} 行情刷新失败，沿用旧数据: {e}")
+            return table
+
+    def mark(self, venue: str, symbol: str) -> Optional[float]:
+        """只读查询，不触发刷新"""
+        record = self._tables.get(venue, (0.0, {}))[1].get(symbol)
+        return record.mark if record and record.mark > 0 else None
+
+
+_cache: Optional[MarketDataCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_market_cache() -> MarketDataCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MarketDataCache()
+        return _cache
@@ -0,0 +1,336 @@
+"""
+多进程分片：账户按稳定哈希分到 N 个 worker 进程，每个 worker 抓取、解析并汇总自己的账户，
+协调进程只合并各分片的列式数组（账户级数组拼接、交易所级求和），得到与单进程相同结构的 Snapshot
+
+数组通过共享内存传递（worker 写入一块 SharedMemory，管道里只发送名字和布局），不对数组做 pickle
+公共行情由协调进程每轮统一取一次，随请求发给所有 worker，worker 只补取本轮新出现的合约
+多台主机部署时每台运行一个分片：python cli.py watch --shard 0/4 ...
+"""
+import hashlib
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from aggregator import SNAPSHOT_PLAN, Snapshot, load_markets
+from columnar import PositionTable
+from exchanges.base import ExchangeAdapter
+from exchanges.registry import get_adapters
+from fetcher import STATUS_STALE, FetchEngine, get_engine
+from market_data import get_market_cache
+from utils import metrics
+from utils.config_loader import get_fetch_config, get_market_data_config, get_sharding_config
+from utils.resilience import set_limit_share
+
+# 按账户对齐的数组（PositionTable 的字段 + compute_aggregates 的账户级结果）
+ACCOUNT_TABLE_ARRAYS = ("account_venue", "account_equity", "account_available")
+ACCOUNT_AGG_ARRAYS = ("account_net", "account_gross", "account_net_leverage", "account_gross_leverage")
+# 按持仓对齐的数组
+POSITION_ARRAYS = ("pos_account", "pos_instrument", "pos_symbol", "size", "mark", "notional", "liq_price")
+# 按交易所对齐、可直接相加的部分和
+VENUE_ARRAYS = ("venue_equity", "venue_net", "venue_gross")
+
+Layout = List[Tuple[str, str, Tuple[int, ...], int]]  # (名字, dtype, shape, 字节偏移)
+
+
+def stable_shard(key: str, n_shards: int) -> int:
+    """与进程 / 主机无关的分片号（内置 hash 对 str 按进程加盐，不能用）"""
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % n_shards
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """"2/4" -> (2, 4)"""
+    shard, _, n_shards = value.partition("/")
+    shard, n_shards = int(shard), int(n_shards or 0)
+    if n_shards < 1 or not 0 <= shard < n_shards:
+        raise ValueError(f"分片格式应为 <序号>/<总数>，序号从 0 开始: {value}")
+    return shard, n_shards
+
+
+def shard_accounts(adapters: List[ExchangeAdapter], shard: int, n_shards: int) -> Dict[ExchangeAdapter, List[Any]]:
+    """按 "<交易所>:<account_key>" 的稳定哈希选出属于该分片的账户；账户序号仍按全部账户编号"""
+    return {
+        adapter: [account for account in adapter.load_accounts()
+                  if stable_shard(f"{adapter.name}:{account.account_key}", n_shards) == shard]
+        for adapter in adapters
+    }
+
+
+def complete_markets(adapters: List[ExchangeAdapter], fetched: Dict[str, List[Dict[str, Any]]],
+                     markets: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """在协调进程下发的行情基础上，只补取本分片持有但其中缺少的合约（如本轮新开的仓位）"""
+    if not get_market_data_config().enabled:
+        return {}
+    result = {}
+    with metrics.timer("stage", stage="markets"):
+        for adapter in adapters:
+            table = markets.get(adapter.name, {})
+            missing = {pos.symbol for acc in fetched.get(adapter.name, []) for pos in acc.get("positions", [])}
+            missing.difference_update(table)
+            if missing:
+                try:
+                    table = {**table, **adapter.fetch_market_data(sorted(missing))}
+                except NotImplementedError:
+                    pass
+                except Exception as e:
+                    print(f"{adapter.display_name} 行情补取失败: {e}")
+            result[adapter.name] = table
+    return result
+
+
+def load_shard_snapshot(shard: int, n_shards: int, adapters: Optional[List[ExchangeAdapter]] = None,
+                        engine: Optional[FetchEngine] = None,
+                        markets: Optional[Dict[str, Dict[str, Any]]] = None) -> Snapshot:
+    """只抓取并汇总一个分片的账户；markets 为协调进程预先取好的行情，为 None 时本进程自行获取"""
+    adapters = adapters if adapters is not None else get_adapters()
+    fetched = (engine or get_engine()).fetch_accounts(shard_accounts(adapters, shard, n_shards), SNAPSHOT_PLAN)
+    if markets is None:
+        return Snapshot(adapters, fetched, load_markets(adapters, fetched))
+    return Snapshot(adapters, fetched, complete_markets(adapters, fetched, markets))
+
+
+# ---- 共享内存 ----
+
+def pack_arrays(arrays: Dict[str, np.ndarray]) -> Tuple[shared_memory.SharedMemory, Layout]:
+    """把一组数组连续写入一块新的共享内存（每个数组按 8 字节对齐）"""
+    layout: Layout = []
+    offset = 0
+    for name, array in arrays.items():
+        layout.append((name, array.dtype.str, array.shape, offset))
+        offset += -(-array.nbytes // 8) * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 8))
+    for (_, dtype, shape, start), array in zip(layout, arrays.values()):
+        np.ndarray(shape, dtype, buffer=shm.buf, offset=start)[...] = array
+    return shm, layout
+
+
+def unpack_arrays(name: str, layout: Layout) -> Dict[str, np.ndarray]:
+    """读出共享内存中的数组（复制一份），随后释放这块共享内存"""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return {key: np.ndarray(shape, dtype, buffer=shm.buf, offset=start).copy()
+                for key, dtype, shape, start in layout}
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def snapshot_part(snapshot: Snapshot) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """分片快照 -> (部分汇总数组, 少量元数据)"""
+    table, aggs = snapshot.table, snapshot.aggs
+    arrays = {name: getattr(table, name) for name in ACCOUNT_TABLE_ARRAYS + POSITION_ARRAYS}
+    arrays.update({name: aggs[name] for name in ACCOUNT_AGG_ARRAYS + VENUE_ARRAYS})
+    meta = {"account_meta": table.account_meta, "instruments": table.instruments, "pos_symbols": table.symbols,
+            "symbols": snapshot.symbols}
+    return {name: np.ascontiguousarray(array) for name, array in arrays.items()}, meta
+
+
+def merge_parts(adapters: List[ExchangeAdapter], parts: List[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]) -> Snapshot:
+    """
+    合并各分片的部分汇总：账户 / 持仓数组拼接（合约编码和账户下标重映射），交易所部分和相加
+    账户按 (交易所, 账户序号) 排序，与单进程快照的顺序一致
+    """
+    n_venues = len(adapters)
+    codes: Dict[str, int] = {}
+    symbol_codes: Dict[str, int] = {}
+    account_meta: List[Dict[str, Any]] = []
+    columns: Dict[str, List[np.ndarray]] = {name: [] for name in ACCOUNT_TABLE_ARRAYS + ACCOUNT_AGG_ARRAYS + POSITION_ARRAYS}
+    venue_sums = {name: np.zeros(n_venues) for name in VENUE_ARRAYS}
+
+    offset = 0
+    for arrays, meta in parts:
+        remap = np.asarray([codes.setdefault(inst, len(codes)) for inst in meta["instruments"]], dtype=np.int32)
+        symbol_remap = np.asarray([symbol_codes.setdefault(symbol, len(symbol_codes))
+                                   for symbol in meta["pos_symbols"]], dtype=np.int32)
+        for name in ACCOUNT_TABLE_ARRAYS + ACCOUNT_AGG_ARRAYS + POSITION_ARRAYS:
+            columns[name].append(arrays[name])
+        columns["pos_account"][-1] = arrays["pos_account"] + offset
+        columns["pos_instrument"][-1] = remap[arrays["pos_instrument"]] if len(remap) else arrays["pos_instrument"]
+        columns["pos_symbol"][-1] = symbol_remap[arrays["pos_symbol"]] if len(symbol_remap) else arrays["pos_symbol"]
+        for name in VENUE_ARRAYS:
+            venue_sums[name] += arrays[name]
+        account_meta.extend(meta["account_meta"])
+        offset += len(meta["account_meta"])
+
+    merged = {name: np.concatenate(chunks) if chunks else np.zeros(0) for name, chunks in columns.items()}
+    merged["account_venue"] = merged["account_venue"].astype(np.int16)
+    merged["pos_account"] = merged["pos_account"].astype(np.int32)
+    merged["pos_instrument"] = merged["pos_instrument"].astype(np.int32)
+    merged["pos_symbol"] = merged["pos_symbol"].astype(np.int32)
+
+    order = np.lexsort((np.asarray([meta.get("account_index", 0) for meta in account_meta], dtype=np.int64),
+                        merged["account_venue"]))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    for name in ACCOUNT_TABLE_ARRAYS + ACCOUNT_AGG_ARRAYS:
+        merged[name] = merged[name][order]
+    account_meta = [account_meta[i] for i in order.tolist()]
+    merged["pos_account"] = rank[merged["pos_account"]].astype(np.int32)
+    pos_order = np.argsort(merged["pos_account"], kind="stable")
+    for name in POSITION_ARRAYS:
+        merged[name] = merged[name][pos_order]
+
+    table = PositionTable(
+        venues=[adapter.name for adapter in adapters], instruments=list(codes), symbols=list(symbol_codes),
+        account_meta=account_meta,
+        **{name: merged[name] for name in ACCOUNT_TABLE_ARRAYS + POSITION_ARRAYS},
+    )
+    aggs = {name: merged[name] for name in ACCOUNT_AGG_ARRAYS}
+    aggs.update(venue_sums)
+    aggs.update({
+        "total_equity": float(venue_sums["venue_equity"].sum()),
+        "total_net": float(venue_sums["venue_net"].sum()),
+        "total_gross": float(venue_sums["venue_gross"].sum()),
+    })
+    symbols: Dict[str, Dict[str, str]] = {}
+    for _, meta in parts:
+        for venue, mapping in meta["symbols"].items():
+            symbols.setdefault(venue, {}).update(mapping)
+    return Snapshot.from_parts(adapters, table, aggs, symbols)  # 时间一致性由合并后的 account_meta 重新计算
+
+
+# ---- worker / 协调进程 ----
+
+def _worker_main(conn, shard: int, n_shards: int, initializer: Optional[Callable[[], Any]]):
+    """
+    worker 进程：收到 ("snapshot", 行情) 就抓取并汇总本分片，把数组写入共享内存后回复 (名字, 布局, 元数据)
+    """
+    set_limit_share(1 / n_shards)  # 所有 worker 合计的请求速率和并发与单进程相同
+    if initializer is not None:
+        initializer()
+    adapters = get_adapters()
+    engine = FetchEngine(share=1 / n_shards)  # 每个 worker 保留自己分片的 last-good 缓存和登录态
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        _, markets = request
+        try:
+            arrays, meta = snapshot_part(load_shard_snapshot(shard, n_shards, adapters, engine, markets))
+            shm, layout = pack_arrays(arrays)
+            conn.send(("ok", shm.name, layout, meta))
+            shm.close()  # 由协调进程读完后 unlink
+        except Exception as e:
+            conn.send(("error", None, None, f"{type(e).__name__}: {e}"))
+
+
+class ShardedSnapshotSource:
+    """
+    启动 workers 个常驻 worker 进程（spawn），load_snapshot() 并行触发所有分片并合并结果
+    超时或出错的分片沿用它上一轮的结果（账户标记为 stale）；worker 退出时自动重启
+    initializer 在每个 worker 启动时调用（需可 pickle），例如压测时把请求改写到模拟交易所
+    """
+
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None,
+                 initializer: Optional[Callable[[], Any]] = None):
+        config = get_sharding_config()
+        self.workers = max(1, workers or config.workers)
+        self.timeout = timeout if timeout is not None else max(config.timeout, get_fetch_config().deadline)
+        self.initializer = initializer
+        self.adapters = get_adapters()
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[Any] = [None] * self.workers
+        self._conns: List[Any] = [None] * self.workers
+        self._busy = [False] * self.workers
+        self._last: List[Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]] = [None] * self.workers
+        self._symbols: Dict[str, Dict[str, str]] = {}  # 上一轮合并快照中持有的合约，用于预取行情
+        self._lock = threading.Lock()
+
+    def _spawn(self, shard: int):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child, shard, self.workers, self.initializer),
+                                        name=f"shard-{shard}", daemon=True)
+        process.start()
+        child.close()
+        self._processes[shard], self._conns[shard], self._busy[shard] = process, parent, False
+
+    def start(self) -> "ShardedSnapshotSource":
+        for shard in range(self.workers):
+            self._spawn(shard)
+        print(f"分片模式: {self.workers} 个 worker 进程")
+        return self
+
+    def _receive(self, shard: int) -> bool:
+        """读取一个分片的回复；成功时存为该分片的最新部分汇总"""
+        self._busy[shard] = False
+        status, name, layout, payload = self._conns[shard].recv()
+        if status != "ok":
+            print(f"分片 {shard} 汇总失败: {payload}")
+            return False
+        self._last[shard] = (unpack_arrays(name, layout), payload)
+        return True
+
+    def _stale_part(self, shard: int) -> Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]:
+        last = self._last[shard]
+        if last is None:
+            print(f"分片 {shard} 没有可用数据，本轮缺少该分片的账户")
+            return None
+        arrays, meta = last
+        return arrays, dict(meta, account_meta=[dict(m, status=STATUS_STALE) for m in meta["account_meta"]])
+
+    def _prefetch_markets(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        每个交易所一次行情请求（批量接口一次取回全市场，按合约请求的交易所取上一轮持有的合约），所有 worker 共用
+        关闭公共行情时返回 None，由 worker 按原逻辑处理
+        """
+        if not get_market_data_config().enabled:
+            return None
+        cache = get_market_cache()
+        with metrics.timer("stage", stage="markets"):
+            return {adapter.name: cache.get(adapter, self._symbols.get(adapter.name, ())) for adapter in self.adapters}
+
+    def load_snapshot(self) -> Snapshot:
+        with self._lock:
+            markets = self._prefetch_markets()
+            for shard in range(self.workers):
+                if not self._processes[shard].is_alive():
+                    print(f"分片 {shard} 的 worker 已退出，重新启动")
+                    self._spawn(shard)
+                # worker 可能在 is_alive() 之后退出：下发失败的分片本轮按 stale 处理，不影响其他分片
+                try:
+                    if self._busy[shard] and self._conns[shard].poll():
+                        self._receive(shard)  # 上一轮超时后才到的结果
+                    if not self._busy[shard]:
+                        self._conns[shard].send(("snapshot", markets))
+                        self._busy[shard] = True
+                except (EOFError, OSError) as e:
+                    print(f"分片 {shard} 连接中断: {e}")
+                    self._busy[shard] = False
+            started = time.monotonic()
+            fresh = set()
+            deadline = started + self.timeout
+            for shard in range(self.workers):
+                if not self._busy[shard]:
+                    continue
+                try:
+                    if self._conns[shard].poll(max(0.0, deadline - time.monotonic())) and self._receive(shard):
+                        fresh.add(shard)
+                except (EOFError, OSError) as e:
+                    print(f"分片 {shard} 连接中断: {e}")
+                    self._busy[shard] = False
+            parts = [self._last[shard] if shard in fresh else self._stale_part(shard)
+                     for shard in range(self.workers)]
+            snapshot = merge_parts(self.adapters, [part for part in parts if part is not None])
+            self._symbols = snapshot.symbols
+            print(f"分片汇总完成: {len(fresh)}/{self.workers} 个分片按时返回, 用时 {time.monotonic() - started:.2f}s")
+            return snapshot
+
+    def close(self):
+        for shard, conn in enumerate(self._conns):
+            if conn is None:
+                continue
+            try:
+                if self._busy[shard] and conn.poll(1.0):
+                    self._receive(shard)  # 释放未读取的共享内存
+                conn.send(None)
+            except (EOFError, OSError):
+                pass
+            conn.close()
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=5)
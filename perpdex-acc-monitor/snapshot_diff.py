@@ -0,0 +1,175 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from fetcher import STATUS_OK
+from utils.config_loader import DiffConfig, get_diff_config
+
+AccountKey = Tuple[str, str]          # (venue, account_key)
+PositionKey = Tuple[str, str, str]    # (venue, account_key, 交易所合约名)
+
+
+class AccountState(NamedTuple):
+    label: str
+    status: str
+    equity: float
+    gross_leverage: float
+
+
+class PositionState(NamedTuple):
+    label: str        # 账户展示名
+    instrument: str   # 统一合约名，只用于展示（同一账户可能有多个交易所合约对应同一个统一合约名）
+    size: float
+    notional: float
+
+
+class Change(NamedTuple):
+    kind: str         # status / opened / closed / flipped / resized / equity / leverage
+    subject: str
+    text: str
+
+
+class Baseline(NamedTuple):
+    """上一次推送时的按 key 索引的账户 / 持仓状态"""
+    total_equity: float
+    accounts: Dict[AccountKey, AccountState]
+    positions: Dict[PositionKey, PositionState]
+
+
+# 消息中各类变化的先后顺序
+KIND_ORDER = ("status", "opened", "closed", "flipped", "resized", "equity", "leverage")
+
+
+def baseline_of(snapshot) -> Baseline:
+    """从快照 (aggregator.Snapshot) 的列式表中取出按 key 索引的账户 / 持仓记录"""
+    table, aggs = snapshot.table, snapshot.aggs
+    venues = [table.venues[v] for v in table.account_venue.tolist()]
+    keys = [(venues[i], meta["account_key"]) for i, meta in enumerate(table.account_meta)]
+    accounts = {
+        keys[i]: AccountState(meta["label"], meta["status"], equity, leverage)
+        for i, (meta, equity, leverage) in enumerate(zip(
+            table.account_meta, table.account_equity.tolist(), aggs["account_gross_leverage"].tolist()))
+    }
+    positions = {}
+    for a, code, symbol, size, notional in zip(table.pos_account.tolist(), table.pos_instrument.tolist(),
+                                               table.pos_symbol.tolist(), table.size.tolist(), table.notional.tolist()):
+        positions[keys[a] + (table.symbols[symbol],)] = PositionState(
+            table.account_meta[a]["label"], table.instruments[code], size, notional)
+    return Baseline(aggs["total_equity"], accounts, positions)
+
+
+def diff_baselines(old: Baseline, new: Baseline, config: DiffConfig) -> Tuple[List[Change], Baseline]:
+    """
+    比较两次快照，返回 (达到阈值的变化, 下一次比较用的基准)
+    只有两边都是 ok 的账户才比较权益 / 杠杆 / 持仓；stale / failed 的账户只报告状态变化，
+    并沿用它上一次的记录作为基准，恢复后再与恢复前的最后一次正常数据比较
+    """
+    changes: List[Change] = []
+    accounts = dict(new.accounts)
+    positions = dict(new.positions)
+
+    for key in old.accounts.keys() | new.accounts.keys():
+        before, after = old.accounts.get(key), new.accounts.get(key)
+        if before is None:
+            changes.append(Change("status", after.label, f"🆕 {after.label} 新增账户，权益 ${after.equity:,.0f}"))
+            continue
+        if after is None:
+            changes.append(Change("status", before.label, f"➖ {before.label} 账户已移除"))
+            continue
+        if before.status != after.status:
+            changes.append(Change("status", after.label, f"🔁 {after.label} 状态 {before.status} → {after.status}"))
+        if after.status != STATUS_OK:
+            accounts[key] = before._replace(status=after.status)  # 数据不可信，保留旧基准
+            for pos_key in [k for k in positions if k[:2] == key]:
+                del positions[pos_key]
+            positions.update({k: v for k, v in old.positions.items() if k[:2] == key})
+            continue
+        if before.status != STATUS_OK:
+            continue  # 刚恢复：状态变化已报告，数值与恢复前的旧数据比较意义不大
+
+        delta = after.equity - before.equity
+        if abs(delta) >= config.equity_abs and before.equity > 0 and abs(delta) / before.equity * 100 >= config.equity_pct:
+            changes.append(Change("equity", after.label, f"💰 {after.label} 权益 ${before.equity:,.0f} → "
+                                                         f"${after.equity:,.0f}（{delta / before.equity:+.1%}）"))
+        else:
+            accounts[key] = accounts[key]._replace(equity=before.equity)  # 未达阈值：变化继续累积
+        if abs(after.gross_leverage - before.gross_leverage) >= config.leverage_abs:
+            changes.append(Change("leverage", after.label, f"📈 {after.label} 总杠杆 {before.gross_leverage:.2f}x → "
+                                                           f"{after.gross_leverage:.2f}x"))
+        else:
+            accounts[key] = accounts[key]._replace(gross_leverage=before.gross_leverage)
+
+    for key in old.positions.keys() | new.positions.keys():
+        account = new.accounts.get(key[:2])
+        if account is None or account.status != STATUS_OK or old.accounts.get(key[:2], account).status != STATUS_OK:
+            continue
+        before, after = old.positions.get(key), new.positions.get(key)
+        instrument = (after or before).instrument
+        if before is None:
+            changes.append(Change("opened", instrument, f"🟢 {after.label} 开仓 {instrument} {after.size:+g}"
+                                                        f"（${after.notional:,.0f}）"))
+        elif after is None:
+            changes.append(Change("closed", instrument, f"⚪ {before.label} 平仓 {instrument}（原 {before.size:+g}）"))
+        elif (before.size > 0) != (after.size > 0):
+            changes.append(Change("flipped", instrument, f"🔄 {after.label} {instrument} 反向 "
+                                                         f"{before.size:+g} → {after.size:+g}"))
+        elif abs(after.size - before.size) * 100 >= abs(before.size) * config.resize_pct:
+            changes.append(Change("resized", instrument, f"↕️ {after.label} {instrument} 调仓 "
+                                                         f"{before.size:+g} → {after.size:+g}"))
+        else:
+            positions[key] = before  # 小幅变化不推送，也不移动基准
+
+    changes.sort(key=lambda change: (KIND_ORDER.index(change.kind), change.text))
+    return changes, Baseline(new.total_equity, accounts, positions)
+
+
+def format_changes(changes: List[Change], old_total: float, new_total: float, max_lines: int = 30) -> str:
+    """变化推送的文字：总权益一行 + 每项变化一行，超过 max_lines 时截断"""
+    delta = new_total - old_total
+    pct = f"，{delta / old_total:+.2%}" if old_total > 0 else ""
+    lines = [f"总权益 ${new_total:,.0f}（{delta:+,.0f}{pct}）"]
+    lines += [change.text for change in changes[:max_lines]]
+    if len(changes) > max_lines:
+        lines.append(f"…另有 {len(changes) - max_lines} 项变化")
+    return "\n".join(lines)
+
+
+class DiffEngine:
+    """
+    记住上一次推送的基准，check(snapshot) 返回相对基准达到阈值的变化
+    有变化时基准前移到本次快照（未达阈值的小变化留在基准中继续累积）；第一次调用只建立基准
+    每个推送通道（文字变化 / 定时图片）各用一个实例
+    """
+
+    def __init__(self, config: Optional[DiffConfig] = None):
+        self.config = config or get_diff_config()
+        self.baseline: Optional[Baseline] = None
+
+    def check(self, snapshot) -> Tuple[List[Change], float]:
+        """返回 (变化列表, 基准的总权益)；没有基准时返回空列表"""
+        new = baseline_of(snapshot)
+        old = self.baseline
+        if old is None:
+            self.baseline = new
+            return [], new.total_equity
+        changes, baseline = diff_baselines(old, new, self.config)
+        if changes:
+            self.baseline = baseline
+        return changes, old.total_equity
+
+    def peek(self, snapshot) -> Tuple[List[Change], float]:
+        """与 check 相同的比较，但不移动基准（例如只有推送成功后才应前移的场景）；没有基准时返回空列表"""
+        new = baseline_of(snapshot)
+        old = self.baseline
+        if old is None:
+            return [], new.total_equity
+        changes, _ = diff_baselines(old, new, self.config)
+        return changes, old.total_equity
+
+    def commit(self, snapshot):
+        """
+        peek 之后推送成功时调用：按 check 的规则前移基准（已推送的变化前移，未达阈值的小变化继续累积）
+        与 reset 不同，不会把尚未推送的小变化一并吞掉
+        """
+        self.check(snapshot)
+
+    def reset(self, snapshot):
+        """把基准直接设为该快照（例如刚推送了完整图片）"""
+        self.baseline = baseline_of(snapshot)
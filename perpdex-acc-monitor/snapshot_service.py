@@ -0,0 +1,109 @@
+import threading
+import time
+from concurrent.futures import Future
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional
+from aggregator import Snapshot, load_snapshot
+from history_store import get_history_store
+from image_generator import render_summary_image
+from utils import metrics
+from utils.config_loader import get_snapshot_config
+
+
+class _SingleFlight:
+    """同一时刻只执行一次 fn，期间到达的调用方等待并共享同一个结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Optional[Future] = None
+
+    def do(self, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._inflight
+            leader = future is None
+            if leader:
+                future = self._inflight = Future()
+        if leader:
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight = None
+        return future.result()
+
+
+class SnapshotService:
+    """
+    全进程共享的快照 / 图片缓存
+    - 快照在 max_age 秒内直接复用，过期后由第一个请求抓取，并发请求共享这一次抓取
+    - 图片按快照缓存，快照未变时 /summary、/now 直接返回已渲染的 PNG
+    """
+
+    def __init__(self, max_age: Optional[float] = None, book=None,
+                 loader: Optional[Callable[[], Snapshot]] = None):
+        self.max_age = max_age if max_age is not None else get_snapshot_config().max_age
+        self.book = book  # 流式模式下的 AccountBook，为 None 时走 REST
+        # 自定义快照来源（如分片模式的 ShardedSnapshotSource.load_snapshot），默认在本进程抓取
+        self.loader = loader or (lambda: load_snapshot(self.book))
+        self.history = get_history_store()  # 历史存储关闭时为 None
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Snapshot] = None
+        self._image: Optional[bytes] = None
+        self._image_snapshot: Optional[Snapshot] = None
+        self._fetch_flight = _SingleFlight()
+        self._render_flight = _SingleFlight()
+
+    def _is_fresh(self, snapshot: Optional[Snapshot], max_age: float) -> bool:
+        return snapshot is not None and time.time() - snapshot.taken_at <= max_age
+
+    def _fetch(self) -> Snapshot:
+        snapshot = self.loader()
+        with self._lock:
+            self._snapshot = snapshot
+        if self.history is not None:
+            self.history.record(snapshot)  # 只入队，由后台线程落库
+        return snapshot
+
+    def get_snapshot(self, max_age: Optional[float] = None) -> Snapshot:
+        """max_age=0 表示需要新数据（但仍会与正在进行的抓取合并）"""
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            snapshot = self._snapshot
+        if self._is_fresh(snapshot, max_age):
+            metrics.inc("cache_lookups", cache="snapshot", result="hit")
+            return snapshot
+        metrics.inc("cache_lookups", cache="snapshot", result="miss")
+        return self._fetch_flight.do(self._fetch)
+
+    def get_view(self, max_age: Optional[float] = None) -> Dict[str, Any]:
+        return self.get_snapshot(max_age).view()
+
+    def _render(self, snapshot: Snapshot) -> bytes:
+        with self._lock:
+            if self._image is not None and self._image_snapshot is snapshot:
+                return self._image
+        view = snapshot.view()
+        with metrics.timer("stage", stage="render"):
+            image = render_summary_image(view).getvalue()
+        with self._lock:
+            self._image, self._image_snapshot = image, snapshot
+        return image
+
+    def image_for(self, snapshot: Snapshot) -> BytesIO:
+        """渲染（或直接取缓存）指定快照的 PNG；每次返回新的 BytesIO，调用方可以各自读取"""
+        with self._lock:
+            if self._image is not None and self._image_snapshot is snapshot:
+                metrics.inc("cache_lookups", cache="image", result="hit")
+                return BytesIO(self._image)
+        metrics.inc("cache_lookups", cache="image", result="miss")
+        image = self._render_flight.do(lambda: self._render(snapshot))
+        if self._image_snapshot is not snapshot:
+            # 合并到了另一个快照的渲染上，单独再渲染一次
+            image = self._render(snapshot)
+        return BytesIO(image)
+
+    def get_image(self, max_age: Optional[float] = None) -> BytesIO:
+        """返回最新快照对应的 PNG"""
+        return self.image_for(self.get_snapshot(max_age))
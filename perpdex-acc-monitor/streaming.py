@@ -0,0 +1,254 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from websockets.asyncio.client import connect
+from exchanges.base import BalanceRecord, ExchangeAdapter, PositionRecord
+from exchanges.registry import get_adapters
+from fetcher import STATUS_FAILED, STATUS_OK, STATUS_STALE, account_status, fetch_plan, get_engine
+from utils.config_loader import get_streaming_config
+from utils import json_codec
+
+
+class AccountState:
+    __slots__ = ("account", "account_index", "account_info", "balance", "positions",
+                 "connected", "disconnected_at", "updated_at", "reconciled_at", "pushed_at")
+
+    def __init__(self, account: Any):
+        self.account = account
+        self.account_index = account.account_index
+        self.account_info = account.account_info()
+        self.balance: Optional[BalanceRecord] = None
+        self.positions: Dict[str, PositionRecord] = {}  # symbol -> 持仓
+        self.connected = False
+        self.disconnected_at: Optional[float] = None
+        self.updated_at: Optional[float] = None
+        self.reconciled_at: Optional[float] = None  # 最近一次 REST 对账发起的时间
+        # 对账之后应用过的推送的交易所事件时间：("balance", "") / ("position", symbol) -> Unix 秒
+        self.pushed_at: Dict[Tuple[str, str], float] = {}
+
+
+class AccountBook:
+    """
+    内存中的账户 / 持仓簿，由 WebSocket 推送增量更新，断线重连后用 REST 全量对账
+    推送与 REST 按时间排序：事件时间不晚于对账发起时间的推送被丢弃，对账期间到达的更新推送不会被 REST 结果覆盖
+    （推送带的是交易所事件时间，对账时间取本地时钟，两者的偏差由下一次定期对账纠正）
+    读取 (snapshot) 不做任何网络 I/O
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._accounts: Dict[Tuple[str, str], AccountState] = {}
+
+    def register(self, venue: str, account: Any):
+        with self._lock:
+            self._accounts.setdefault((venue, account.account_key), AccountState(account))
+
+    def reconcile(self, venue: str, account_key: str, balance: Optional[BalanceRecord],
+                  positions: List[PositionRecord], as_of: Optional[float] = None):
+        """
+        用 REST 结果整体替换该账户状态；as_of 为发起 REST 请求的时间（默认当前时间）
+        事件时间晚于 as_of 的已应用推送比 REST 结果新，予以保留
+        """
+        as_of = time.time() if as_of is None else as_of
+        with self._lock:
+            state = self._accounts[(venue, account_key)]
+            newer = {key for key, event_time in state.pushed_at.items() if event_time > as_of}
+            if balance is not None and ("balance", "") not in newer:
+                state.balance = balance
+            current = state.positions
+            state.positions = {pos.symbol: pos for pos in positions if pos.size != 0}
+            for kind, symbol in newer:
+                if kind != "position":
+                    continue
+                if symbol in current:
+                    state.positions[symbol] = current[symbol]
+                else:
+                    state.positions.pop(symbol, None)
+            state.pushed_at = {key: state.pushed_at[key] for key in newer}
+            state.reconciled_at = max(as_of, state.reconciled_at or as_of)
+            state.updated_at = time.time()
+
+    def apply(self, venue: str, account_key: str, kind: str, record: Any) -> bool:
+        """
+        应用一条推送：balance 整体替换，position 按 symbol 覆盖，size 为 0 视为平仓
+        带事件时间的推送若不晚于最近一次对账或同一条目已应用的推送，则视为过期丢弃，返回 False
+        """
+        key = (kind, record.symbol if kind == "position" else "")
+        event_time = getattr(record, "event_time", None)
+        with self._lock:
+            state = self._accounts[(venue, account_key)]
+            if event_time is not None:
+                if event_time <= (state.reconciled_at or 0.0) or event_time < state.pushed_at.get(key, 0.0):
+                    return False
+                state.pushed_at[key] = event_time
+            if kind == "balance":
+                state.balance = record
+            elif kind == "position":
+                if record.size == 0:
+                    state.positions.pop(record.symbol, None)
+                else:
+                    state.positions[record.symbol] = record
+            state.updated_at = time.time()
+            return True
+
+    def set_connected(self, venue: str, account_key: str, connected: bool):
+        with self._lock:
+            state = self._accounts[(venue, account_key)]
+            state.connected = connected
+            state.disconnected_at = None if connected else time.time()
+
+    def snapshot(self, stale_after: float) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        返回与 FetchEngine.fetch_accounts 相同格式的数据
+        从未同步成功的账户为 failed，断线超过 stale_after 秒（且之后没有 REST 补抓）的账户为 stale
+        """
+        now = time.time()
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for (venue, _), state in self._accounts.items():
+                if state.updated_at is None:
+                    status = STATUS_FAILED
+                elif not state.connected and now - max(state.disconnected_at or now, state.updated_at) > stale_after:
+                    status = STATUS_STALE
+                else:
+                    status = STATUS_OK
+                record = dict(state.account_info)
+                record["summary"] = state.balance
+                record["positions"] = list(state.positions.values())
+                record["status"] = {"summary": status, "positions": status}
+                record["as_of"] = {} if state.updated_at is None else \
+                    {"summary": state.updated_at, "positions": state.updated_at}
+                record["event_time"] = {"summary": state.balance.event_time} if state.balance else {}
+                record["errors"] = {}
+                result.setdefault(venue, []).append(record)
+        return result
+
+    def stale_accounts(self, max_staleness: float) -> Dict[str, List[Any]]:
+        """断线中且超过 max_staleness 秒没有更新（含从未同步成功）的账户对象，按交易所分组"""
+        now = time.time()
+        result: Dict[str, List[Any]] = {}
+        with self._lock:
+            for (venue, _), state in self._accounts.items():
+                if not state.connected and (state.updated_at is None or now - state.updated_at > max_staleness):
+                    result.setdefault(venue, []).append(state.account)
+        return result
+
+    def refresh_stale(self, adapters: List[ExchangeAdapter], max_staleness: float) -> int:
+        """
+        定向 REST 补抓断线过久的账户（只请求这些账户，其余账户继续使用推送数据），成功的结果写回账户簿
+        返回补抓的账户数
+        """
+        stale = self.stale_accounts(max_staleness)
+        targets = {adapter: stale[adapter.name] for adapter in adapters if stale.get(adapter.name)}
+        if not targets:
+            return 0
+        as_of = time.time()
+        fetched = get_engine().fetch_accounts(targets, fetch_plan("summary", "positions"))
+        for venue, records in fetched.items():
+            for record in records:
+                if account_status(record) == STATUS_OK:
+                    self.reconcile(venue, record["account_key"], record["summary"], record["positions"], as_of)
+        return sum(len(accounts) for accounts in targets.values())
+
+
+class StreamRunner:
+    """在后台线程的事件循环中维护所有账户的 WebSocket 连接"""
+
+    def __init__(self, book: AccountBook, adapters: Optional[List[ExchangeAdapter]] = None):
+        self.book = book
+        self.adapters = adapters if adapters is not None else get_adapters()
+        self.config = get_streaming_config()
+        self._accounts: List[Tuple[ExchangeAdapter, Any]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> threading.Thread:
+        for adapter in self.adapters:
+            for account in adapter.load_accounts():
+                self.book.register(adapter.name, account)
+                self._accounts.append((adapter, account))
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), name="streaming", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        if self._loop and self._stop:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        tasks = [asyncio.create_task(self._run_account(adapter, account)) for adapter, account in self._accounts]
+        tasks.append(asyncio.create_task(self._reconcile_loop()))
+        await self._stop.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _reconcile(self, adapter: ExchangeAdapter, account: Any):
+        loop = asyncio.get_running_loop()
+        as_of = time.time()
+        balance = await loop.run_in_executor(None, adapter.fetch_summary, account)
+        positions = await loop.run_in_executor(None, adapter.fetch_positions, account)
+        self.book.reconcile(adapter.name, account.account_key, balance, positions, as_of)
+
+    async def _reconcile_loop(self):
+        """定期 REST 对账：补齐没有推送的数据（如 GRVT 余额），并纠正可能丢失的消息"""
+        while True:
+            await asyncio.sleep(self.config.reconcile_interval)
+            for adapter, account in self._accounts:
+                try:
+                    await self._reconcile(adapter, account)
+                except Exception as e:
+                    print(f"{adapter.display_name} 账户{account.account_index} 定期对账失败: {e}")
+
+    async def _run_account(self, adapter: ExchangeAdapter, account: Any):
+        loop = asyncio.get_running_loop()
+        delay = 1.0
+        while True:
+            try:
+                url, headers, messages = await loop.run_in_executor(None, adapter.ws_connect_args, account)
+                async with connect(url, additional_headers=headers) as ws:
+                    for message in messages:
+                        await ws.send(json.dumps(message))
+                    self.book.set_connected(adapter.name, account.account_key, True)
+                    # 订阅后再全量对账，断线期间错过的变化由 REST 补齐；对账期间排队的推送在对账完成后应用，
+                    # 其中事件时间早于对账的由 AccountBook.apply 丢弃
+                    await self._reconcile(adapter, account)
+                    print(f"{adapter.display_name} 账户{account.account_index} 流式连接已建立")
+                    delay = 1.0
+                    async for raw in ws:
+                        for kind, record in adapter.parse_ws_message(json_codec.loads(raw)):
+                            self.book.apply(adapter.name, account.account_key, kind, record)
+            except asyncio.CancelledError:
+                raise
+            except NotImplementedError as e:
+                print(f"{adapter.display_name} 账户{account.account_index} 跳过流式: {e}")
+                return
+            except Exception as e:
+                print(f"{adapter.display_name} 账户{account.account_index} 流式连接中断: {e}")
+            finally:
+                self.book.set_connected(adapter.name, account.account_key, False)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.config.max_reconnect_delay)
+
+
+if __name__ == "__main__":
+    from aggregator import aggregate_from_book
+
+    book = AccountBook()
+    runner = StreamRunner(book)
+    runner.start()
+    try:
+        while True:
+            time.sleep(1)
+            data = aggregate_from_book(book, runner.adapters)
+            print(f"Equity ${data['Total Equity']:,.0f}  Exposure ${data['Total Exposure']:,.0f}"
+                  f"{'  (partial)' if data['partial'] else ''}")
+    except KeyboardInterrupt:
+        runner.stop()
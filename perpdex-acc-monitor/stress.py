@@ -0,0 +1,255 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from columnar import PositionTable, underlying
+from utils.config_loader import get_stress_config
+
+# 一组情景：(情景名, S×I 的冲击矩阵)，第 s 行第 i 列为第 i 个合约在情景 s 下的价格变动（小数）
+Scenarios = Tuple[List[str], np.ndarray]
+
+STRESS_USAGE = ("参数格式：/stress [-20] 或 /stress BTC -15 ETH -10 或 /stress majors -20，"
+                "只写篮子 / 标的（如 /stress majors）时按配置的网格冲击")
+
+
+def _pct(shock: float) -> str:
+    return f"{shock * 100:+g}%"
+
+
+def _parse_level(token: str) -> Optional[float]:
+    """"-20" / "-20%" -> -0.2，不是数字时返回 None"""
+    try:
+        level = float(token.rstrip("%"))
+    except ValueError:
+        return None
+    return level / 100 if np.isfinite(level) else None
+
+
+def _grid_levels(low: float, high: float, step: float) -> np.ndarray:
+    return np.round(np.arange(low, high + step / 2, step), 6)
+
+
+def grid_scenarios(table: PositionTable, low: float = -0.30, high: float = 0.30, step: float = 0.01) -> Scenarios:
+    """全部合约同向同幅冲击，low..high（含两端）按 step 取值"""
+    levels = _grid_levels(low, high, step)
+    shocks = np.repeat(levels[:, None], len(table.instruments), axis=1)
+    return [_pct(level) for level in levels], shocks
+
+
+def instrument_scenario(table: PositionTable, shocks: Dict[str, float]) -> Scenarios:
+    """
+    单个情景：按合约名或标的分别冲击，如 {"BTC": -0.2, "ETH-USD-PERP": -0.15}
+    合约名精确匹配优先于标的匹配，未提到的合约不动
+    """
+    upper = {key.upper(): value for key, value in shocks.items()}
+    row = np.zeros(len(table.instruments))
+    for i, instrument in enumerate(table.instruments):
+        if instrument.upper() in upper:
+            row[i] = upper[instrument.upper()]
+        elif underlying(instrument) in upper:
+            row[i] = upper[underlying(instrument)]
+    name = " ".join(f"{key} {_pct(value)}" for key, value in shocks.items())
+    return [name], row[None, :]
+
+
+def basket_scenarios(table: PositionTable, baskets: Dict[str, Sequence[str]],
+                     levels: Sequence[float]) -> Scenarios:
+    """相关篮子：篮子内所有标的按同一幅度冲击，每个篮子 × 每个幅度是一个情景"""
+    underlyings = [underlying(instrument) for instrument in table.instruments]
+    names, rows = [], []
+    for basket, members in baskets.items():
+        mask = np.array([u in set(members) for u in underlyings], dtype=bool)
+        for level in levels:
+            names.append(f"{basket} {_pct(level)}")
+            rows.append(np.where(mask, level, 0.0))
+    shocks = np.vstack(rows) if rows else np.zeros((0, len(table.instruments)))
+    return names, shocks
+
+
+def target_grid_scenarios(table: PositionTable, name: str, low: float = -0.30, high: float = 0.30,
+                          step: float = 0.01) -> Scenarios:
+    """只冲击单个合约或标的（匹配规则同 instrument_scenario），幅度按 low..high / step 取网格"""
+    target = name.upper()
+    mask = np.array([instrument.upper() == target or underlying(instrument) == target
+                     for instrument in table.instruments], dtype=bool)
+    if len(table.instruments) and not mask.any():
+        raise ValueError(f"未找到篮子或合约：{name}\n{STRESS_USAGE}")
+    levels = _grid_levels(low, high, step)
+    return [f"{name} {_pct(level)}" for level in levels], np.where(mask[None, :], levels[:, None], 0.0)
+
+
+def run_stress(table: PositionTable, scenarios: Scenarios) -> Dict[str, Any]:
+    """
+    对所有情景 × 所有持仓一次性向量化计算冲击后的权益、杠杆与强平情况
+    - 盈亏和总敞口对冲击是线性的：先把持仓压成 账户×合约 的矩阵，再做一次矩阵乘法
+    - 强平：冲击后的 mark 越过 liq_price（多头向下、空头向上），或账户权益 <= 0
+    """
+    names, shocks = scenarios
+    shocks = np.asarray(shocks, dtype=np.float64)
+    n_scenarios = shocks.shape[0]
+    n_accounts, n_instruments = table.n_accounts, len(table.instruments)
+
+    cell = table.pos_account.astype(np.int64) * n_instruments + table.pos_instrument
+    net = np.bincount(cell, weights=table.notional, minlength=n_accounts * n_instruments)
+    gross = np.bincount(cell, weights=np.abs(table.notional), minlength=n_accounts * n_instruments)
+    net = net.reshape(n_accounts, n_instruments)
+    gross = gross.reshape(n_accounts, n_instruments)
+
+    pnl = shocks @ net.T                                  # S×A
+    equity = table.account_equity[None, :] + pnl
+    gross_after = gross.sum(axis=1)[None, :] + shocks @ gross.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        leverage = np.where(equity > 0, gross_after / equity, np.inf)
+
+    # 每个持仓被强平所需的价格变动：多头 shock <= liq/mark - 1，空头 shock >= liq/mark - 1
+    valid = (table.mark > 0) & (table.liq_price > 0) & (table.size != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        threshold = np.where(valid, table.liq_price / table.mark - 1, np.nan)
+    pos_shock = shocks[:, table.pos_instrument]           # S×P
+    long = table.size > 0
+    hit = np.where(long, pos_shock <= threshold, pos_shock >= threshold) & valid
+
+    # 按账户归并（位置按账户排序后 reduceat），没有持仓的账户只看权益
+    # 本来就没有权益的账户（如抓取失败按 0 计入）不算被冲击强平
+    liquidated = (equity <= 0) & (table.account_equity[None, :] > 0)
+    if table.n_positions:
+        order = np.argsort(table.pos_account, kind="stable")
+        accounts, starts = np.unique(table.pos_account[order], return_index=True)
+        liquidated[:, accounts] |= np.logical_or.reduceat(hit[:, order], starts, axis=1)
+
+    total_equity = equity.sum(axis=1)
+    total_gross = gross_after.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total_leverage = np.where(total_equity > 0, total_gross / total_equity, np.inf)
+
+    return {
+        "names": names,
+        "shocks": shocks,
+        "account_pnl": pnl,
+        "account_equity": equity,
+        "account_gross_leverage": leverage,
+        "account_liquidated": liquidated,
+        "position_liquidated": hit,
+        "positions_liquidated": hit.sum(axis=1) if n_scenarios else np.zeros(0, dtype=np.int64),
+        "total_pnl": pnl.sum(axis=1),
+        "total_equity": total_equity,
+        "total_gross_leverage": total_leverage,
+    }
+
+
+def liquidation_shocks(table: PositionTable) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    每个账户在全品种同向冲击下最先被强平的跌幅 / 涨幅（小数，无则为 nan）
+    只看持仓自身的强平价，适合在文字回复中给出“跌 x% 触发强平”的提示
+    """
+    down = np.full(table.n_accounts, np.nan)
+    up = np.full(table.n_accounts, np.nan)
+    valid = (table.mark > 0) & (table.liq_price > 0) & (table.size != 0)
+    threshold = np.where(valid, table.liq_price / np.where(valid, table.mark, 1.0) - 1, np.nan)
+    for mask, out, reduce in ((valid & (table.size > 0), down, np.fmax), (valid & (table.size < 0), up, np.fmin)):
+        if mask.any():
+            init = -np.inf if reduce is np.fmax else np.inf
+            acc = np.full(table.n_accounts, init)
+            reduce.at(acc, table.pos_account[mask], threshold[mask])
+            out[:] = np.where(np.isfinite(acc), acc, np.nan)
+    return down, up
+
+
+def stress_view(table: PositionTable, levels: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
+    """图片中的压力测试段：全品种同向冲击的几个档位"""
+    levels = get_stress_config().image_shocks if levels is None else levels
+    if not len(levels):
+        return []
+    shocks = np.repeat(np.asarray(levels, dtype=np.float64)[:, None], len(table.instruments), axis=1)
+    result = run_stress(table, ([_pct(level) for level in levels], shocks))
+    labels = [meta["label"] for meta in table.account_meta]
+    rows = []
+    for s, level in enumerate(levels):
+        rows.append({
+            "Shock": level,
+            "Equity": float(result["total_equity"][s]),
+            "PnL": float(result["total_pnl"][s]),
+            "Gross Leverage": float(result["total_gross_leverage"][s]),
+            "Liquidated": [labels[a] for a in np.flatnonzero(result["account_liquidated"][s]).tolist()],
+        })
+    return rows
+
+
+def parse_stress_args(table: PositionTable, args: Sequence[str]) -> Scenarios:
+    """
+    解析 /stress 参数：
+    - 无参数：配置中的全品种网格
+    - "-20"：全品种 -20%
+    - "BTC -15 ETH -10"：按标的 / 合约分别冲击
+    - "majors -20"：按配置中的篮子冲击
+    - "majors" / "BTC"：只冲击该篮子 / 合约，幅度取配置中的网格
+    参数不合法时抛出带用法说明的 ValueError
+    """
+    config = get_stress_config()
+    if not args:
+        return grid_scenarios(table, *config.grid)
+    if len(args) == 1:
+        level = _parse_level(args[0])
+        if level is not None:
+            return grid_scenarios(table, level, level, 1.0)
+        name = args[0]
+        if name in config.baskets:
+            return basket_scenarios(table, {name: config.baskets[name]}, _grid_levels(*config.grid))
+        return target_grid_scenarios(table, name, *config.grid)
+    levels = [_parse_level(token) for token in args[1::2]]
+    if len(args) % 2 or any(level is None for level in levels):
+        raise ValueError(STRESS_USAGE)
+    pairs = list(zip(args[::2], levels))
+    if all(name in config.baskets for name, _ in pairs):
+        names, rows = [], []
+        for name, level in pairs:
+            n, r = basket_scenarios(table, {name: config.baskets[name]}, [level])
+            names += n
+            rows.append(r)
+        return names, np.vstack(rows)
+    shocks: Dict[str, float] = {}
+    for name, level in pairs:
+        members = config.baskets.get(name, [name])
+        shocks.update({member: level for member in members})
+    return instrument_scenario(table, shocks)
+
+
+def format_stress(table: PositionTable, result: Dict[str, Any], max_lines: int = 20, max_hints: int = 10) -> str:
+    """
+    压力测试结果的文字版；情景很多（网格）时抽样列出，并保留强平账户数变化处的档位
+    末尾附上离强平最近的 max_hints 个账户
+    """
+    labels = [meta["label"] for meta in table.account_meta]
+    names = result["names"]
+    lines = []
+    n = len(names)
+    picked = list(range(n))
+    if n > max_lines:
+        step = max(1, n // max_lines)
+        # 强平账户数发生变化的两侧档位一定保留
+        changed = np.flatnonzero(np.diff(result["account_liquidated"].sum(axis=1)) != 0)
+        picked = sorted(set(range(0, n, step)) | {n - 1} | set(changed.tolist()) | set((changed + 1).tolist()))
+    for s in picked:
+        liquidated = [labels[a] for a in np.flatnonzero(result["account_liquidated"][s]).tolist()]
+        leverage = result["total_gross_leverage"][s]
+        leverage = f"{leverage:.2f}x" if np.isfinite(leverage) else "n/a（权益 <= 0）"
+        line = (f"{names[s]}: 权益 ${result['total_equity'][s]:,.0f}"
+                f"（{result['total_pnl'][s]:+,.0f}）总杠杆 {leverage}")
+        if liquidated:
+            line += f" ⚠️强平 {len(liquidated)} 个: {', '.join(liquidated[:5])}" + (" ..." if len(liquidated) > 5 else "")
+        lines.append(line)
+
+    down, up = liquidation_shocks(table)
+    nearest = np.fmin(-down, up)
+    hints = []
+    for a in np.argsort(nearest, kind="stable")[:max_hints].tolist():
+        label = labels[a]
+        parts = []
+        if not np.isnan(down[a]):
+            parts.append(f"跌 {-down[a] * 100:.1f}%")
+        if not np.isnan(up[a]):
+            parts.append(f"涨 {up[a] * 100:.1f}%")
+        if parts:
+            hints.append(f"{label}: {' / '.join(parts)} 首个持仓强平")
+    if hints:
+        lines.append("")
+        lines.extend(hints)
+    return "\n".join(lines)
@@ -2,11 +2,22 @@ import os
 from dotenv import load_dotenv
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
-from apscheduler.schedulers.background import BackgroundScheduler
-from image_generator import generate_summary_image
+from alerts import AlertEngine
+from exposure import format_exposure, get_exposure_index
+from funding import format_funding, get_funding_monitor
+from snapshot_service import SnapshotService
+from stress import format_stress, parse_stress_args, run_stress
+from streaming import AccountBook, StreamRunner
+from sharding import ShardedSnapshotSource
+from snapshot_diff import DiffEngine, format_changes
+from utils.config_loader import (DOTENV_PATH, check_config, get_alerts_config, get_diff_config, get_funding_config,
+                                 get_sharding_config, get_streaming_config)
+from utils.http_session import close_all_sessions
+from utils.metrics import start_metrics_server
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
-import threading
 
+load_dotenv(dotenv_path=DOTENV_PATH)  # Bot token 与账户凭证放在同一个 config/.env
 load_dotenv()
 
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -15,35 +26,138 @@ CHAT_ID = int(os.getenv("TELEGRAM_CHAT_ID") or 0)
 if not BOT_TOKEN or CHAT_ID == 0:
     raise ValueError("请检查 .env 中的 TELEGRAM_BOT_TOKEN 和 TELEGRAM_CHAT_ID")
 
-def sync_send_summary():
-    print("【自动推送】正在生成并发送最新总结图片...")
-    image_path = "perp_summary.png"
-    generate_summary_image(image_path)
-    
-    # 在独立线程中运行 async 发送
-    async def async_send():
-        app = Application.builder().token(BOT_TOKEN).build()
-        async with app:
-            await app.initialize()
-            await app.start()
-            with open(image_path, "rb") as photo:
-                await app.bot.send_photo(chat_id=CHAT_ID, photo=photo, caption="Perpetual Dex 账户&风险监控总结（自动推送）")
-            await app.stop()
-            await app.shutdown()
-        print("【自动推送】图片发送成功！")
-    
-    # 新线程运行 async 函数
-    thread = threading.Thread(target=lambda: asyncio.run(async_send()))
-    thread.start()
-    thread.join()  # 等待完成
+SUMMARY_INTERVAL = 30 * 60  # 自动推送间隔（秒）
+
+# 所有命令、定时推送和告警共用一个快照服务；流式模式下它读取 WebSocket 内存账户簿
+snapshot_service = None
+alert_engine = None
+change_diff = None  # 文字变化推送的基准
+image_diff = None   # 定时图片推送的基准（上一张图片对应的快照）
+alert_snapshot = None  # 最近一次评估告警的快照，同一快照不重复评估
+# 抓取（阻塞的 requests）走默认线程池，渲染走独立的线程池，都不占用事件循环
+render_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="render")
+
+async def build_summary_image(max_age=None):
+    loop = asyncio.get_running_loop()
+    snapshot = await loop.run_in_executor(None, snapshot_service.get_snapshot, max_age)
+    return await loop.run_in_executor(render_pool, snapshot_service.image_for, snapshot)
+
+async def scheduled_send_summary(context: ContextTypes.DEFAULT_TYPE):
+    loop = asyncio.get_running_loop()
+    try:
+        snapshot = await loop.run_in_executor(None, snapshot_service.get_snapshot, 0)  # 定时推送总是用新数据
+        if image_diff is not None and image_diff.baseline is not None:
+            changes, _ = image_diff.peek(snapshot)  # 基准只在图片发送成功后前移
+            if not changes:
+                print("【自动推送】与上一张图片相比没有实质变化，跳过")
+                return
+        print("【自动推送】正在生成并发送最新总结图片...")
+        photo = await loop.run_in_executor(render_pool, snapshot_service.image_for, snapshot)
+        await context.bot.send_photo(chat_id=CHAT_ID, photo=photo, caption="Perpetual Dex 账户&风险监控总结（自动推送）")
+    except Exception as e:
+        print(f"【自动推送】失败: {e}")
+        return
+    if image_diff is not None:
+        image_diff.reset(snapshot)
+    print("【自动推送】图片发送成功！")
+
+async def scheduled_send_changes(context: ContextTypes.DEFAULT_TYPE):
+    """与上一次推送相比有实质变化（开平仓、调仓、权益 / 杠杆大幅变动、账户状态）时发一条文字消息"""
+    loop = asyncio.get_running_loop()
+    try:
+        snapshot = await loop.run_in_executor(None, snapshot_service.get_snapshot, get_diff_config().interval)
+        if change_diff.baseline is None:
+            change_diff.reset(snapshot)  # 第一次只建立基准
+            return
+        changes, old_total = change_diff.peek(snapshot)  # 基准只在消息发送成功后前移
+        if not changes:
+            return
+        print(f"【变化推送】{len(changes)} 项变化")
+        text = format_changes(changes, old_total, snapshot.aggs["total_equity"], change_diff.config.max_lines)
+        await context.bot.send_message(chat_id=CHAT_ID, text=text)
+    except Exception as e:
+        print(f"【变化推送】失败: {e}")
+        return
+    change_diff.commit(snapshot)
+
+def _alerts_max_age():
+    """
+    告警使用的快照时效：流式模式下快照来自内存账户簿（无网络 I/O），每个评估周期取一次新快照；
+    REST 模式下复用快照缓存，只在 snapshot.max_age 过期时才重新全量抓取，避免每个告警周期打满各交易所限频
+    """
+    return get_alerts_config().interval if snapshot_service.book is not None else None
+
+async def scheduled_check_alerts(context: ContextTypes.DEFAULT_TYPE):
+    """评估告警规则，有新告警 / 恢复时合并成一条短消息发送"""
+    global alert_snapshot
+    loop = asyncio.get_running_loop()
+    try:
+        snapshot = await loop.run_in_executor(None, snapshot_service.get_snapshot, _alerts_max_age())
+        if snapshot is alert_snapshot:
+            return
+        alert_snapshot = snapshot
+        messages = alert_engine.evaluate(snapshot)
+    except Exception as e:
+        print(f"【告警】评估失败: {e}")
+        return
+    if messages:
+        print(f"【告警】发送 {len(messages)} 条")
+        await context.bot.send_message(chat_id=CHAT_ID, text="\n".join(messages))
+
+async def scheduled_sync_funding(context: ContextTypes.DEFAULT_TYPE):
+    """按 funding.sync_interval 增量同步资金费率历史（每个交易所一次批量行情 + 持有合约的历史）"""
+    loop = asyncio.get_running_loop()
+    try:
+        snapshot = await loop.run_in_executor(None, snapshot_service.get_snapshot, None)
+        added = await loop.run_in_executor(None, get_funding_monitor().sync, snapshot)
+    except Exception as e:
+        print(f"【资金费】同步失败: {e}")
+        return
+    print(f"【资金费】同步完成，新增 {added} 个样本")
 
 async def manual_send_summary(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("正在生成最新图片，请稍等...")
-    image_path = "perp_summary.png"
-    generate_summary_image(image_path)
-    
-    with open(image_path, "rb") as photo:
-        await update.message.reply_photo(photo=photo, caption="Perpetual Dex 账户&风险监控总结（手动触发）")
+    photo = await build_summary_image()  # max_age 内的快照和图片直接复用
+    await update.message.reply_photo(photo=photo, caption="Perpetual Dex 账户&风险监控总结（手动触发）")
+
+async def manual_stress(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stress [-20 | BTC -15 ETH -10 | majors -20 | majors]：对当前持仓做价格冲击情景分析"""
+    loop = asyncio.get_running_loop()
+    try:
+        snapshot = await loop.run_in_executor(None, snapshot_service.get_snapshot, None)
+        scenarios = parse_stress_args(snapshot.table, context.args)
+        result = await loop.run_in_executor(None, run_stress, snapshot.table, scenarios)
+    except ValueError as e:
+        await update.message.reply_text(str(e))
+        return
+    await update.message.reply_text(format_stress(snapshot.table, result) or "当前没有持仓")
+
+def _exposure_report(name=None):
+    index = get_exposure_index()
+    index.sync_table(snapshot_service.get_snapshot().table)  # 只改动变化过的持仓腿
+    return format_exposure(index, name)
+
+async def manual_exposure(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/exposure [BTC]：跨交易所按标的净额，标出对冲偏离的标的"""
+    loop = asyncio.get_running_loop()
+    name = context.args[0] if context.args else None
+    await update.message.reply_text(await loop.run_in_executor(None, _exposure_report, name))
+
+def _funding_report(window_hours=None):
+    monitor = get_funding_monitor()
+    snapshot = snapshot_service.get_snapshot()
+    monitor.sync(snapshot)  # 距上次同步不足 sync_interval 时不发请求
+    return format_funding(snapshot.table, monitor.report(snapshot, window_hours))
+
+async def manual_funding(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/funding [小时]：各持仓 / 账户的预期资金费与最近 N 小时的累计资金费"""
+    loop = asyncio.get_running_loop()
+    try:
+        window_hours = float(context.args[0]) if context.args else None
+    except ValueError:
+        await update.message.reply_text("用法: /funding [统计窗口小时数]")
+        return
+    await update.message.reply_text(await loop.run_in_executor(None, _funding_report, window_hours))
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
@@ -51,28 +165,60 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "功能：\n"
         "/summary - 立即获取最新图片\n"
         "/now - 同上\n"
-        "每小时自动推送一次"
+        "/stress - 价格冲击压力测试（如 /stress -20、/stress BTC -15 ETH -10、/stress majors）\n"
+        "/exposure - 按标的跨交易所净敞口与对冲偏离（如 /exposure BTC）\n"
+        "/funding - 预期与累计资金费（如 /funding 72）\n"
+        "每 30 分钟自动推送一次（没有实质变化时跳过）；开平仓、调仓、权益或杠杆大幅变动时另发文字提醒"
     )
 
+async def post_shutdown(application: Application):
+    """Bot 停止后关闭各交易所共享 Session 的连接池"""
+    close_all_sessions()
+
 def main():
-    application = Application.builder().token(BOT_TOKEN).read_timeout(30).write_timeout(30).build()
+    global snapshot_service, alert_engine, change_diff, image_diff
+    check_config()  # 账户定义或 yaml 有问题时直接退出，而不是在第一次快照时才报错
+    application = (
+        Application.builder().token(BOT_TOKEN).read_timeout(30).write_timeout(30)
+        .concurrent_updates(True)  # 一个命令在生成图片时，其他命令照常响应
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("summary", manual_send_summary))
     application.add_handler(CommandHandler("now", manual_send_summary))
+    application.add_handler(CommandHandler("stress", manual_stress))
+    application.add_handler(CommandHandler("exposure", manual_exposure))
+    application.add_handler(CommandHandler("funding", manual_funding))
     
-    # 定时任务
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(sync_send_summary, 'interval', minutes=30)
-    scheduler.start()
-    
-    # 启动时立即发送一次
-    print("Bot 启动中... 立即发送第一张图片")
-    sync_send_summary()
+    if get_streaming_config().enabled:
+        account_book = AccountBook()
+        StreamRunner(account_book).start()
+        print("流式模式已开启，快照与告警基于 WebSocket 内存账户簿")
+        snapshot_service = SnapshotService(book=account_book)
+    elif get_sharding_config().workers > 1:
+        snapshot_service = SnapshotService(loader=ShardedSnapshotSource().start().load_snapshot)
+    else:
+        snapshot_service = SnapshotService()
+    alert_engine = AlertEngine()
+    diff_config = get_diff_config()
+    start_metrics_server()  # 本机 /metrics，供 Prometheus 抓取各阶段耗时与错误计数
     
-    print("Bot 已完全启动！无 warning，无报错")
-    print("每小时自动推送 + 手动命令正常")
+    # 定时任务使用 Bot 自带的 job queue，与命令处理共用同一个事件循环和 bot 客户端
+    # first=0: 启动时立即发送一次
+    application.job_queue.run_repeating(scheduled_send_summary, interval=SUMMARY_INTERVAL, first=0)
+    application.job_queue.run_repeating(scheduled_check_alerts, interval=get_alerts_config().interval)
+    if diff_config.enabled:
+        change_diff = DiffEngine(diff_config)
+        application.job_queue.run_repeating(scheduled_send_changes, interval=diff_config.interval)
+        if diff_config.image_only_on_change:
+            image_diff = DiffEngine(diff_config)
+    funding_config = get_funding_config()
+    if funding_config.enabled:
+        application.job_queue.run_repeating(scheduled_sync_funding, interval=funding_config.sync_interval, first=60)
     
+    print("Bot 启动中... 启动后立即发送第一张图片")
     application.run_polling(drop_pending_updates=True)
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+"""
+流式账户簿的端到端测试：REST 发往 bench/mock_venue.py，推送来自 bench/mock_ws.py
+
+在 perpdex-acc-monitor 目录下运行：
+    python -m pytest tests
+"""
+import time
+import pytest
+from bench.mock_venue import MockVenueServer, VenueProfile, route_exchanges_to
+from bench.mock_ws import MockStreamServer, grvt_message, paradex_message, route_streams_to
+from bench.run_bench import set_bench_accounts
+from exchanges.registry import get_adapter
+from fetcher import STATUS_OK, STATUS_STALE
+from streaming import AccountBook, StreamRunner
+
+# 各交易所的推送构造：(账户 -> 模拟服务中的账户标识, 持仓推送, 余额推送)，持仓推送的 at 为交易所事件时间（Unix 秒）
+VENUES = {
+    "paradex": (
+        lambda account: f"paradex:{account.jwt}",
+        lambda account, symbol, size, at=None: paradex_message("positions", {
+            "market": symbol, "size": str(size), "average_entry_price": "10", "unrealized_pnl": str(size),
+            **({} if at is None else {"last_updated_at": int(at * 1000)})}),
+        lambda account, equity: paradex_message("account", {
+            "account_value": str(equity), "free_collateral": str(equity / 2), "updated_at": int(time.time() * 1000)}),
+    ),
+    "grvt": (
+        lambda account: f"grvt:{account.sub_account_id}",
+        lambda account, symbol, size, at=None: grvt_message("v1.position", account.sub_account_id, {
+            "instrument": symbol, "size": str(size), "mark_price": "11", "notional": str(size * 11),
+            **({} if at is None else {"event_time": str(int(at * 1e9))})}),
+        lambda account, equity: grvt_message("v1.account_summary", account.sub_account_id, {
+            "total_equity": str(equity), "available_balance": str(equity / 2), "event_time": str(time.time_ns())}),
+    ),
+}
+NEW_SYMBOL = {"paradex": "ZZZ-USD-PERP", "grvt": "ZZZ_USDT_Perp"}
+
+
+def wait_until(predicate, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture(scope="module")
+def venue():
+    set_bench_accounts(2)  # GRVT / Paradex 各 1 个账户
+    server = MockVenueServer(VenueProfile(latency_ms=1.0, jitter_ms=0.0)).start()
+    route_exchanges_to(server.url, rate_limit=False)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def stream():
+    server = MockStreamServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(params=sorted(VENUES))
+def runner(request, venue, stream):
+    adapter = get_adapter(request.param)
+    route_streams_to([adapter], stream.url)
+    book = AccountBook()
+    runner = StreamRunner(book, [adapter])
+    runner.start()
+    account = runner._accounts[0][1]
+    key, position, balance = VENUES[adapter.name]
+    assert stream.wait_connected(key(account))
+    assert wait_until(lambda: record(book, adapter.name)["status"]["positions"] == STATUS_OK)
+    runner.venue = adapter.name
+    runner.account = account
+    runner.stream_key = key(account)
+    runner.position = lambda symbol, size, at=None: position(account, symbol, size, at)
+    runner.balance = lambda equity: balance(account, equity)
+    yield runner
+    runner.stop()
+
+
+def record(book: AccountBook, venue: str, stale_after: float = 60.0):
+    return book.snapshot(stale_after)[venue][0]
+
+
+def symbols(book: AccountBook, venue: str):
+    return {pos.symbol: pos for pos in record(book, venue)["positions"]}
+
+
+def rest_symbols(runner: StreamRunner):
+    adapter = runner.adapters[0]
+    return {pos.symbol for pos in adapter.fetch_positions(runner.account)}
+
+
+def test_apply_position_and_balance(runner, stream):
+    book, venue = runner.book, runner.venue
+    held = set(symbols(book, venue))
+    assert held == rest_symbols(runner)
+
+    stream.push(runner.stream_key, runner.position(NEW_SYMBOL[venue], 2))
+    assert wait_until(lambda: NEW_SYMBOL[venue] in symbols(book, venue))
+    assert symbols(book, venue)[NEW_SYMBOL[venue]].mark == pytest.approx(11.0)
+
+    closed = sorted(held)[0]
+    stream.push(runner.stream_key, runner.position(closed, 0))  # size 为 0 视为平仓
+    assert wait_until(lambda: closed not in symbols(book, venue))
+
+    stream.push(runner.stream_key, runner.balance(123456.0))
+    assert wait_until(lambda: record(book, venue)["summary"].equity == 123456.0)
+    assert record(book, venue)["status"]["summary"] == STATUS_OK
+
+
+def test_reconnect_reconciles_with_rest(runner, stream):
+    book, venue = runner.book, runner.venue
+    stream.push(runner.stream_key, runner.position(NEW_SYMBOL[venue], 2))
+    assert wait_until(lambda: NEW_SYMBOL[venue] in symbols(book, venue))
+
+    # 断线期间服务端状态以 REST 为准：重连后全量对账，推送里多出来的持仓被丢弃
+    assert stream.drop(runner.stream_key) == 1
+    assert wait_until(lambda: not stream.connected(runner.stream_key), timeout=5)
+    assert stream.wait_connected(runner.stream_key)
+    assert wait_until(lambda: set(symbols(book, venue)) == rest_symbols(runner))
+    assert record(book, venue)["status"]["positions"] == STATUS_OK
+
+
+def test_pushes_older_than_reconcile_are_dropped(runner, stream):
+    book, venue = runner.book, runner.venue
+    # 连接建立时已做过一次对账：事件时间早于对账的推送（如对账期间排队的旧推送）不能覆盖 REST 状态
+    closed = sorted(symbols(book, venue))[0]
+    stream.push(runner.stream_key, runner.position(closed, 0, at=time.time() - 60))
+    stream.push(runner.stream_key, runner.position(NEW_SYMBOL[venue], 2, at=time.time()))
+    assert wait_until(lambda: NEW_SYMBOL[venue] in symbols(book, venue))
+    assert closed in symbols(book, venue)
+
+    # 对账发起之后到达的推送比 REST 结果新，对账完成时予以保留
+    started = time.time() - 1
+    rest = runner.adapters[0].fetch_positions(runner.account)
+    book.reconcile(venue, runner.account.account_key, None, rest, as_of=started)
+    assert NEW_SYMBOL[venue] in symbols(book, venue)
+    book.reconcile(venue, runner.account.account_key, None, rest)
+    assert set(symbols(book, venue)) == rest_symbols(runner)
+
+
+def test_disconnect_marks_stale_until_refetched(runner, stream):
+    book, venue = runner.book, runner.venue
+    stream.stop()  # 服务端下线，重连持续失败
+    assert wait_until(lambda: not book.stale_accounts(60.0) and book.stale_accounts(0.0))
+    time.sleep(0.1)
+    assert record(book, venue, stale_after=0.05)["status"]["positions"] == STATUS_STALE
+    assert record(book, venue, stale_after=60.0)["status"]["positions"] == STATUS_OK
+    assert [account.account_key for account in book.stale_accounts(0.05)[venue]] == [runner.account.account_key]
+
+    # 定向 REST 补抓后恢复为 ok，直到再次超过 stale_after
+    assert book.refresh_stale(runner.adapters, 0.05) == 1
+    assert record(book, venue, stale_after=0.05)["status"]["positions"] == STATUS_OK
+    assert not book.stale_accounts(0.05)
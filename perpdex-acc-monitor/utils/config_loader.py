@@ -1,73 +1,575 @@
 import os
-from dotenv import load_dotenv
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
 import yaml
-from typing import Dict, List, Any
+from dotenv import dotenv_values, find_dotenv
 
-# === 调试添加：打印加载路径和部分环境变量 ===
-print("当前工作目录:", os.getcwd())
-dotenv_path = os.path.join(os.path.dirname(__file__), "..", "config", ".env")
-print("尝试加载 .env 文件路径:", dotenv_path)
-print("该路径是否存在:", os.path.exists(dotenv_path))
+CONFIG_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "config"))
+PROJECT_DIR = os.path.dirname(CONFIG_DIR)
+YAML_PATH = os.path.join(CONFIG_DIR, "exchanges.yaml")
+DOTENV_PATH = os.path.join(CONFIG_DIR, ".env")
 
-load_dotenv(dotenv_path=dotenv_path)  # 显式指定路径，强制加载 config/.env
+# 两次检查配置文件 mtime 的最小间隔（秒）；间隔内的读取直接返回已解析的配置
+CHECK_INTERVAL = 1.0
 
-# 调试：打印所有包含 GRVT 或 PARADEX 的环境变量
-print("\n当前环境变量中包含 GRVT 或 PARADEX 的键:")
-for key, value in os.environ.items():
-    if "GRVT" in key or "PARADEX" in key:
-        print(f"  {key} = {value[:20]}...")  # 只显示前20位
 
-print("\n=== load_dotenv 完成 ===\n")
-# === 调试结束 ===
+class ConfigError(ValueError):
+    """exchanges.yaml 或账户环境变量不合法"""
 
-load_dotenv()
 
-def get_all_accounts(exchange: str) -> List[Dict[str, str]]:
+# ---- 解析后的配置（不可变） ----
+
+class AccountSpec(NamedTuple):
+    """一个账户的凭证定义，来自环境变量 <EXCHANGE>_<字段>_<编号>"""
+    exchange: str
+    number: str              # 环境变量中的编号
+    api_key: str = ""        # GRVT
+    sub_account_id: str = ""  # GRVT
+    jwt: str = ""            # Paradex
+
+
+class FetchConfig(NamedTuple):
+    max_workers: int
+    deadline: float
+    keep_raw: bool = False   # 调试用：账户对象保留最近一次的原始响应
+
+
+class StreamingConfig(NamedTuple):
+    enabled: bool
+    reconcile_interval: float
+    stale_after: float
+    max_reconnect_delay: float
+
+
+class AlertsConfig(NamedTuple):
+    interval: float
+    repeat_after: float
+    rules: Tuple[Mapping[str, Any], ...]
+
+
+class MarketDataConfig(NamedTuple):
+    enabled: bool
+    ttl: float
+
+
+class SnapshotConfig(NamedTuple):
+    max_age: float
+    max_staleness: float = 0.0  # 账户数据允许的最大年龄（秒），0 表示每次全量抓取
+
+
+class HistoryConfig(NamedTuple):
+    enabled: bool
+    retention_days: Mapping[str, float]
+    max_points: int
+
+
+class StressConfig(NamedTuple):
+    enabled: bool
+    grid: Tuple[float, float, float]   # (low, high, step)，小数
+    image_shocks: Tuple[float, ...]
+    baskets: Mapping[str, Tuple[str, ...]]
+
+
+class HedgeConfig(NamedTuple):
+    tolerance_pct: float
+    min_notional: float
+
+
+class RateLimit(NamedTuple):
+    rate: float
+    burst: float
+
+
+class ResilienceConfig(NamedTuple):
+    retries: int
+    backoff_base: float
+    backoff_max: float
+    breaker_failures: int
+    breaker_reset: float
+    default_limit: RateLimit
+    host_limits: Mapping[str, RateLimit]
+
+
+class MetricsConfig(NamedTuple):
+    enabled: bool
+    host: str
+    port: int
+    tracing: bool
+
+
+class DiffConfig(NamedTuple):
+    enabled: bool
+    interval: float          # 变化检查间隔（秒）
+    equity_pct: float        # 账户权益变化比例阈值（%）
+    equity_abs: float        # 且绝对值不小于该金额（USD）
+    leverage_abs: float      # 总杠杆变化阈值
+    resize_pct: float        # 持仓数量变化比例阈值（%）
+    max_lines: int
+    image_only_on_change: bool
+
+
+class ShardingConfig(NamedTuple):
+    workers: int     # <= 1 表示单进程
+    timeout: float   # 协调进程等待一轮分片结果的最长时间（秒）
+
+
+class FundingConfig(NamedTuple):
+    enabled: bool
+    sync_interval: float   # 资金费率同步间隔（秒）
+    resolution: int        # 费率历史的桶宽（秒），桶内取平均
+    backfill_hours: float  # 新合约首次同步时回溯的历史长度
+    accrual_hours: float   # 累计资金费的统计窗口
+
+
+class Config(NamedTuple):
+    """exchanges.yaml + 账户环境变量解析一次后的完整配置"""
+    exchanges: Mapping[str, Mapping[str, Any]]
+    accounts: Mapping[str, Tuple[AccountSpec, ...]]
+    storage: Mapping[str, str]
+    environ: Mapping[str, str]   # 解析账户时使用的环境变量（进程环境 + .env），校验也基于它
+    fetch: FetchConfig
+    streaming: StreamingConfig
+    alerts: AlertsConfig
+    market_data: MarketDataConfig
+    snapshot: SnapshotConfig
+    history: HistoryConfig
+    stress: StressConfig
+    hedge: HedgeConfig
+    resilience: ResilienceConfig
+    metrics: MetricsConfig
+    sharding: ShardingConfig
+    diff: DiffConfig
+    funding: FundingConfig
+
+
+def _freeze(value: Any) -> Any:
+    """dict -> 只读 Mapping，list -> tuple（递归）"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+# ---- 各段的解析 ----
+
+def scan_accounts(exchange: str, environ: Optional[Mapping[str, str]] = None) -> Tuple[AccountSpec, ...]:
     """
-    改进版：更宽松地检测多账户
-    GRVT: 寻找所有包含 GRVT_ 并以数字结尾的变量作为 API_KEY，同数字的 SUB_ACCOUNT_ID
-    Paradex: 寻找所有包含 PARADEX_JWT_ 并以数字结尾的变量
+    更宽松地检测多账户：
+    GRVT: 寻找所有 GRVT_ 开头并以数字结尾的变量，GRVT_API_KEY_<n> 与同编号的 GRVT_SUB_ACCOUNT_ID_<n> 组成一个账户
+    Paradex: 寻找所有 PARADEX_JWT_<n>
     """
-    accounts = []
-    env_vars = dict(os.environ)
+    environ = os.environ if environ is None else environ
     prefix = exchange.upper() + "_"
-    
-    # 收集所有可能的账户编号
-    possible_numbers = set()
-    for key in env_vars:
-        if key.startswith(prefix):
-            # 提取可能的数字后缀
-            parts = key.split("_")
-            if len(parts) >= 3 and parts[-1].isdigit():
-                possible_numbers.add(parts[-1])
-            elif len(parts) >= 2 and parts[-1].isdigit():
-                possible_numbers.add(parts[-1])
-    
-    for num in sorted(possible_numbers):
-        account = {}
+    numbers = {key.rsplit("_", 1)[1] for key in environ
+               if key.startswith(prefix) and key.rsplit("_", 1)[-1].isdigit()}
+
+    accounts = []
+    for num in sorted(numbers):
         if exchange == "grvt":
-            api_key = os.getenv(f"GRVT_API_KEY_{num}") or os.getenv(f"{prefix}API_KEY_{num}")
-            sub_id = os.getenv(f"GRVT_SUB_ACCOUNT_ID_{num}") or os.getenv(f"{prefix}SUB_ACCOUNT_ID_{num}")
+            api_key = environ.get(f"{prefix}API_KEY_{num}")
             if api_key:
-                account["api_key"] = api_key
-                account["sub_account_id"] = sub_id or ""
-                accounts.append(account)
+                accounts.append(AccountSpec(exchange, num, api_key=api_key,
+                                            sub_account_id=environ.get(f"{prefix}SUB_ACCOUNT_ID_{num}", "")))
         elif exchange == "paradex":
-            jwt = os.getenv(f"PARADEX_JWT_{num}") or os.getenv(f"{prefix}JWT_{num}")
+            jwt = environ.get(f"{prefix}JWT_{num}")
             if jwt:
-                account["jwt"] = jwt
-                accounts.append(account)
-    
-    return accounts
+                accounts.append(AccountSpec(exchange, num, jwt=jwt))
+    return tuple(accounts)
+
+
+def _fetch_config(raw: Dict[str, Any]) -> FetchConfig:
+    fetch = raw.get("fetch") or {}
+    return FetchConfig(int(fetch.get("max_workers", 16)), float(fetch.get("deadline", 40)),
+                       bool(fetch.get("keep_raw", False)))
+
+
+def _streaming_config(raw: Dict[str, Any]) -> StreamingConfig:
+    streaming = raw.get("streaming") or {}
+    return StreamingConfig(
+        enabled=bool(streaming.get("enabled", False)),
+        reconcile_interval=float(streaming.get("reconcile_interval", 60)),
+        stale_after=float(streaming.get("stale_after", 30)),
+        max_reconnect_delay=float(streaming.get("max_reconnect_delay", 30)),
+    )
+
+
+def _alerts_config(raw: Dict[str, Any]) -> AlertsConfig:
+    alerts = raw.get("alerts") or {}
+    return AlertsConfig(
+        interval=float(alerts.get("interval", 30)),
+        repeat_after=float(alerts.get("repeat_after", 1800)),
+        rules=_freeze(list(alerts.get("rules") or [])),
+    )
+
+
+def _market_data_config(raw: Dict[str, Any]) -> MarketDataConfig:
+    market_data = raw.get("market_data") or {}
+    return MarketDataConfig(bool(market_data.get("enabled", True)), float(market_data.get("ttl", 5)))
+
+
+def _snapshot_config(raw: Dict[str, Any]) -> SnapshotConfig:
+    snapshot = raw.get("snapshot") or {}
+    return SnapshotConfig(float(snapshot.get("max_age", 60)), float(snapshot.get("max_staleness", 0)))
+
+
+def _history_config(raw: Dict[str, Any]) -> HistoryConfig:
+    history = raw.get("history") or {}
+    retention = {"1m": 7, "1h": 400, "1d": 0}
+    retention.update(history.get("retention_days") or {})
+    return HistoryConfig(
+        enabled=bool(history.get("enabled", True)),
+        retention_days=MappingProxyType({tier: float(days) for tier, days in retention.items()}),
+        max_points=int(history.get("max_points", 2000)),
+    )
+
+
+def _stress_config(raw: Dict[str, Any]) -> StressConfig:
+    """冲击幅度统一换算成小数"""
+    stress = raw.get("stress") or {}
+    grid = stress.get("grid") or {}
+    return StressConfig(
+        enabled=bool(stress.get("enabled", True)),
+        grid=(float(grid.get("low", -30)) / 100, float(grid.get("high", 30)) / 100,
+              float(grid.get("step", 1)) / 100),
+        image_shocks=tuple(float(x) / 100 for x in stress.get("image_shocks", [-30, -20, -10, 10, 20, 30])),
+        baskets=MappingProxyType({name: tuple(str(u).upper() for u in members)
+                                  for name, members in (stress.get("baskets") or {}).items()}),
+    )
+
+
+def _hedge_config(raw: Dict[str, Any]) -> HedgeConfig:
+    hedge = raw.get("hedge") or {}
+    return HedgeConfig(float(hedge.get("tolerance_pct", 5)), float(hedge.get("min_notional", 1000)))
+
+
+def _rate_limit(limit: Mapping[str, Any]) -> RateLimit:
+    return RateLimit(float(limit["rate"]), float(limit["burst"]))
+
+
+def _resilience_config(raw: Dict[str, Any]) -> ResilienceConfig:
+    """host_limits 由各交易所的 rate_limit 展开到该交易所配置中出现的每个 http(s) host"""
+    resilience = raw.get("resilience") or {}
+    host_limits = {}
+    for exchange in (raw.get("exchanges") or {}).values():
+        limit = exchange.get("rate_limit")
+        if not limit:
+            continue
+        for value in exchange.values():
+            if isinstance(value, str) and value.startswith("http"):
+                host_limits[urlsplit(value).netloc] = _rate_limit(limit)
+    return ResilienceConfig(
+        retries=int(resilience.get("retries", 2)),
+        backoff_base=float(resilience.get("backoff_base", 0.5)),
+        backoff_max=float(resilience.get("backoff_max", 4)),
+        breaker_failures=int(resilience.get("breaker_failures", 5)),
+        breaker_reset=float(resilience.get("breaker_reset", 30)),
+        default_limit=_rate_limit(resilience.get("rate_limit") or {"rate": 10, "burst": 20}),
+        host_limits=MappingProxyType(host_limits),
+    )
+
+
+def _metrics_config(raw: Dict[str, Any]) -> MetricsConfig:
+    metrics = raw.get("metrics") or {}
+    return MetricsConfig(
+        enabled=bool(metrics.get("enabled", True)),
+        host=str(metrics.get("host", "127.0.0.1")),
+        port=int(metrics.get("port", 9108)),
+        tracing=bool(metrics.get("tracing", False)),
+    )
+
+
+def _sharding_config(raw: Dict[str, Any]) -> ShardingConfig:
+    sharding = raw.get("sharding") or {}
+    return ShardingConfig(int(sharding.get("workers", 0)), float(sharding.get("timeout", 60)))
+
+
+def _diff_config(raw: Dict[str, Any]) -> DiffConfig:
+    diff = raw.get("diff") or {}
+    return DiffConfig(
+        enabled=bool(diff.get("enabled", True)),
+        interval=float(diff.get("interval", 60)),
+        equity_pct=float(diff.get("equity_pct", 2)),
+        equity_abs=float(diff.get("equity_abs", 500)),
+        leverage_abs=float(diff.get("leverage_abs", 0.5)),
+        resize_pct=float(diff.get("resize_pct", 10)),
+        max_lines=int(diff.get("max_lines", 30)),
+        image_only_on_change=bool(diff.get("image_only_on_change", True)),
+    )
+
+
+def _funding_config(raw: Dict[str, Any]) -> FundingConfig:
+    funding = raw.get("funding") or {}
+    return FundingConfig(
+        enabled=bool(funding.get("enabled", True)),
+        sync_interval=float(funding.get("sync_interval", 3600)),
+        resolution=max(1, int(funding.get("resolution", 3600))),
+        backfill_hours=float(funding.get("backfill_hours", 72)),
+        accrual_hours=float(funding.get("accrual_hours", 24)),
+    )
+
+
+SECTIONS = {
+    "fetch": _fetch_config,
+    "streaming": _streaming_config,
+    "alerts": _alerts_config,
+    "market_data": _market_data_config,
+    "snapshot": _snapshot_config,
+    "history": _history_config,
+    "stress": _stress_config,
+    "hedge": _hedge_config,
+    "resilience": _resilience_config,
+    "metrics": _metrics_config,
+    "sharding": _sharding_config,
+    "diff": _diff_config,
+    "funding": _funding_config,
+}
+
+
+def parse_config(raw: Dict[str, Any], environ: Optional[Mapping[str, str]] = None) -> Config:
+    """把 yaml 内容和环境变量解析为 Config；字段类型不对时抛出 ConfigError 并指明所在段"""
+    if not isinstance(raw, dict) or not isinstance(raw.get("exchanges"), dict) or not raw["exchanges"]:
+        raise ConfigError("exchanges.yaml 缺少 exchanges 段")
+    sections = {}
+    for name, parse in SECTIONS.items():
+        try:
+            sections[name] = parse(raw)
+        except (TypeError, ValueError, KeyError, AttributeError) as e:
+            raise ConfigError(f"exchanges.yaml 的 {name} 段不合法: {e}") from e
+    exchanges = {name.lower(): cfg or {} for name, cfg in raw["exchanges"].items()}
+    environ = MappingProxyType(dict(os.environ if environ is None else environ))
+    return Config(
+        exchanges=_freeze(exchanges),
+        accounts=MappingProxyType({name: scan_accounts(name, environ) for name in exchanges}),
+        storage=_freeze(raw.get("storage") or {}),
+        environ=environ,
+        **sections,
+    )
+
+
+def validate_config(config: Config) -> List[str]:
+    """检查账户定义和各交易所的必需字段，返回问题列表（空表示通过）"""
+    problems = []
+    for name, exchange in config.exchanges.items():
+        if not exchange.get("base_url"):
+            problems.append(f"交易所 {name} 缺少 base_url")
+        if int(exchange.get("max_concurrency", 1)) < 1:
+            problems.append(f"交易所 {name} 的 max_concurrency 必须 >= 1")
+
+    environ = config.environ
+    grvt = config.accounts.get("grvt", ())
+    for num in sorted({k.rsplit("_", 1)[1] for k in environ if k.startswith("GRVT_SUB_ACCOUNT_ID_")}):
+        if not environ.get(f"GRVT_API_KEY_{num}"):
+            problems.append(f"GRVT_SUB_ACCOUNT_ID_{num} 没有对应的 GRVT_API_KEY_{num}")
+    for acc in grvt:
+        if not acc.sub_account_id:
+            problems.append(f"GRVT_API_KEY_{acc.number} 没有对应的 GRVT_SUB_ACCOUNT_ID_{acc.number}")
+        elif not acc.sub_account_id.isdigit():
+            problems.append(f"GRVT_SUB_ACCOUNT_ID_{acc.number} 应为数字")
+    for acc in config.accounts.get("paradex", ()):
+        if acc.jwt.count(".") != 2:
+            problems.append(f"PARADEX_JWT_{acc.number} 不是合法的 JWT（应为 header.payload.signature）")
+
+    for name, accounts in config.accounts.items():
+        seen: Dict[Tuple[str, ...], str] = {}
+        for acc in accounts:
+            key = (acc.api_key, acc.sub_account_id, acc.jwt)
+            if key in seen:
+                problems.append(f"{name.upper()} 账户 {acc.number} 与账户 {seen[key]} 重复")
+            seen[key] = acc.number
+    if not any(config.accounts.values()):
+        problems.append("没有配置任何账户（检查 config/.env 中的 GRVT_API_KEY_<n> / PARADEX_JWT_<n>）")
+    return problems
+
+
+class _ConfigStore:
+    """
+    配置只在首次使用时加载（import 本模块没有副作用），之后常驻内存
+    读取时最多每 CHECK_INTERVAL 秒 stat 一次 exchanges.yaml 和 .env 文件，mtime 变化才重新解析；
+    重新加载失败时保留旧配置并打印错误，不影响运行中的进程
+    .env 先读 config/.env，再读工作目录（及其上级目录）中的 .env 作为后备，同名变量以 config/.env 为准
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._config: Optional[Config] = None
+        self._mtimes: Optional[Tuple[Optional[int], ...]] = None
+        self._checked_at = 0.0
+        self._applied: Dict[str, str] = {}  # 由 .env 写入 os.environ 的变量，重新加载时据此删除已移除的变量
+        self._shadowed: Dict[str, str] = {}  # 被 .env 覆盖的进程原有变量，.env 中移除后恢复
+
+    @staticmethod
+    def _dotenv_paths() -> Tuple[str, ...]:
+        fallback = find_dotenv(usecwd=True)
+        if fallback and os.path.abspath(fallback) != os.path.abspath(DOTENV_PATH):
+            return DOTENV_PATH, fallback
+        return (DOTENV_PATH,)
+
+    def _file_mtimes(self) -> Tuple[Optional[int], ...]:
+        return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None
+                     for path in (YAML_PATH,) + self._dotenv_paths())
+
+    def _environ(self) -> Dict[str, str]:
+        """
+        进程环境 + .env 合成的环境变量，并同步回 os.environ（包括删除 .env 中已移除的变量）
+        首次加载不覆盖进程已有的环境变量；之后 .env 被修改时以文件为准
+        """
+        dotenv: Dict[str, str] = {}
+        for path in reversed(self._dotenv_paths()):  # 后读的 config/.env 优先
+            if os.path.exists(path):
+                dotenv.update((k, v) for k, v in dotenv_values(path).items() if v is not None)
+        process = {k: v for k, v in os.environ.items() if self._applied.get(k) != v}
+        process.update((k, v) for k, v in self._shadowed.items() if k not in process)
+        environ = {**dotenv, **process} if self._config is None else {**process, **dotenv}
+        for key in self._applied.keys() - environ.keys():
+            os.environ.pop(key, None)
+        for key, value in environ.items():
+            if os.environ.get(key) != value:
+                os.environ[key] = value
+        self._applied = {k: v for k, v in environ.items() if dotenv.get(k) == v and process.get(k) != v}
+        self._shadowed = {k: process[k] for k in self._applied if k in process}
+        return environ
+
+    def _load(self) -> Config:
+        mtimes = self._file_mtimes()
+        with open(YAML_PATH, "r", encoding="utf-8") as f:
+            raw = yaml.safe_load(f)
+        config = parse_config(raw, self._environ())
+        self._config, self._mtimes = config, mtimes
+        return config
+
+    def get(self) -> Config:
+        config, now = self._config, time.monotonic()
+        if config is not None and now - self._checked_at < CHECK_INTERVAL:
+            return config
+        with self._lock:
+            if self._config is None:
+                self._load()
+            elif now - self._checked_at >= CHECK_INTERVAL and self._file_mtimes() != self._mtimes:
+                try:
+                    self._load()
+                    print("配置文件已变化，重新加载完成")
+                except (OSError, yaml.YAMLError, ConfigError) as e:
+                    print(f"配置重新加载失败，继续使用旧配置: {e}")
+                    self._mtimes = self._file_mtimes()  # 文件再次修改前不再重试
+            self._checked_at = now
+            return self._config
+
+    def reload(self) -> Config:
+        """立即重新加载（例如进程内修改了账户环境变量之后）"""
+        with self._lock:
+            config = self._load()
+            self._checked_at = time.monotonic()
+            return config
+
+
+_store = _ConfigStore()
+
+
+def get_config() -> Config:
+    return _store.get()
+
+
+def reload_config() -> Config:
+    return _store.reload()
+
+
+def check_config() -> Config:
+    """启动时调用：加载并校验配置，有问题时抛出 ConfigError 列出全部问题"""
+    config = get_config()
+    problems = validate_config(config)
+    if problems:
+        raise ConfigError("配置校验失败:\n  " + "\n  ".join(problems))
+    return config
+
+
+# ---- 兼容原有的按段读取接口 ----
+
+def get_all_accounts(exchange: str) -> Tuple[AccountSpec, ...]:
+    return get_config().accounts.get(exchange.lower(), ())
+
+
+def get_exchange_config(exchange: str) -> Mapping[str, Any]:
+    return get_config().exchanges.get(exchange.lower(), MappingProxyType({}))
 
-def get_exchange_config(exchange: str) -> Dict[str, Any]:
-    yaml_path = os.path.join(os.path.dirname(__file__), "..", "config", "exchanges.yaml")
-    with open(yaml_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    return config["exchanges"].get(exchange.lower(), {})
 
 def list_all_exchanges() -> List[str]:
-    yaml_path = os.path.join(os.path.dirname(__file__), "..", "config", "exchanges.yaml")
-    with open(yaml_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    return list(config["exchanges"].keys())
+    return list(get_config().exchanges)
+
+
+def get_fetch_config() -> FetchConfig:
+    """并发抓取参数（exchanges.yaml 顶层 fetch 段），缺省时使用默认值"""
+    return get_config().fetch
+
+
+def get_storage_path(name: str, default: str) -> str:
+    """本地存储文件路径（exchanges.yaml 顶层 storage 段），相对路径以项目目录为基准，目录不存在时自动创建"""
+    path = get_config().storage.get(name, default)
+    if not os.path.isabs(path):
+        path = os.path.join(PROJECT_DIR, path)
+    path = os.path.normpath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def get_streaming_config() -> StreamingConfig:
+    """流式模式参数（exchanges.yaml 顶层 streaming 段）"""
+    return get_config().streaming
+
+
+def get_alerts_config() -> AlertsConfig:
+    """告警参数（exchanges.yaml 顶层 alerts 段）"""
+    return get_config().alerts
+
+
+def get_market_data_config() -> MarketDataConfig:
+    """公共行情缓存参数（exchanges.yaml 顶层 market_data 段）"""
+    return get_config().market_data
+
+
+def get_snapshot_config() -> SnapshotConfig:
+    """快照缓存参数（exchanges.yaml 顶层 snapshot 段）"""
+    return get_config().snapshot
+
+
+def get_history_config() -> HistoryConfig:
+    """时间序列存储参数（exchanges.yaml 顶层 history 段）"""
+    return get_config().history
+
+
+def get_stress_config() -> StressConfig:
+    """压力测试参数（exchanges.yaml 顶层 stress 段）"""
+    return get_config().stress
+
+
+def get_hedge_config() -> HedgeConfig:
+    """跨交易所对冲偏离判定参数（exchanges.yaml 顶层 hedge 段）"""
+    return get_config().hedge
+
+
+def get_resilience_config() -> ResilienceConfig:
+    """重试 / 熔断 / 限频参数（exchanges.yaml 顶层 resilience 段）"""
+    return get_config().resilience
+
+
+def get_metrics_config() -> MetricsConfig:
+    """/metrics 端点与 trace 参数（exchanges.yaml 顶层 metrics 段）"""
+    return get_config().metrics
+
+
+def get_sharding_config() -> ShardingConfig:
+    """多进程分片参数（exchanges.yaml 顶层 sharding 段）"""
+    return get_config().sharding
+
+
+def get_diff_config() -> DiffConfig:
+    """快照变化推送参数（exchanges.yaml 顶层 diff 段）"""
+    return get_config().diff
+
+
+def get_funding_config() -> FundingConfig:
+    """资金费率历史与 carry 统计参数（exchanges.yaml 顶层 funding 段）"""
+    return get_config().funding
@@ -0,0 +1,38 @@
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict
+from urllib.parse import urlsplit
+import requests
+from utils.resilience import ResilientAdapter
+
+# 每个交易所 host 一个长期存活的 Session，复用 TCP+TLS 连接 (keep-alive)
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+POOL_MAXSIZE = 32  # 需大于 fetch 并发数，否则多余请求会新建连接
+
+
+def get_session(url: str) -> requests.Session:
+    """按 scheme://host 返回共享的连接池 Session（线程安全）"""
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            # 限频、熔断和重试挂在连接池适配器上，所有交易所客户端共用
+            adapter = ResilientAdapter(parts.netloc, pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            # 多个账户共用同一个 Session，禁止 cookie 自动写入 Session，
+            # 各账户的登录凭证通过请求头显式传递
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            _sessions[host] = session
+        return session
+
+
+def close_all_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
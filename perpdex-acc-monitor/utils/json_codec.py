@@ -0,0 +1,22 @@
+import json
+from typing import Any, Union
+
+try:  # orjson 为可选依赖，解析速度约为标准库的数倍；未安装时退回 json
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: Union[bytes, bytearray, str]) -> Any:
+    """解析 JSON（bytes 或 str）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def response_json(response) -> Any:
+    """
+    直接解析 requests.Response 的原始字节，替代 response.json()
+    跳过 requests 的编码探测和 bytes -> str 解码（交易所接口均为 UTF-8）
+    """
+    return loads(response.content)
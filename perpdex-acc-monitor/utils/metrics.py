@@ -0,0 +1,184 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+from utils.config_loader import get_metrics_config
+
+try:  # trace span 为可选功能，未安装 opentelemetry 时退化为空操作
+    from opentelemetry import trace as _otel_trace
+except ImportError:
+    _otel_trace = None
+
+# 延迟直方图的桶（秒），覆盖单个 HTTP 请求到整次快照
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+INF_LABEL = 'le="+Inf"'
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(BUCKETS, value)
+        if index < len(BUCKETS):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    进程内的计数器 / 直方图，按 Prometheus 文本格式导出
+    名称统一加 perpdex_ 前缀；label 只用交易所、账户序号、阶段等低基数字段
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(f"perpdex_{name}_total", {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(f"perpdex_{name}_seconds", {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram()
+            histogram.observe(seconds)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, histogram.counts):
+                        cumulative += count
+                        le = 'le="%g"' % bound
+                        lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, INF_LABEL)} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name: str) -> Dict[LabelKey, Tuple[int, float]]:
+        """{labels: (次数, 总耗时)}，供压测 / 调试直接读取"""
+        with self._lock:
+            series = self._histograms.get(f"perpdex_{name}_seconds", {})
+            return {key: (h.count, h.sum) for key, h in series.items()}
+
+
+registry = MetricsRegistry()
+_tracer = None
+_tracer_checked = False
+
+
+def _get_tracer():
+    """配置只在第一次计时时读取"""
+    global _tracer, _tracer_checked
+    if not _tracer_checked:
+        if _otel_trace is not None and get_metrics_config().tracing:
+            _tracer = _otel_trace.get_tracer("perpdex-acc-monitor")
+        _tracer_checked = True
+    return _tracer
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    registry.inc(name, value, **labels)
+
+
+@contextmanager
+def timer(name: str, **labels) -> Iterator[None]:
+    """
+    记录一段代码的耗时到 perpdex_<name>_seconds 直方图；抛出异常时另计 perpdex_<name>_errors_total
+    开启 tracing 且安装了 opentelemetry 时同时生成一个同名 span
+    """
+    tracer = _get_tracer()
+    span = nullcontext() if tracer is None else \
+        tracer.start_as_current_span(name, attributes={k: str(v) for k, v in labels.items()})
+    started = time.perf_counter()
+    with span:
+        try:
+            yield
+        except BaseException:
+            registry.inc(f"{name}_errors", **labels)
+            raise
+        finally:
+            registry.observe(name, time.perf_counter() - started, **labels)
+
+
+def timed(name: str, **labels):
+    """timer 的装饰器形式"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(host: Optional[str] = None, port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """在后台线程中启动 /metrics（默认只监听本机）；配置关闭时返回 None"""
+    global _server
+    config = get_metrics_config()
+    if not config.enabled:
+        return None
+    if _server is None:
+        _server = ThreadingHTTPServer((host or config.host, port if port is not None else config.port),
+                                      _MetricsHandler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        print(f"metrics 已启动: http://{_server.server_address[0]}:{_server.server_address[1]}/metrics")
+    return _server
@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from utils import metrics
+from utils.config_loader import get_resilience_config
+
+# 可重试的状态码：限频和服务端错误；其余 4xx 直接交给调用方处理（如 GRVT 的 401 重新登录）
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# 本进程可使用的限频比例；分片模式下 N 个 worker 各占 1/N，合计不超过配置的限频
+_limit_share = 1.0
+
+
+def set_limit_share(share: float):
+    """在创建任何 Session 之前调用（之后新建的 ResilientAdapter 才会生效）"""
+    global _limit_share
+    _limit_share = share
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """熔断中，请求未发出"""
+
+
+class TokenBucket:
+    """令牌桶限频：每秒补充 rate 个令牌，最多积攒 burst 个"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """取一个令牌，不够时等到补足为止；返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """
+    连续失败 failures 次后熔断 reset_after 秒，期间直接失败不发请求
+    到期后放行一个探测请求（半开），成功则恢复，失败则继续熔断
+    """
+
+    def __init__(self, failures: int, reset_after: float):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._count = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_after and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._count = 0
+                self._opened_at = None
+                return
+            self._count += 1
+            if self._count >= self.failures or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+
+class ResilientAdapter(HTTPAdapter):
+    """
+    挂在每个 host 的共享 Session 上，所有交易所客户端的请求都经过这里：
+    令牌桶限频 -> 熔断检查 -> 发送 -> 429 / 5xx / 网络错误时带抖动的指数退避重试
+    重试用尽后返回最后一次响应（或抛出最后一次异常），由调用方决定如何标记
+    """
+
+    def __init__(self, host: str, **kwargs):
+        super().__init__(**kwargs)
+        config = get_resilience_config()
+        limit = config.host_limits.get(host, config.default_limit)
+        self.host = host
+        self.retries = config.retries
+        self.backoff_base = config.backoff_base
+        self.backoff_max = config.backoff_max
+        self.bucket = TokenBucket(limit.rate * _limit_share, max(1.0, limit.burst * _limit_share))
+        self.breaker = CircuitBreaker(config.breaker_failures, config.breaker_reset)
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """full jitter：在 [0, min(max, base * 2^attempt)] 内随机；429 带 Retry-After 时以它为准"""
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return min(self.backoff_max, float(response.headers["Retry-After"]))
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def send(self, request, **kwargs):
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                metrics.inc("circuit_open_rejections", host=self.host)
+                raise CircuitOpenError(f"{self.host} 熔断中，{self.breaker.reset_after:.0f}s 内不再请求", request=request)
+            waited = self.bucket.acquire()
+            if waited:
+                metrics.inc("rate_limit_wait_seconds", waited, host=self.host)
+            try:
+                with metrics.timer("http_request", host=self.host):
+                    response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.breaker.record(False)
+                metrics.inc("http_responses", host=self.host, status=type(e).__name__)
+                if attempt == self.retries:
+                    raise
+                metrics.inc("http_retries", host=self.host)
+                time.sleep(self._backoff(attempt))
+                continue
+            except Exception as e:
+                # 不重试的异常（SSL / 解码 / 非法 URL 等）也必须记一次结果，否则半开探测位永远不会释放
+                self.breaker.record(False)
+                metrics.inc("http_responses", host=self.host, status=type(e).__name__)
+                raise
+            metrics.inc("http_responses", host=self.host, status=response.status_code)
+            if response.status_code not in RETRY_STATUS:
+                self.breaker.record(True)
+                return response
+            self.breaker.record(False)
+            if attempt == self.retries:
+                return response
+            metrics.inc("http_retries", host=self.host)
+            delay = self._backoff(attempt, response)
+            response.close()
+            time.sleep(delay)
+